@@ -204,6 +204,40 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # --- CELERY SETTINGS ---
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-stock-reservations': {
+        'task': 'frontend.tasks.release_expired_stock_reservations',
+        'schedule': 60.0,
+    },
+    'flush-stock-deltas': {
+        'task': 'frontend.tasks.flush_stock_deltas',
+        'schedule': 5.0,
+    },
+    'return-stale-stock-holds': {
+        'task': 'frontend.tasks.return_stale_stock_holds',
+        'schedule': 60.0,
+    },
+    'reconcile-stock-levels': {
+        'task': 'frontend.tasks.reconcile_stock_levels',
+        'schedule': 600.0,
+    },
+    'apply-loyalty-accruals': {
+        'task': 'frontend.tasks.apply_loyalty_accruals',
+        'schedule': 30.0,
+    },
+    'rebuild-recommendations': {
+        'task': 'frontend.tasks.rebuild_recommendations',
+        'schedule': 60.0 * 60 * 24,
+    },
+    'drain-webhook-events': {
+        'task': 'payments.tasks.drain_webhook_events',
+        'schedule': 2.0,
+    },
+    'reconcile-processing-payments': {
+        'task': 'payments.tasks.reconcile_processing_payments',
+        'schedule': 300.0,
+    },
+}
 
 # --- LOGIN AND LOGOUT REDIRECTS ---
 LOGIN_REDIRECT_URL = '/home'
@@ -296,6 +330,20 @@ PAYMENT_METHODS = {
         'CLIENT_SECRET': config('PAYPAL_CLIENT_SECRET', default='your-paypal-client-secret'),
     }
 }
+# Gateway status checks in flight during reconciliation, and the age below
+# which processing payments are left to their webhooks (seconds)
+PAYMENT_RECONCILE_CONCURRENCY = 8
+PAYMENT_RECONCILE_MIN_AGE = 120
+# Webhook events whose payment is still unknown are retried until this old (seconds)
+PAYMENT_WEBHOOK_RETRY_WINDOW = 30 * 60
+# Shared gateway clients: request timeout (seconds), retries, connections
+# kept per thread, and the failures that open a gateway's circuit breaker
+# and for how long (seconds)
+PAYMENT_GATEWAY_TIMEOUT = 10
+PAYMENT_GATEWAY_RETRIES = 2
+PAYMENT_GATEWAY_POOL_SIZE = 10
+PAYMENT_GATEWAY_BREAKER_THRESHOLD = 5
+PAYMENT_GATEWAY_BREAKER_RESET = 30
 
 # --- JWT SETTINGS ---
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your_jwt_secret_key')
@@ -370,6 +418,9 @@ ACCOUNT_UNIQUE_EMAIL = True
 PAYPAL_MODE = 'sandbox'  # Use 'live' for production
 PAYPAL_CLIENT_ID = 'your_paypal_client_id_here'
 PAYPAL_CLIENT_SECRET = 'your_paypal_client_secret_here'
+PAYPAL_RETURN_URL = 'http://localhost:3000/payment/execute'
+PAYPAL_CANCEL_URL = 'http://localhost:3000/payment/cancel'
+PAYPAL_WEBHOOK_ID = 'your_paypal_webhook_id_here'
 
 # Two Factor Auth Settings
 TWO_FACTOR_PATCH_ADMIN = True
@@ -492,6 +543,30 @@ CACHES = {
 # Cache time to live is 15 minutes
 CACHE_TTL = 60 * 15
 
+# Paginated endpoints report the planner's row estimate instead of running
+# COUNT(*) once a result set is expected to exceed this many rows
+PAGINATION_ESTIMATE_THRESHOLD = 10000
+
+# --- SEARCH SETTINGS ---
+# PostgreSQL text search configuration used for Product.search_vector
+PRODUCT_SEARCH_CONFIG = 'english'
+
+# --- CART SETTINGS ---
+# Anonymous carts live in Redis hashes and expire after a week of inactivity
+CART_TTL = 60 * 60 * 24 * 7
+
+# --- INVENTORY SETTINGS ---
+# Stock taken for an unpaid order is handed back after this many seconds
+STOCK_RESERVATION_TTL = 15 * 60
+
+# --- LOYALTY SETTINGS ---
+# Points earned per currency unit of a paid order, credited in batches
+LOYALTY_POINTS_PER_UNIT = 1
+
+# --- RECOMMENDATION SETTINGS ---
+# Neighbours stored per product by the nightly recommendation build
+RECOMMENDATIONS_PER_PRODUCT = 10
+
 # --- STATIC/MEDIA FILES SETTINGS ---
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
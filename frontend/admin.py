@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Category, Product, Store, StoreProduct, Cart, CartItem, Order, Review, Wishlist, ProductVariant, UserProfile, ShippingAddress
+from .pagination import EstimatedCountPaginator
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -14,6 +15,8 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name', 'description']
     list_select_related = ['category']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('category')
@@ -47,14 +50,21 @@ class CartAdmin(admin.ModelAdmin):
     list_filter = ['created_at']
     search_fields = ['user__username']
     list_select_related = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return Cart.with_totals(super().get_queryset(request))
 
     def item_count(self, obj):
-        return obj.items.count()
+        return obj.item_count
     item_count.short_description = 'Number of Items'
+    item_count.admin_order_field = 'item_count'
 
     def total_price(self, obj):
-        return sum(item.product_variant.price * item.quantity for item in obj.items.all())
+        return obj.total_price
     total_price.short_description = 'Total Price'
+    total_price.admin_order_field = 'total_price'
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
@@ -70,10 +80,12 @@ class CartItemAdmin(admin.ModelAdmin):
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'total', 'status', 'payment_status', 'payment_method', 'created_at']
-    list_filter = ['status', 'payment_status', 'payment_method', 'created_at']
+    list_filter = ['status', 'payment_status', 'payment_method', 'needs_review', 'created_at']
     search_fields = ['id', 'user__username', 'stripe_payment_intent_id', 'paypal_payment_id']
     readonly_fields = ['id', 'created_at', 'updated_at']
     list_select_related = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user').prefetch_related('items__product_variant')
@@ -115,7 +127,7 @@ class WishlistAdmin(admin.ModelAdmin):
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ['user', 'birth_date']
+    list_display = ['user', 'loyalty_points', 'birth_date']
     search_fields = ['user__username', 'user__email']
     list_select_related = ['user']
 
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+
+PRODUCT_LIST_NAMESPACE = 'product_list'
+PRODUCT_LIST_TIMEOUT = 300  # 5 minutes
+
+CATEGORY_NAMESPACE = 'categories'
+FEATURED_PRODUCTS_NAMESPACE = 'featured_products'
+MODEL_ROWS_TIMEOUT = 3600  # 1 hour
+
+# Query parameters that change the product list response. Anything else is
+# ignored so that cache-busting parameters cannot fill the cache.
+PRODUCT_LIST_PARAMS = (
+    'category', 'category_tree', 'min_price', 'max_price', 'search', 'ordering', 'page', 'page_size',
+    'cursor', 'count',
+)
+
+
+def _version_key(namespace):
+    return f'ns_version:{namespace}'
+
+
+def get_namespace_version(namespace):
+    """
+    Return the current generation of a cache namespace.
+
+    A missing counter is seeded from the clock rather than from 1, so an
+    evicted counter never points back at entries written before the eviction.
+    """
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_namespace_version(namespace):
+    """
+    Invalidate every entry of a namespace by moving it to a new generation.
+    """
+    key = _version_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return get_namespace_version(namespace)
+
+
+def versioned_key(namespace, params):
+    """
+    Build a cache key for ``params`` inside the current namespace generation.
+    """
+    digest = hashlib.md5(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f'{namespace}:v{get_namespace_version(namespace)}:{digest}'
+
+
+def normalize_product_list_params(query_params):
+    """
+    Reduce the product list query string to a canonical form.
+
+    Only the parameters in ``PRODUCT_LIST_PARAMS`` are kept, empty values
+    (other than ``cursor``) are dropped, multi-valued parameters are sorted and the search term is
+    case-folded, since the search lookups are case-insensitive.
+    """
+    normalized = {}
+    for name in PRODUCT_LIST_PARAMS:
+        values = [value.strip() for value in query_params.getlist(name)]
+        # An empty ?cursor still selects keyset pagination, so it is kept.
+        if name != 'cursor':
+            values = [value for value in values if value]
+        if not values:
+            continue
+        if name == 'search':
+            values = [' '.join(value.lower().split()) for value in values]
+        normalized[name] = sorted(values)
+    return normalized
+
+
+def product_list_cache_key(request):
+    params = normalize_product_list_params(request.query_params)
+    # Pagination links are absolute URLs, so the host is part of the key.
+    params['host'] = request.get_host()
+    return versioned_key(PRODUCT_LIST_NAMESPACE, params)
+
+
+def invalidate_product_list():
+    return bump_namespace_version(PRODUCT_LIST_NAMESPACE)
+
+
+def get_cached_model_rows(namespace, queryset, timeout=MODEL_ROWS_TIMEOUT):
+    """
+    Return the instances of ``queryset``, cached as compact value tuples.
+
+    Rows are stored as plain tuples of the concrete field values instead of
+    pickled model instances and rebuilt with ``Model.from_db`` on a hit. An
+    empty result is cached too (as an empty tuple), so an empty namespace does
+    not fall through to the database on every call.
+    """
+    model = queryset.model
+    fields = [field.attname for field in model._meta.concrete_fields]
+    key = f'{namespace}:v{get_namespace_version(namespace)}:rows'
+
+    rows = cache.get(key)
+    if rows is None:
+        rows = tuple(queryset.values_list(*fields))
+        cache.set(key, rows, timeout)
+
+    db = queryset.db
+    return [model.from_db(db, fields, row) for row in rows]
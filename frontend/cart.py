@@ -1,87 +1,160 @@
-from django.shortcuts import render
-from frontend.models import Product
+import uuid
 from decimal import Decimal
 
+from django.conf import settings
+from django.shortcuts import render
+from django_redis import get_redis_connection
+
+from frontend.models import ProductVariant
+from frontend.services import CartService
+
+# Carts that are not touched for this long expire on their own.
+CART_TTL = getattr(settings, 'CART_TTL', 60 * 60 * 24 * 7)
+CART_KEY_PREFIX = 'cart:'
+CART_SESSION_KEY = 'cart_id'
+
+# Adds ARGV[2] to a line and drops the line once it reaches zero, so the hash
+# never holds empty or negative quantities.
+INCREMENT_SCRIPT = """
+local quantity = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if quantity <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return quantity
+"""
+
+# Sets a line's quantity, but only if the line is already in the cart.
+SET_IF_EXISTS_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+if tonumber(ARGV[2]) <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+else
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+# Reads and deletes the cart in one step so a merge can only happen once.
+POP_SCRIPT = """
+local items = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return items
+"""
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
 class Cart:
     """
     A class to represent a shopping cart.
 
+    Each cart is a Redis hash mapping product variant ids to quantities.
+    The session only holds the cart id, so adding items does not rewrite
+    the session, and concurrent updates from several tabs are applied
+    atomically on the hash instead of overwriting each other. Prices are
+    read from the database when totals are needed.
+
     Attributes:
-        session (SessionBase): The session object for storing cart data.
-        cart (dict): The dictionary storing cart items.
+        session (SessionBase): The session object holding the cart id.
+        key (str): The Redis key of the cart hash.
     """
     def __init__(self, request):
         """
-        Initialize the cart with the session from the request.
+        Initialize the cart from the cart id stored in the session.
 
         Args:
             request (HttpRequest): The HTTP request object containing session data.
         """
         self.session = request.session
-        cart = self.session.get('cart')
-        if not cart:
-            cart = self.session['cart'] = {}
-        self.cart = cart
+        cart_id = self.session.get(CART_SESSION_KEY)
+        if not cart_id:
+            cart_id = self.session[CART_SESSION_KEY] = uuid.uuid4().hex
+        self.key = f'{CART_KEY_PREFIX}{cart_id}'
+        self.redis = get_redis_connection('default')
 
-    def add(self, product, quantity=1):
+    def add(self, product_variant, quantity=1):
         """
-        Add a product to the cart.
+        Add a product variant to the cart.
 
         Args:
-            product (Product): The product object to be added to the cart.
-            quantity (int, optional): The quantity of the product to add. Defaults to 1.
+            product_variant (ProductVariant): The variant to be added to the cart.
+            quantity (int, optional): The quantity to add. Defaults to 1.
+
+        Returns:
+            int: The new quantity of the variant in the cart.
         """
-        product_id = str(product.id)
-        if product_id not in self.cart:
-            self.cart[product_id] = {'quantity': quantity, 'price': product.price}  # Store price as Decimal
-        else:
-            self.cart[product_id]['quantity'] += quantity
-        self.session.modified = True
+        script = self.redis.register_script(INCREMENT_SCRIPT)
+        return int(script(keys=[self.key], args=[str(product_variant.id), quantity, CART_TTL]))
 
-    def remove(self, product):
+    def remove(self, product_variant):
         """
-        Remove a product from the cart.
+        Remove a product variant from the cart.
 
         Args:
-            product (Product): The product object to be removed from the cart.
+            product_variant (ProductVariant): The variant to be removed from the cart.
         """
-        product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
-            self.session.modified = True
+        self.redis.hdel(self.key, str(product_variant.id))
 
     def clear(self):
         """
         Clear the cart by removing all items.
         """
-        self.session['cart'] = {}
-        self.session.modified = True
+        self.redis.delete(self.key)
 
-    def update_quantity(self, product, quantity):
+    def update_quantity(self, product_variant, quantity):
         """
-        Update the quantity of a product in the cart.
+        Update the quantity of a product variant in the cart.
 
         Args:
-            product (Product): The product object to be updated.
-            quantity (int): The new quantity of the product.
+            product_variant (ProductVariant): The variant to be updated.
+            quantity (int): The new quantity; zero or less removes the variant.
         """
-        product_id = str(product.id)
-        if product_id in self.cart:
-            self.cart[product_id]['quantity'] = quantity
-            self.session.modified = True
+        script = self.redis.register_script(SET_IF_EXISTS_SCRIPT)
+        script(keys=[self.key], args=[str(product_variant.id), quantity, CART_TTL])
 
-    def has_item(self, product):
+    def has_item(self, product_variant):
         """
-        Check if a product is in the cart.
+        Check if a product variant is in the cart.
 
         Args:
-            product (Product): The product object to be checked.
+            product_variant (ProductVariant): The variant to be checked.
+
+        Returns:
+            bool: True if the variant is in the cart, False otherwise.
+        """
+        return bool(self.redis.hexists(self.key, str(product_variant.id)))
+
+    def get_quantities(self):
+        """
+        Get the cart contents.
 
         Returns:
-            bool: True if the product is in the cart, False otherwise.
+            dict: Quantities keyed by product variant id.
         """
-        product_id = str(product.id)
-        return product_id in self.cart
+        return {
+            _decode(variant_id): int(quantity)
+            for variant_id, quantity in self.redis.hgetall(self.key).items()
+        }
+
+    def get_items(self):
+        """
+        Get the cart lines with their variants, loaded in a single query.
+
+        Returns:
+            list: ``(product_variant, quantity)`` tuples.
+        """
+        quantities = self.get_quantities()
+        variants = ProductVariant.objects.select_related('product').in_bulk(list(quantities))
+        return [
+            (variant, quantities[str(pk)])
+            for pk, variant in variants.items()
+        ]
 
     def get_total_quantity(self):
         """
@@ -90,17 +163,16 @@ class Cart:
         Returns:
             int: The total quantity of items in the cart.
         """
-        return sum(item['quantity'] for item in self.cart.values())
+        return sum(self.get_quantities().values())
 
     def get_total_price(self):
         """
-        Calculate the total price of all items in the cart.
+        Calculate the total price of all items in the cart at current prices.
 
         Returns:
             Decimal: The total price of all items in the cart.
         """
-        total = sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
-        return total
+        return sum((variant.price * quantity for variant, quantity in self.get_items()), Decimal('0'))
 
     def get_total_price_in_currency(self, currency):
         """
@@ -121,6 +193,43 @@ class Cart:
         """
         self.clear()
 
+    def merge_into(self, user):
+        """
+        Move the cart into the user's database cart, e.g. right after login.
+
+        The Redis hash is read and deleted atomically, so a cart is merged at
+        most once even if two logins race. Quantities are added to existing
+        lines. If the database write fails, the items are put back.
+
+        Args:
+            user (User): The user whose cart receives the items.
+
+        Returns:
+            Cart: The user's database cart, or None if there was nothing to merge.
+        """
+        raw = self.redis.register_script(POP_SCRIPT)(keys=[self.key])
+        quantities = {
+            _decode(raw[i]): int(raw[i + 1])
+            for i in range(0, len(raw), 2)
+        }
+        if not quantities:
+            return None
+
+        try:
+            variant_ids = ProductVariant.objects.filter(pk__in=list(quantities)).values_list('pk', flat=True)
+            user_cart = CartService.apply_operations(user, [
+                {'op': 'add', 'product_variant_id': pk, 'quantity': quantities[str(pk)]}
+                for pk in variant_ids
+            ])
+        except Exception:
+            pipe = self.redis.pipeline()
+            for variant_id, quantity in quantities.items():
+                pipe.hincrby(self.key, variant_id, quantity)
+            pipe.expire(self.key, CART_TTL)
+            pipe.execute()
+            raise
+        return user_cart
+
 def cart_view(request):
     """
     View to display the shopping cart.
@@ -132,5 +241,6 @@ def cart_view(request):
         HttpResponse: The rendered cart page.
     """
     cart = Cart(request)
-    total = cart.get_total_price()
-    return render(request, 'store/cart.html', {'cart': cart, 'total': total})
\ No newline at end of file
+    items = cart.get_items()
+    total = sum((variant.price * quantity for variant, quantity in items), Decimal('0'))
+    return render(request, 'store/cart.html', {'cart': cart, 'items': items, 'total': total})
@@ -0,0 +1,78 @@
+"""
+Per-process snapshot of the category tree.
+
+The snapshot is built from the cached category rows and rebuilt whenever
+the ``categories`` cache namespace moves to a new generation, which the
+Category signal handlers do on every save and delete. Lookups against it
+(ancestors, descendants, nested menus) cost no queries.
+"""
+import threading
+from collections import defaultdict
+
+from .cache import get_namespace_version, CATEGORY_NAMESPACE
+
+
+class CategoryTree:
+    def __init__(self, categories):
+        self.by_id = {category.pk: category for category in categories}
+        self.by_slug = {category.slug: category for category in categories}
+        self.children = defaultdict(list)
+        for category in categories:
+            self.children[category.parent_id].append(category)
+        for siblings in self.children.values():
+            siblings.sort(key=lambda category: category.name)
+
+    def get(self, pk):
+        return self.by_id.get(pk)
+
+    def get_by_slug(self, slug):
+        return self.by_slug.get(slug)
+
+    def ancestors(self, category):
+        """Ancestors from the root down to the direct parent."""
+        ancestors = []
+        parent = self.by_id.get(category.parent_id)
+        while parent is not None:
+            ancestors.append(parent)
+            parent = self.by_id.get(parent.parent_id)
+        ancestors.reverse()
+        return ancestors
+
+    def descendants(self, category, include_self=False):
+        found = [category] if include_self else []
+        stack = list(self.children.get(category.pk, ()))
+        while stack:
+            node = stack.pop()
+            found.append(node)
+            stack.extend(self.children.get(node.pk, ()))
+        return found
+
+    def as_nested(self, parent_id=None):
+        return [
+            {
+                'id': str(category.pk),
+                'name': category.name,
+                'slug': category.slug,
+                'children': self.as_nested(category.pk),
+            }
+            for category in self.children.get(parent_id, ())
+        ]
+
+
+_snapshot = (None, None)
+_snapshot_lock = threading.Lock()
+
+
+def get_category_tree():
+    global _snapshot
+    from .models import Category
+
+    version = get_namespace_version(CATEGORY_NAMESPACE)
+    snapshot_version, tree = _snapshot
+    if tree is None or snapshot_version != version:
+        with _snapshot_lock:
+            snapshot_version, tree = _snapshot
+            if tree is None or snapshot_version != version:
+                tree = CategoryTree(Category.get_all_categories())
+                _snapshot = (version, tree)
+    return tree
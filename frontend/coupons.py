@@ -0,0 +1,119 @@
+"""
+Coupon lookup and redemption.
+
+Codes are looked up through the cache, because a code applied to a cart is
+validated on every cart view and bots probe random codes: a hit is stored as
+a tuple of the coupon's field values, a miss as an empty tuple with a longer
+timeout, so repeated guesses never reach PostgreSQL. Saving or deleting a
+coupon moves the namespace to a new generation, which also forgets misses for
+codes that have been created since.
+
+Redemption never trusts the cached ``times_used``: it records the
+per-user ``CouponRedemption`` and then increments the counter with one
+conditional UPDATE (``... WHERE times_used < max_uses``), so concurrent
+checkouts cannot redeem a coupon more often than ``max_uses``.
+"""
+import logging
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .cache import versioned_key
+from .models import Coupon, CouponRedemption
+
+logger = logging.getLogger(__name__)
+
+COUPON_NAMESPACE = 'coupons'
+COUPON_TIMEOUT = 60
+INVALID_COUPON_TIMEOUT = 600  # 10 minutes
+CODE_MAX_LENGTH = Coupon._meta.get_field('code').max_length
+
+
+class CouponError(Exception):
+    pass
+
+
+def normalize_code(code):
+    return (code or '').strip()
+
+
+def _coupon_key(code):
+    return versioned_key(COUPON_NAMESPACE, {'code': code})
+
+
+def get_coupon(code):
+    """
+    Return the coupon with this code, or None, from the cache when possible.
+
+    The returned instance may be up to ``COUPON_TIMEOUT`` seconds old; use
+    ``redeem_coupon`` for anything that must be exact.
+    """
+    code = normalize_code(code)
+    if not code or len(code) > CODE_MAX_LENGTH:
+        return None
+    fields = [field.attname for field in Coupon._meta.concrete_fields]
+    try:
+        key = _coupon_key(code)
+        row = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Coupon cache unavailable, reading the database: {str(e)}")
+        key = row = None
+    if row is None:
+        row = Coupon.objects.filter(code=code).values_list(*fields).first() or ()
+        if key is not None:
+            cache.set(key, row, COUPON_TIMEOUT if row else INVALID_COUPON_TIMEOUT)
+    if not row:
+        return None
+    return Coupon.from_db(Coupon.objects.db, fields, row)
+
+
+def forget_coupon(code):
+    try:
+        cache.delete(_coupon_key(normalize_code(code)))
+    except Exception as e:
+        logger.warning(f"Could not drop cached coupon: {str(e)}")
+
+
+def get_valid_coupon(code):
+    """
+    Return the coupon if it currently looks redeemable, otherwise None.
+    """
+    coupon = get_coupon(code)
+    return coupon if coupon is not None and coupon.is_valid() else None
+
+
+def get_discount(coupon, amount):
+    """
+    Return the amount taken off ``amount`` by ``coupon``, rounded to cents.
+    """
+    return (amount * coupon.discount_percent / Decimal(100)).quantize(Decimal('0.01'))
+
+
+@transaction.atomic
+def redeem_coupon(code, user, order=None):
+    """
+    Redeem ``code`` for ``user`` and return the coupon.
+
+    The redemption record goes in first, so a second redemption by the same
+    user fails on the unique constraint before touching the counter. The
+    counter UPDATE comes last because it locks the coupon row until the
+    enclosing transaction commits. Raises ``CouponError`` if the code is
+    unknown, already used by this user or no longer redeemable.
+    """
+    coupon = get_coupon(code)
+    if coupon is None:
+        raise CouponError("Invalid coupon code")
+
+    try:
+        with transaction.atomic():
+            CouponRedemption.objects.create(coupon=coupon, user=user, order=order)
+    except IntegrityError:
+        raise CouponError("You have already used this coupon")
+
+    if not Coupon.redeemable().filter(pk=coupon.pk).update(times_used=F('times_used') + 1):
+        # Expired or used up: stop showing the stale cached copy as valid.
+        forget_coupon(coupon.code)
+        raise CouponError("This coupon is no longer available")
+    return coupon
@@ -1,4 +1,6 @@
 import django_filters
+from django.db.models import Subquery
+from .category_tree import get_category_tree
 from .models import Product, Category
 
 class ProductFilter(django_filters.FilterSet):
@@ -9,7 +11,16 @@ class ProductFilter(django_filters.FilterSet):
         field_name='category__name',
         to_field_name='name'
     )
+    category_tree = django_filters.CharFilter(method='filter_category_tree')
 
     class Meta:
         model = Product
-        fields = ['category', 'min_price', 'max_price']
\ No newline at end of file
+        fields = ['category', 'category_tree', 'min_price', 'max_price']
+
+    def filter_category_tree(self, queryset, name, value):
+        """Products in the category with slug ``value`` or any of its subcategories."""
+        category = get_category_tree().get_by_slug(value)
+        if category is not None:
+            return queryset.filter(category__path__startswith=category.path)
+        path = Category.objects.filter(slug=value).values('path')[:1]
+        return queryset.filter(category__path__startswith=Subquery(path))
@@ -0,0 +1,261 @@
+"""
+Stock reservation without long-held row locks.
+
+Stock is taken with one conditional UPDATE per order
+(``SET quantity = quantity - n WHERE quantity >= n`` for every inventory row
+involved), so it can never go negative and no row is locked for longer than
+that statement's transaction. Each decrement is recorded as a
+``StockReservation`` that expires after ``STOCK_RESERVATION_TTL`` seconds
+unless the order is paid; ``release_expired_reservations`` (run by Celery
+beat) hands expired stock back.
+
+Inventory rows of hot variants (see ``frontend.stock``) are not updated in
+PostgreSQL at all: their units are taken from the Redis counters and the
+rows catch up through the write-behind flush. Those units are recorded in a
+hold that is settled when the reservations commit, and given back by
+``stock.return_stale_holds`` if the transaction rolls back instead.
+"""
+import logging
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from . import stock
+from .models import Inventory, Order, StockReservation
+
+logger = logging.getLogger(__name__)
+
+STOCK_RESERVATION_TTL = getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60)
+# Times an allocation is recomputed when a concurrent order took the stock
+# it was based on.
+MAX_ALLOCATION_ATTEMPTS = 3
+RELEASE_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    def __init__(self, variant_id):
+        self.variant_id = variant_id
+        super().__init__(f"Insufficient stock for product variant {variant_id}")
+
+
+class _AllocationConflict(Exception):
+    def __init__(self, variant_id=None):
+        self.variant_id = variant_id
+
+
+def _hot_variants(variant_ids):
+    try:
+        return stock.hot_variants(variant_ids)
+    except Exception as e:
+        logger.warning(f"Hot SKU lookup failed, using the database only: {str(e)}")
+        return set()
+
+
+def _allocate(requested, rows):
+    """
+    Split each requested quantity over the variant's inventory rows,
+    fullest row first. Returns ``{inventory_pk: quantity}``.
+    """
+    by_variant = {}
+    for pk, variant_id, quantity in rows:
+        by_variant.setdefault(variant_id, []).append((quantity, pk))
+
+    allocation = {}
+    for variant_id, variant_rows in by_variant.items():
+        remaining = requested[variant_id]
+        if sum(quantity for quantity, _ in variant_rows) < remaining:
+            raise InsufficientStock(variant_id)
+        for quantity, pk in sorted(variant_rows, reverse=True):
+            take = min(quantity, remaining)
+            if take:
+                allocation[pk] = take
+                remaining -= take
+    return allocation
+
+
+def _take_rows(allocation):
+    """
+    Decrement every allocated row in a single conditional UPDATE.
+
+    Returns True only if every row still had enough stock.
+    """
+    if not allocation:
+        return True
+    condition = reduce(or_, (Q(pk=pk, quantity__gte=quantity) for pk, quantity in allocation.items()))
+    updated = Inventory.objects.filter(condition).update(
+        quantity=F('quantity') - Case(
+            *[When(pk=pk, then=Value(quantity)) for pk, quantity in allocation.items()],
+            default=Value(0),
+        )
+    )
+    return updated == len(allocation)
+
+
+def _short_variant(allocation, variant_of):
+    """
+    Return the variant of an allocated row that no longer has the stock it
+    was allocated, re-reading the rows after the failed UPDATE rolled back.
+    """
+    levels = dict(Inventory.objects.filter(pk__in=list(allocation)).values_list('pk', 'quantity'))
+    short = [pk for pk, quantity in allocation.items() if levels.get(pk, 0) < quantity]
+    return variant_of[short[0] if short else next(iter(allocation))]
+
+
+def reserve_stock(requested, order=None, ttl=STOCK_RESERVATION_TTL):
+    """
+    Take stock for ``{product_variant_id: quantity}`` and record reservations.
+
+    Variants without inventory rows are not stock tracked and are skipped.
+    Raises ``InsufficientStock`` if any variant cannot be served; in that
+    case nothing is taken. Units of hot variants are taken in Redis right
+    away and kept only if the enclosing transaction commits.
+    """
+    hot = _hot_variants(requested)
+    short_variant = next(iter(requested))
+    for attempt in range(MAX_ALLOCATION_ATTEMPTS):
+        rows = list(Inventory.objects.filter(product_variant_id__in=list(requested)).values_list(
+            'pk', 'product_variant_id', 'quantity'
+        ))
+        variant_of = {pk: variant_id for pk, variant_id, _ in rows}
+        hot_rows = {pk for pk, variant_id, _ in rows if variant_id in hot}
+        if hot_rows:
+            # Redis holds the authoritative level of hot rows.
+            levels = stock.get_levels('inventory', hot_rows)
+            rows = [(pk, variant_id, levels.get(pk, quantity)) for pk, variant_id, quantity in rows]
+        allocation = _allocate(requested, rows)
+        hot_allocation = {pk: quantity for pk, quantity in allocation.items() if pk in hot_rows}
+        db_allocation = {pk: quantity for pk, quantity in allocation.items() if pk not in hot_allocation}
+
+        expires_at = timezone.now() + timedelta(seconds=ttl)
+        reservations = [
+            StockReservation(inventory_id=pk, order=order, quantity=quantity, expires_at=expires_at)
+            for pk, quantity in allocation.items()
+        ]
+        hold = stock.open_hold([reservation.pk for reservation in reservations]) if hot_allocation else None
+        try:
+            for pk, quantity in hot_allocation.items():
+                if not stock.take('inventory', pk, quantity, hold=hold):
+                    raise _AllocationConflict(variant_of[pk])
+            with transaction.atomic():
+                if not _take_rows(db_allocation):
+                    raise _AllocationConflict()
+                reservations = StockReservation.objects.bulk_create(reservations)
+            transaction.on_commit(lambda: stock.adjust('inventory', {pk: -quantity for pk, quantity in db_allocation.items()}))
+            if hold is not None:
+                transaction.on_commit(lambda: stock.settle_hold(hold))
+            return reservations
+        except _AllocationConflict as conflict:
+            _return_hold(hold)
+            short_variant = conflict.variant_id or _short_variant(db_allocation, variant_of)
+            logger.info(f"Stock allocation conflict, retrying (attempt {attempt + 1})")
+        except Exception:
+            _return_hold(hold)
+            raise
+    raise InsufficientStock(short_variant)
+
+
+def _return_hold(hold):
+    if hold is not None:
+        stock.return_hold(hold)
+
+
+def _give_back(quantities):
+    for pk, quantity in quantities.items():
+        stock.give_back('inventory', pk, quantity)
+
+
+@transaction.atomic
+def commit_reservations(order):
+    """
+    Keep the stock held for a paid order. Returns the number of reservations committed.
+
+    Reservations the expiry sweep already released are taken again with
+    ``reserve_stock`` and replace the released ones. If that stock has been
+    sold since, the order is flagged with ``needs_review`` rather than
+    oversold; a later call tries again.
+    """
+    now = timezone.now()
+    committed = StockReservation.objects.filter(order=order, status=StockReservation.STATUS_HELD).update(
+        status=StockReservation.STATUS_COMMITTED, updated_at=now
+    )
+    released = list(
+        StockReservation.objects.filter(order=order, status=StockReservation.STATUS_RELEASED)
+        .select_for_update(of=('self',))
+        .select_related('inventory')
+    )
+    if not released:
+        return committed
+
+    requested = {}
+    for reservation in released:
+        variant_id = reservation.inventory.product_variant_id
+        requested[variant_id] = requested.get(variant_id, 0) + reservation.quantity
+    try:
+        with transaction.atomic():
+            retaken = reserve_stock(requested, order=order)
+    except InsufficientStock as e:
+        logger.error(f"Stock of paid order {order.pk} was released and variant {e.variant_id} is short, flagging for review")
+        Order.objects.filter(pk=order.pk).update(needs_review=True, updated_at=now)
+        return committed
+
+    StockReservation.objects.filter(pk__in=[reservation.pk for reservation in retaken]).update(
+        status=StockReservation.STATUS_COMMITTED, updated_at=now
+    )
+    StockReservation.objects.filter(pk__in=[reservation.pk for reservation in released]).delete()
+    return committed + len(retaken)
+
+
+@transaction.atomic
+def release_reservations(queryset):
+    """
+    Return the stock of the held reservations in ``queryset`` to inventory.
+
+    Reservations locked by another transaction are skipped and picked up on
+    a later run. Returns the number of reservations released.
+    """
+    reservations = list(
+        queryset.filter(status=StockReservation.STATUS_HELD)
+        .select_for_update(skip_locked=True, of=('self',))
+        .select_related('inventory')
+        .order_by('pk')[:RELEASE_BATCH_SIZE]
+    )
+    if not reservations:
+        return 0
+
+    hot = _hot_variants({reservation.inventory.product_variant_id for reservation in reservations})
+    hot_rows = {}
+    db_rows = {}
+    for reservation in reservations:
+        rows = hot_rows if reservation.inventory.product_variant_id in hot else db_rows
+        rows[reservation.inventory_id] = rows.get(reservation.inventory_id, 0) + reservation.quantity
+
+    if db_rows:
+        Inventory.objects.filter(pk__in=list(db_rows)).update(
+            quantity=F('quantity') + Case(
+                *[When(pk=pk, then=Value(quantity)) for pk, quantity in db_rows.items()],
+                default=Value(0),
+            )
+        )
+    StockReservation.objects.filter(pk__in=[reservation.pk for reservation in reservations]).update(
+        status=StockReservation.STATUS_RELEASED, updated_at=timezone.now()
+    )
+    transaction.on_commit(lambda: stock.adjust('inventory', db_rows))
+    transaction.on_commit(lambda: _give_back(hot_rows))
+    return len(reservations)
+
+
+def release_expired_reservations():
+    """
+    Release every held reservation past its expiry, one batch per transaction.
+    """
+    released = 0
+    while True:
+        batch = release_reservations(StockReservation.objects.filter(expires_at__lte=timezone.now()))
+        released += batch
+        if batch < RELEASE_BATCH_SIZE:
+            return released
@@ -0,0 +1,133 @@
+"""
+Loyalty points as an append-only ledger.
+
+Every change to a balance is a ``LoyaltyPointsEntry``; entries are never
+edited or deleted, only stamped with ``applied_at`` once they are counted.
+``UserProfile.loyalty_points`` is the materialized sum of the applied
+entries and is only ever moved by the same deltas:
+
+* Accruals are queued with a single INSERT when an order is paid and
+  applied in batches by ``apply_pending_accruals`` (Celery beat), one
+  UPDATE for all users in the batch. Points become spendable once applied.
+* Redemptions are applied immediately with a conditional UPDATE
+  (``... WHERE loyalty_points >= n``), so concurrent redemptions can never
+  spend more than the balance, and the entry is written in the same
+  transaction.
+
+``rebuild_balances`` recomputes balances from the ledger, for repairs.
+"""
+from decimal import Decimal, ROUND_DOWN
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import LoyaltyPointsEntry
+from .user_profile import UserProfile
+
+LOYALTY_POINTS_PER_UNIT = getattr(settings, 'LOYALTY_POINTS_PER_UNIT', 1)
+ACCRUAL_BATCH_SIZE = 1000
+
+
+def points_for_order(order):
+    total = order.total or Decimal('0')
+    return int((total * LOYALTY_POINTS_PER_UNIT).to_integral_value(rounding=ROUND_DOWN))
+
+
+def queue_order_points(order):
+    """
+    Queue the points earned by a paid order. Safe to call more than once per order.
+    """
+    points = points_for_order(order)
+    if points <= 0:
+        return
+    LoyaltyPointsEntry.objects.bulk_create([
+        LoyaltyPointsEntry(user_id=order.user_id, order=order, kind=LoyaltyPointsEntry.KIND_ACCRUAL, points=points)
+    ], ignore_conflicts=True)
+
+
+def award_points(user, points, order=None):
+    """
+    Queue ``points`` for ``user``; they are added to the balance by the next batch.
+    """
+    if points <= 0:
+        raise ValueError("Points to award must be positive")
+    return LoyaltyPointsEntry.objects.create(
+        user=user, order=order, kind=LoyaltyPointsEntry.KIND_ACCRUAL, points=points
+    )
+
+
+@transaction.atomic
+def redeem_points(user, points, order=None):
+    """
+    Spend ``points`` of the user's applied balance.
+
+    Returns False, and changes nothing, if the balance is too low.
+    """
+    if points <= 0:
+        raise ValueError("Points to redeem must be positive")
+    updated = UserProfile.objects.filter(user=user, loyalty_points__gte=points).update(
+        loyalty_points=F('loyalty_points') - points
+    )
+    if not updated:
+        return False
+    LoyaltyPointsEntry.objects.create(
+        user=user, order=order, kind=LoyaltyPointsEntry.KIND_REDEMPTION, points=-points, applied_at=timezone.now()
+    )
+    return True
+
+
+@transaction.atomic
+def apply_pending_accruals(batch_size=ACCRUAL_BATCH_SIZE):
+    """
+    Add one batch of pending entries to the balances. Returns the number of entries applied.
+
+    Entries locked by a concurrent run are skipped. Each user's balance moves
+    by the sum of their entries in a single UPDATE for the whole batch.
+    """
+    entries = list(
+        LoyaltyPointsEntry.objects.filter(applied_at__isnull=True)
+        .select_for_update(skip_locked=True)
+        .order_by('created_at')
+        .values_list('pk', 'user_id', 'points')[:batch_size]
+    )
+    if not entries:
+        return 0
+
+    totals = {}
+    for _, user_id, points in entries:
+        totals[user_id] = totals.get(user_id, 0) + points
+
+    UserProfile.objects.bulk_create([UserProfile(user_id=user_id) for user_id in totals], ignore_conflicts=True)
+    UserProfile.objects.filter(user_id__in=list(totals)).update(
+        loyalty_points=F('loyalty_points') + Case(
+            *[When(user_id=user_id, then=Value(points)) for user_id, points in totals.items()],
+            default=Value(0),
+        )
+    )
+    LoyaltyPointsEntry.objects.filter(pk__in=[pk for pk, _, _ in entries]).update(
+        applied_at=timezone.now(), updated_at=timezone.now()
+    )
+    return len(entries)
+
+
+def apply_all_pending_accruals():
+    applied = 0
+    while True:
+        batch = apply_pending_accruals()
+        applied += batch
+        if batch < ACCRUAL_BATCH_SIZE:
+            return applied
+
+
+def rebuild_balances(user_ids=None):
+    """
+    Set balances to the sum of their applied ledger entries. Returns the number of profiles updated.
+    """
+    applied_sum = LoyaltyPointsEntry.objects.filter(
+        user_id=OuterRef('user_id'), applied_at__isnull=False
+    ).values('user_id').annotate(total=Sum('points')).values('total')
+    profiles = UserProfile.objects.all() if user_ids is None else UserProfile.objects.filter(user_id__in=user_ids)
+    return profiles.update(loyalty_points=Coalesce(Subquery(applied_sum, output_field=IntegerField()), Value(0)))
@@ -0,0 +1,81 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from frontend.coupons import CouponError, redeem_coupon
+from frontend.models import Coupon, CouponRedemption
+
+
+class Command(BaseCommand):
+    help = (
+        'Redeem one throwaway coupon from many threads at once and report the throughput. '
+        'Writes to the configured database; the coupon and users it creates are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent redeeming threads.')
+        parser.add_argument('--users', type=int, default=2000, help='Users attempting a redemption.')
+        parser.add_argument('--max-uses', type=int, default=1000, help='Maximum uses of the coupon.')
+
+    def handle(self, *args, **options):
+        threads, user_count, max_uses = options['threads'], options['users'], options['max_uses']
+        run = uuid.uuid4().hex[:8]
+        now = timezone.now()
+        coupon = Coupon.objects.create(
+            code=f'BENCH-{run}', discount_percent=10, max_uses=max_uses,
+            valid_from=now - timedelta(minutes=1), valid_to=now + timedelta(hours=1),
+        )
+        password = make_password(None)
+        users = get_user_model().objects.bulk_create([
+            get_user_model()(username=f'bench-{run}-{i}', email=f'bench-{run}-{i}@example.com', password=password)
+            for i in range(user_count)
+        ])
+
+        def worker(batch):
+            outcomes = []
+            try:
+                for user in batch:
+                    started = time.perf_counter()
+                    try:
+                        redeem_coupon(coupon.code, user)
+                        redeemed = True
+                    except CouponError:
+                        redeemed = False
+                    outcomes.append((redeemed, time.perf_counter() - started))
+            finally:
+                connections.close_all()
+            return outcomes
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                results = executor.map(worker, [users[i::threads] for i in range(threads)])
+                outcomes = [outcome for batch in results for outcome in batch]
+            elapsed = time.perf_counter() - started
+
+            coupon.refresh_from_db(fields=['times_used'])
+            redeemed = sum(1 for ok, _ in outcomes if ok)
+            records = CouponRedemption.objects.filter(coupon=coupon).count()
+            latencies = sorted(latency for _, latency in outcomes)
+            self.stdout.write(
+                f"{len(outcomes)} attempts from {threads} threads in {elapsed:.2f}s "
+                f"({len(outcomes) / elapsed:.0f} attempts/s, {redeemed / elapsed:.0f} redemptions/s)\n"
+                f"redeemed {redeemed}, rejected {len(outcomes) - redeemed}, times_used {coupon.times_used}, "
+                f"records {records}\n"
+                f"latency p50 {statistics.median(latencies) * 1000:.1f}ms, "
+                f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms"
+            )
+            if not redeemed == coupon.times_used == records <= max_uses:
+                raise CommandError('Coupon was over-redeemed or the counter drifted from the redemption records.')
+        finally:
+            coupon.delete()
+            get_user_model().objects.filter(pk__in=[user.pk for user in users]).delete()
+        self.stdout.write(self.style.SUCCESS('Redemption counts are consistent.'))
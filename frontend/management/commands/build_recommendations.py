@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from frontend.recommendations import build_recommendations, RECOMMENDATIONS_PER_PRODUCT, SIMILARITY_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Recompute the item-to-item recommendations of every active product and warm their cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=RECOMMENDATIONS_PER_PRODUCT,
+            help='Recommendations stored per product.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=SIMILARITY_BATCH_SIZE,
+            help='Products whose similarities are computed and written together.',
+        )
+
+    def handle(self, *args, **options):
+        built = build_recommendations(k=options['top'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Built recommendations for {built} products.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from frontend.stock import mark_hot_skus
+
+
+class Command(BaseCommand):
+    help = 'Keep the stock of the given product variants in Redis and write it back to PostgreSQL in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('variant_ids', nargs='+', help='Product variant ids.')
+        parser.add_argument(
+            '--remove', action='store_true',
+            help='Stop treating the variants as hot and flush their pending stock changes.',
+        )
+
+    def handle(self, *args, **options):
+        mark_hot_skus(options['variant_ids'], hot=not options['remove'])
+        action = 'Removed' if options['remove'] else 'Marked'
+        self.stdout.write(self.style.SUCCESS(f"{action} {len(options['variant_ids'])} hot SKUs."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from frontend.cache import invalidate_product_list, bump_namespace_version, FEATURED_PRODUCTS_NAMESPACE
+from frontend.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.rating_sum, rating_count and average_rating from the reviews table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of products updated per statement.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        updated = 0
+        for start in range(0, len(product_ids), batch_size):
+            batch = product_ids[start:start + batch_size]
+            updated += Product.rebuild_rating_stats(Product.objects.filter(pk__in=batch))
+
+        invalidate_product_list()
+        bump_namespace_version(FEATURED_PRODUCTS_NAMESPACE)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} products.'))
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('frontend', 'Product')
+    Review = apps.get_model('frontend', 'Review')
+    reviews = Review.objects.filter(product=models.OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        rating_sum=Coalesce(models.Subquery(reviews.annotate(total=models.Sum('rating')).values('total')), 0),
+        rating_count=Coalesce(models.Subquery(reviews.annotate(total=models.Count('id')).values('total')), 0),
+        average_rating=Coalesce(
+            models.Subquery(reviews.annotate(
+                total=Cast(models.Avg('rating'), models.DecimalField(max_digits=3, decimal_places=2))
+            ).values('total')),
+            models.Value(0),
+            output_field=models.DecimalField(max_digits=3, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Rating Sum'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Rating Count'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='average_rating',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3, verbose_name='Average Rating'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-average_rating'], name='frontend_pr_average_70523b_idx'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def backfill_search_vector(apps, schema_editor):
+    Product = apps.get_model('frontend', 'Product')
+    config = getattr(settings, 'PRODUCT_SEARCH_CONFIG', 'english')
+    Product.objects.update(
+        search_vector=SearchVector('name', weight='A', config=config) +
+        SearchVector('description', weight='B', config=config)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0002_product_rating_aggregates'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='frontend_pr_search__76fbf8_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='frontend_product_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+
+def backfill_category_paths(apps, schema_editor):
+    Category = apps.get_model('frontend', 'Category')
+    children = {}
+    for category in Category.objects.only('id', 'parent_id'):
+        children.setdefault(category.parent_id, []).append(category)
+
+    updated = []
+    level = [(category, '') for category in children.get(None, [])]
+    while level:
+        next_level = []
+        for category, parent_path in level:
+            category.path = f'{parent_path}{category.id.hex}/'
+            category.depth = category.path.count('/') - 1
+            updated.append(category)
+            next_level.extend((child, category.path) for child in children.get(category.id, []))
+        level = next_level
+    Category.objects.bulk_update(updated, ['path', 'depth'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0003_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Path'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Depth'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='frontend_category_path_like', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(backfill_category_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    CartItem = apps.get_model('frontend', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'product_variant_id')
+        .annotate(lines=Count('id'), total=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for duplicate in duplicates:
+        items = CartItem.objects.filter(
+            cart_id=duplicate['cart_id'], product_variant_id=duplicate['product_variant_id']
+        ).order_by('created_at')
+        keep = items.first()
+        items.exclude(pk=keep.pk).delete()
+        CartItem.objects.filter(pk=keep.pk).update(quantity=duplicate['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0004_category_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='cartitem',
+            name='frontend_ca_cart_id_8bebfa_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=['cart', 'product_variant'], name='frontend_cartitem_cart_variant_uniq'),
+        ),
+    ]
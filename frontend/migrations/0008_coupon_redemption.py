@@ -0,0 +1,39 @@
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('frontend', '0007_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='coupon_code',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='Coupon Code'),
+        ),
+        migrations.CreateModel(
+            name='CouponRedemption',
+            fields=[
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Is Active')),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='frontend.coupon', verbose_name='Coupon')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='coupon_redemptions', to='frontend.order', verbose_name='Order')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coupon_redemptions', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Coupon Redemption',
+                'verbose_name_plural': 'Coupon Redemptions',
+                'indexes': [models.Index(fields=['user'], name='frontend_co_user_id_c0c447_idx')],
+                'constraints': [models.UniqueConstraint(fields=('coupon', 'user'), name='frontend_couponredemption_coupon_user_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_ledgers(apps, schema_editor):
+    # Existing balances become an applied opening entry, so every balance
+    # equals the sum of its applied ledger entries.
+    UserProfile = apps.get_model('frontend', 'UserProfile')
+    LoyaltyPointsEntry = apps.get_model('frontend', 'LoyaltyPointsEntry')
+    now = django.utils.timezone.now()
+    LoyaltyPointsEntry.objects.bulk_create([
+        LoyaltyPointsEntry(user_id=user_id, kind='adjustment', points=points, applied_at=now)
+        for user_id, points in UserProfile.objects.filter(loyalty_points__gt=0).values_list('user_id', 'loyalty_points').iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('frontend', '0008_coupon_redemption'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='loyalty_points',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Loyalty Points'),
+        ),
+        migrations.CreateModel(
+            name='LoyaltyPointsEntry',
+            fields=[
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Is Active')),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('accrual', 'Accrual'), ('redemption', 'Redemption'), ('adjustment', 'Adjustment')], max_length=20, verbose_name='Kind')),
+                ('points', models.IntegerField(verbose_name='Points')),
+                ('applied_at', models.DateTimeField(blank=True, null=True, verbose_name='Applied At')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loyalty_entries', to='frontend.order', verbose_name='Order')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loyalty_entries', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Loyalty Points Entry',
+                'verbose_name_plural': 'Loyalty Points Entries',
+                'indexes': [
+                    models.Index(fields=['user', 'created_at'], name='frontend_lo_user_id_c5ee6c_idx'),
+                    models.Index(condition=models.Q(('applied_at__isnull', True)), fields=['created_at'], name='frontend_loyalty_pending_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(condition=models.Q(('kind', 'accrual')), fields=('order',), name='frontend_loyalty_order_accrual_uniq'),
+                ],
+            },
+        ),
+        migrations.RunPython(open_ledgers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0009_loyaltypointsentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='needs_review',
+            field=models.BooleanField(default=False, verbose_name='Needs Review'),
+        ),
+    ]
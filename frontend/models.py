@@ -1,4 +1,5 @@
 import uuid
+from decimal import Decimal
 from enum import Enum
 from django.db import models
 from django.conf import settings
@@ -7,13 +8,14 @@ from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.urls import reverse
 from django.utils.text import slugify
-from django.core.cache import cache
 from django.contrib.auth import get_user_model
 import stripe
 import paypalrestsdk
-from .utils import award_loyalty_points, use_loyalty_points
 from .user_profile import UserProfile
+from .cache import get_cached_model_rows, CATEGORY_NAMESPACE, FEATURED_PRODUCTS_NAMESPACE
 from django.contrib.postgres.indexes import GinIndex, BTreeIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db.models.functions import Cast, Coalesce, Concat, Substr
 
 
 User = settings.AUTH_USER_MODEL
@@ -44,6 +46,12 @@ class Category(TimeStampedModel):
     description = models.TextField(blank=True, default='')
     image = models.ImageField(upload_to='categories/', blank=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True)
+    # Materialized path: the hex ids from the root down to this category,
+    # each followed by '/'. Descendants are the rows whose path starts with it.
+    path = models.CharField(max_length=255, default='', editable=False, verbose_name=_("Path"))
+    # Each level takes 33 characters of the path, so 7 levels fit.
+    MAX_DEPTH = 255 // 33 - 1
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name=_("Depth"))
 
     class Meta:
         verbose_name = _("Category")
@@ -51,12 +59,59 @@ class Category(TimeStampedModel):
         ordering = ['name']
         indexes = [
             models.Index(fields=['name', 'slug']),
+            models.Index(fields=['path'], name='frontend_category_path_like', opclasses=['varchar_pattern_ops']),
         ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        parent_path = ''
+        if self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+            if self.id.hex in parent_path.split('/'):
+                raise ValueError("A category cannot be moved under its own descendant.")
+        path = f'{parent_path}{self.id.hex}/'
+        depth = path.count('/') - 1
+        deepest = depth
+        if old_path and old_path != path:
+            # The subtree moves along, so its deepest row must still fit.
+            below = Category.objects.filter(path__startswith=old_path).aggregate(deepest=models.Max('depth'))['deepest']
+            if below is not None:
+                deepest += below - (old_path.count('/') - 1)
+        if deepest > self.MAX_DEPTH:
+            raise ValueError(f"Categories cannot be nested more than {self.MAX_DEPTH + 1} levels deep.")
+        self.path = path
+        self.depth = depth
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'path', 'depth'}
+        super().save(*args, **kwargs)
+
+        if old_path and old_path != self.path:
+            # Re-root the whole subtree in a single UPDATE.
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(models.Value(self.path), Substr('path', len(old_path) + 1)),
+                depth=models.F('depth') + (self.depth - old_path.count('/') + 1),
+            )
+
+    def get_ancestors(self):
+        """Ancestors from the root down, fetched in a single query."""
+        ancestor_ids = [uuid.UUID(part) for part in self.path.split('/')[:-2]]
+        ancestors = Category.objects.in_bulk(ancestor_ids)
+        return [ancestors[pk] for pk in ancestor_ids if pk in ancestors]
+
+    def get_descendants(self, include_self=False):
+        queryset = Category.objects.filter(path__startswith=self.path)
+        return queryset if include_self else queryset.exclude(pk=self.pk)
+
     def to_dict(self):
+        from .category_tree import get_category_tree
+
+        tree = get_category_tree()
+        parent = tree.get(self.parent_id) if self.parent_id else None
+        if parent is None and self.parent_id:
+            parent = self.parent
         return {
             **super().to_dict(),
             'id': str(self.id),
@@ -64,17 +119,13 @@ class Category(TimeStampedModel):
             'slug': self.slug,
             'description': self.description,
             'image': self.image.url if self.image else None,
-            'parent': self.parent.to_dict() if self.parent else None,
+            'depth': self.depth,
+            'parent': parent.to_dict() if parent else None,
         }
 
     @classmethod
     def get_all_categories(cls):
-        cache_key = 'all_categories'
-        categories = cache.get(cache_key)
-        if not categories:
-            categories = list(cls.objects.filter(is_active=True))
-            cache.set(cache_key, categories, timeout=3600)  # Cache for 1 hour
-        return categories
+        return get_cached_model_rows(CATEGORY_NAMESPACE, cls.objects.filter(is_active=True))
 
 class Product(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -87,9 +138,23 @@ class Product(TimeStampedModel):
     stock = models.IntegerField(default=0)
     is_featured = models.BooleanField(default=False)
     image = models.ImageField(upload_to='products/')
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name=_("Rating Sum"))
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_("Rating Count"))
+    average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False, verbose_name=_("Average Rating"))
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Maintained with targeted UPDATEs (apply_rating_delta, refresh_search_vector);
+    # a regular save must not write them back.
+    DERIVED_FIELDS = ('rating_sum', 'rating_count', 'average_rating', 'search_vector')
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
         super().save(*args, **kwargs)  
 
     class Meta:
@@ -104,6 +169,9 @@ class Product(TimeStampedModel):
             models.Index(fields=['category']),
             BTreeIndex(fields=['slug']),
             models.Index(fields=['is_active', 'in_stock']),
+            models.Index(fields=['-average_rating']),
+            GinIndex(fields=['search_vector']),
+            GinIndex(fields=['name'], name='frontend_product_name_trgm', opclasses=['gin_trgm_ops']),
         ]
  
     def __str__(self):
@@ -124,16 +192,72 @@ class Product(TimeStampedModel):
             'image': self.image.url if self.image else None,
             'category': self.category.to_dict(),
             'stock': self.stock,
+            'average_rating': str(self.average_rating),
+            'rating_count': self.rating_count,
         }
 
+    @classmethod
+    def apply_rating_delta(cls, product_id, rating_delta, count_delta):
+        """
+        Adjust the denormalized rating columns of one product in a single UPDATE.
+
+        The expressions are evaluated by the database against the current row,
+        so concurrent reviews cannot overwrite each other's contribution.
+        """
+        new_sum = models.F('rating_sum') + rating_delta
+        new_count = models.F('rating_count') + count_delta
+        cls.objects.filter(pk=product_id).update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            average_rating=models.Case(
+                models.When(
+                    rating_count__gt=-count_delta,
+                    then=Cast(new_sum, models.DecimalField(max_digits=12, decimal_places=2)) / new_count,
+                ),
+                default=models.Value(0),
+                output_field=models.DecimalField(max_digits=3, decimal_places=2),
+            ),
+        )
+
+    @classmethod
+    def build_search_vector(cls):
+        config = getattr(settings, 'PRODUCT_SEARCH_CONFIG', 'english')
+        return (
+            SearchVector('name', weight='A', config=config) +
+            SearchVector('description', weight='B', config=config)
+        )
+
+    @classmethod
+    def refresh_search_vector(cls, queryset=None):
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.update(search_vector=cls.build_search_vector())
+
+    @classmethod
+    def rebuild_rating_stats(cls, queryset=None):
+        """
+        Recompute the rating columns from the reviews table with one UPDATE.
+        """
+        queryset = cls.objects.all() if queryset is None else queryset
+        reviews = Review.objects.filter(product=models.OuterRef('pk')).order_by().values('product')
+        rating_sum = reviews.annotate(total=models.Sum('rating')).values('total')
+        rating_count = reviews.annotate(total=models.Count('id')).values('total')
+        rating_avg = reviews.annotate(
+            total=Cast(models.Avg('rating'), models.DecimalField(max_digits=3, decimal_places=2))
+        ).values('total')
+        return queryset.update(
+            rating_sum=Coalesce(models.Subquery(rating_sum), 0),
+            rating_count=Coalesce(models.Subquery(rating_count), 0),
+            average_rating=Coalesce(
+                models.Subquery(rating_avg), models.Value(0),
+                output_field=models.DecimalField(max_digits=3, decimal_places=2),
+            ),
+        )
+
     @classmethod
     def get_featured_products(cls):
-        cache_key = 'featured_products'
-        products = cache.get(cache_key)
-        if not products:
-            products = list(cls.objects.filter(is_featured=True, is_active=True))
-            cache.set(cache_key, products, timeout=3600)  # Cache for 1 hour
-        return products
+        return get_cached_model_rows(
+            FEATURED_PRODUCTS_NAMESPACE, cls.objects.filter(is_featured=True, is_active=True)
+        )
 
 class ProductVariant(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -213,8 +337,19 @@ class Inventory(TimeStampedModel):
         }
 
     def update_stock(self, quantity):
-        self.quantity = models.F('quantity') - quantity
-        self.save()
+        """
+        Take ``quantity`` units with a conditional UPDATE that never goes below zero.
+
+        Returns True if the stock was available and has been taken.
+        """
+        updated = Inventory.objects.filter(pk=self.pk, quantity__gte=quantity).update(
+            quantity=models.F('quantity') - quantity
+        )
+        if updated:
+            from .stock import adjust
+            adjust('inventory', {self.pk: -quantity})
+            self.refresh_from_db(fields=['quantity'])
+        return bool(updated)
 
 class StoreProduct(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -245,6 +380,7 @@ class StoreProduct(TimeStampedModel):
 class Cart(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='user_carts', verbose_name=_("User"))
+    coupon_code = models.CharField(max_length=50, blank=True, default='', verbose_name=_("Coupon Code"))
 
     class Meta:
         verbose_name = _("Cart")
@@ -253,6 +389,19 @@ class Cart(TimeStampedModel):
     def __str__(self):
         return f"Cart for {self.user.username}"
 
+    @classmethod
+    def get_locked_for_user(cls, user):
+        """
+        Return the user's cart locked with SELECT ... FOR UPDATE, creating it if needed.
+
+        Must be called inside a transaction; concurrent writers to the same
+        cart are serialized on this lock.
+        """
+        cart = cls.objects.select_for_update().filter(user=user).order_by('created_at').first()
+        if cart is None:
+            cart = cls.objects.create(user=user)
+        return cart
+
     def to_dict(self):
         return {
             **super().to_dict(),
@@ -261,6 +410,21 @@ class Cart(TimeStampedModel):
             'items': [item.to_dict() for item in self.items.all()],
         }
 
+    @classmethod
+    def with_totals(cls, queryset=None):
+        """
+        Annotate carts with ``item_count`` and ``total_price`` in the same query.
+        """
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.annotate(
+            item_count=models.Count('items'),
+            total_price=Coalesce(
+                models.Sum(models.F('items__quantity') * models.F('items__product_variant__price')),
+                models.Value(0),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+
 class CartItem(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items', verbose_name=_("Cart"))
@@ -271,10 +435,12 @@ class CartItem(TimeStampedModel):
         verbose_name = _("Cart Item")
         verbose_name_plural = _("Cart Items")
         indexes = [
-            # Corrigido para usar 'product_variant' em vez de 'product'
-            models.Index(fields=['cart', 'product_variant']),
             models.Index(fields=['created_at']),
         ]
+        constraints = [
+            # One line per variant, so bulk upserts can target ON CONFLICT (cart, product_variant).
+            models.UniqueConstraint(fields=['cart', 'product_variant'], name='frontend_cartitem_cart_variant_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.quantity} x {self.product_variant.product.name} - {self.product_variant.name} in {self.cart}"
@@ -288,6 +454,34 @@ class CartItem(TimeStampedModel):
             'quantity': self.quantity,
         }
 
+    @classmethod
+    def with_totals(cls, queryset=None):
+        """
+        Annotate cart lines with ``unit_price``, ``line_total`` and ``cart_total``.
+
+        All three are read in the query that loads the lines, so the grand
+        total always matches the prices shown next to each line.
+        """
+        queryset = cls.objects.all() if queryset is None else queryset
+        line_total = models.ExpressionWrapper(
+            models.F('quantity') * models.F('product_variant__price'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+        return queryset.select_related('product_variant__product').annotate(
+            unit_price=models.F('product_variant__price'),
+            line_total=line_total,
+            cart_total=models.Window(models.Sum(line_total), partition_by=[models.F('cart_id')]),
+        )
+
+    @classmethod
+    def lines_and_total(cls, queryset):
+        """
+        Return the priced lines of ``queryset`` and their grand total using one query.
+        """
+        lines = list(cls.with_totals(queryset))
+        cart_totals = {line.cart_id: line.cart_total for line in lines}
+        return lines, sum(cart_totals.values(), Decimal('0'))
+
 class OrderStatus(Enum):
     PENDING = 'pending'
     PROCESSING = 'processing'
@@ -323,6 +517,7 @@ class Order(TimeStampedModel):
     stripe_payment_intent_id = models.CharField(max_length=255, blank=True, null=True, verbose_name=_("Stripe Payment Intent ID"))
     paypal_payment_id = models.CharField(max_length=255, blank=True, null=True, verbose_name=_("PayPal Payment ID"))
     tracking_number = models.CharField(max_length=100, blank=True, null=True, verbose_name=_("Tracking Number"))
+    needs_review = models.BooleanField(default=False, verbose_name=_("Needs Review"))
 
     class Meta:
         verbose_name = _("Order")
@@ -358,9 +553,15 @@ class Order(TimeStampedModel):
         }
 
     def update_inventory(self):
-        for item in self.items.all():
-            inventory = Inventory.objects.get(store=item.store, product_variant=item.product_variant)
-            inventory.update_stock(item.quantity)
+        """
+        Make the stock held for this order permanent once it has been paid.
+
+        Stock is taken when the order is placed (see ``frontend.inventory``);
+        this only stops the expiry sweep from handing it back, or takes it
+        again if the sweep already did.
+        """
+        from .inventory import commit_reservations
+        return commit_reservations(self)
 
     def process_payment(self):
         if self.payment_method == PaymentMethod.STRIPE.value:
@@ -371,26 +572,22 @@ class Order(TimeStampedModel):
             raise ValueError("Invalid payment method")
 
     def process_stripe_payment(self):
-        stripe.api_key = settings.STRIPE_SECRET_KEY
+        from payments.gateways import GatewayUnavailable, call_gateway, stripe_client
         try:
-            intent = stripe.PaymentIntent.create(
-                amount=int(self.total * 100),  # Amount in cents
-                currency='usd',
-                customer=self.user.stripe_customer_id,
-                metadata={'order_id': str(self.id)}
-            )
+            intent = call_gateway('stripe', stripe_client().payment_intents.create, params={
+                'amount': int(self.total * 100),  # Amount in cents
+                'currency': 'usd',
+                'customer': self.user.stripe_customer_id,
+                'metadata': {'order_id': str(self.id)}
+            })
             self.stripe_payment_intent_id = intent.id
             self.save()
             return True
-        except stripe.error.StripeError:
+        except (stripe.error.StripeError, GatewayUnavailable):
             return False
 
     def process_paypal_payment(self):
-        paypalrestsdk.configure({
-            "mode": settings.PAYPAL_MODE,
-            "client_id": settings.PAYPAL_CLIENT_ID,
-            "client_secret": settings.PAYPAL_CLIENT_SECRET
-        })
+        from payments.gateways import GatewayUnavailable, PAYPAL_FAILURES, call_paypal, paypal_api
         payment = paypalrestsdk.Payment({
             "intent": "sale",
             "payer": {"payment_method": "paypal"},
@@ -405,8 +602,12 @@ class Order(TimeStampedModel):
                 },
                 "description": f"Payment for order {self.order_number()}"
             }]
-        })
-        if payment.create():
+        }, api=paypal_api())
+        try:
+            created = call_paypal(payment.create)
+        except PAYPAL_FAILURES + (GatewayUnavailable,):
+            return False
+        if created:
             self.paypal_payment_id = payment.id
             self.save()
             return True
@@ -416,6 +617,9 @@ class Order(TimeStampedModel):
     def update_status(self, new_status):
         self.status = new_status
         self.save()
+        if new_status == 'cancelled':
+            from .inventory import release_reservations
+            release_reservations(self.stock_reservations.all())
         Notification.objects.create(
             user=self.user,
             message=f"Your order {self.order_number()} status has been updated to {new_status}."
@@ -425,6 +629,7 @@ class OrderItem(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_items', verbose_name=_("Order"))
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name=_("Product"), default=1, null=True)
+    product_variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_items', verbose_name=_("Product Variant"))
     quantity = models.PositiveIntegerField(default=1, verbose_name=_("Quantity"))
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, validators=[MinValueValidator(0.01)], verbose_name=_("Price"))
 
@@ -445,6 +650,33 @@ class OrderItem(TimeStampedModel):
             'price': str(self.price),
         }
 
+class StockReservation(TimeStampedModel):
+    STATUS_HELD = 'held'
+    STATUS_COMMITTED = 'committed'
+    STATUS_RELEASED = 'released'
+    STATUS_CHOICES = [
+        (STATUS_HELD, 'Held'),
+        (STATUS_COMMITTED, 'Committed'),
+        (STATUS_RELEASED, 'Released'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='reservations', verbose_name=_("Inventory"))
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='stock_reservations', verbose_name=_("Order"))
+    quantity = models.PositiveIntegerField(verbose_name=_("Quantity"))
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_HELD, verbose_name=_("Status"))
+    expires_at = models.DateTimeField(verbose_name=_("Expires At"))
+
+    class Meta:
+        verbose_name = _("Stock Reservation")
+        verbose_name_plural = _("Stock Reservations")
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.inventory_id} ({self.status})"
+
 class Review(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reviews', verbose_name=_("User"))
@@ -456,6 +688,19 @@ class Review(TimeStampedModel):
         verbose_name = _("Review")
         verbose_name_plural = _("Reviews")
         unique_together = ('user', 'product')
+        indexes = [
+            # Keyset pages of a product's reviews (ReviewViewSet.by_product).
+            models.Index(fields=['product', 'created_at', 'id']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if 'product_id' in loaded and 'rating' in loaded:
+            # Remember what is stored so edits can be applied as a delta.
+            instance._loaded_rating = (loaded['product_id'], loaded['rating'])
+        return instance
 
     def __str__(self):
         return f"Review by {self.user.username} for {self.product.name}"
@@ -526,6 +771,69 @@ class Coupon(TimeStampedModel):
             self.times_used < self.max_uses
         )
 
+    @classmethod
+    def redeemable(cls, now=None):
+        """
+        Coupons that can be redeemed right now, as a filter usable in a conditional UPDATE.
+        """
+        now = now or timezone.now()
+        return cls.objects.filter(
+            is_active=True, valid_from__lte=now, valid_to__gte=now, times_used__lt=models.F('max_uses')
+        )
+
+class CouponRedemption(TimeStampedModel):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='redemptions', verbose_name=_("Coupon"))
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='coupon_redemptions', verbose_name=_("User"))
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='coupon_redemptions', verbose_name=_("Order"))
+
+    class Meta:
+        verbose_name = _("Coupon Redemption")
+        verbose_name_plural = _("Coupon Redemptions")
+        indexes = [
+            models.Index(fields=['user']),
+        ]
+        constraints = [
+            # A user redeems each coupon at most once, even under concurrent checkouts.
+            models.UniqueConstraint(fields=['coupon', 'user'], name='frontend_couponredemption_coupon_user_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.coupon_id} redeemed by {self.user_id}"
+
+class LoyaltyPointsEntry(TimeStampedModel):
+    KIND_ACCRUAL = 'accrual'
+    KIND_REDEMPTION = 'redemption'
+    KIND_ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (KIND_ACCRUAL, 'Accrual'),
+        (KIND_REDEMPTION, 'Redemption'),
+        (KIND_ADJUSTMENT, 'Adjustment'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='loyalty_entries', verbose_name=_("User"))
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='loyalty_entries', verbose_name=_("Order"))
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name=_("Kind"))
+    points = models.IntegerField(verbose_name=_("Points"))
+    # Set once the entry is included in UserProfile.loyalty_points.
+    applied_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Applied At"))
+
+    class Meta:
+        verbose_name = _("Loyalty Points Entry")
+        verbose_name_plural = _("Loyalty Points Entries")
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['created_at'], condition=models.Q(applied_at__isnull=True), name='frontend_loyalty_pending_idx'),
+        ]
+        constraints = [
+            # An order accrues points once, however often its payment is confirmed.
+            models.UniqueConstraint(fields=['order'], condition=models.Q(kind='accrual'), name='frontend_loyalty_order_accrual_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.points:+d} points for {self.user_id} ({self.kind})"
+
 class ShippingAddress(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='shipping_addresses', verbose_name=_("User"))
@@ -0,0 +1,226 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Above this many (estimated) rows the planner estimate is returned instead
+# of running COUNT(*).
+ESTIMATE_THRESHOLD = getattr(settings, 'PAGINATION_ESTIMATE_THRESHOLD', 10000)
+
+
+def estimate_count(queryset):
+    """
+    Return PostgreSQL's row estimate for ``queryset``, or None if unavailable.
+
+    Unfiltered querysets use ``pg_class.reltuples`` of the table; anything
+    else uses the top-level ``Plan Rows`` of ``EXPLAIN``.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    with connection.cursor() as cursor:
+        if not queryset.query.where and not queryset.query.distinct:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            # reltuples is -1 until the table has been analyzed.
+            if row and row[0] >= 0:
+                return row[0]
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def fast_count(queryset, threshold=ESTIMATE_THRESHOLD):
+    """
+    Return ``(count, is_estimate)``.
+
+    The exact COUNT(*) only runs when the planner expects fewer than
+    ``threshold`` rows, i.e. for small or narrowly filtered result sets.
+    """
+    estimate = estimate_count(queryset)
+    if estimate is None or estimate < threshold:
+        return queryset.count(), False
+    return estimate, True
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Django paginator whose ``count`` may come from the planner estimate.
+
+    Usable both as ``ModelAdmin.paginator`` and as DRF's
+    ``django_paginator_class``.
+    """
+    count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        count, self.count_is_estimate = fast_count(self.object_list)
+        return count
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class EstimatedCountPagination(StandardResultsSetPagination):
+    django_paginator_class = EstimatedCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_is_estimate', self.page.paginator.count_is_estimate),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on ``(ordering field, id)`` instead of OFFSET.
+
+    The cursor encodes the ordering value and id of the row at the page
+    boundary, so every page costs the same index range scan however deep it
+    is, and rows sharing the same ordering value are split deterministically
+    by ``id``. The total ``count`` is only computed when ``?count=true`` is
+    passed, and is a planner estimate for large result sets.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    count_query_param = 'count'
+    # Orderings a client may request; each must be backed by an index.
+    ordering_fields = ('created_at',)
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        self.field = self.ordering.lstrip('-')
+        self.descending = self.ordering.startswith('-')
+        self.count, self.count_is_estimate = (
+            fast_count(queryset) if self.wants_count(request) else (None, False)
+        )
+
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = bool(cursor and cursor.get('r'))
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}id')
+
+        if cursor:
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': cursor['v']}) |
+                Q(**{self.field: cursor['v'], f'id__{lookup}': cursor['id']})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if ordering.lstrip('-') in self.ordering_fields:
+            return ordering
+        return self.default_ordering
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def decode_cursor(self, request, model):
+        """
+        Return the request's cursor with ``v`` and ``id`` converted for ``model``.
+
+        Any cursor that was not produced by ``encode_cursor`` is a 404.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if not isinstance(cursor, dict) or cursor.get('v') is None or cursor.get('id') is None:
+                raise ValueError('Malformed cursor')
+            cursor['v'] = model._meta.get_field(self.field).to_python(cursor['v'])
+            cursor['id'] = model._meta.get_field('id').to_python(cursor['id'])
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if cursor['v'] is None or cursor['id'] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, instance, reverse=False):
+        value = getattr(instance, self.field)
+        cursor = {'v': value.isoformat() if hasattr(value, 'isoformat') else str(value), 'id': str(instance.pk)}
+        if reverse:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict()
+        if self.count is not None:
+            payload['count'] = self.count
+            payload['count_is_estimate'] = self.count_is_estimate
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        payload['results'] = data
+        return Response(payload)
+
+
+class ProductKeysetPagination(KeysetPagination):
+    ordering_fields = ('created_at', 'price')
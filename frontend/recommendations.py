@@ -1,32 +1,360 @@
-from django.db.models import Q
-from .models import Product, Recommendation
-
-def generate_recommendations(product):
-    # Clear existing recommendations
-    Recommendation.objects.filter(product=product).delete()
-
-    # Find similar products based on categories or tags
-    similar_products = Product.objects.filter(
-        Q(category=product.category) | Q(tags__in=product.tags.all())
-    ).exclude(id=product.id).distinct()
-
-    # Calculate scores and create recommendations
-    for similar_product in similar_products:
-        score = calculate_similarity_score(product, similar_product)
-        Recommendation.objects.create(
-            product=product,
-            recommended_product=similar_product,
-            score=score
+"""
+Item-to-item recommendations, computed offline.
+
+``build_recommendations`` (Celery beat, or the ``build_recommendations``
+management command) describes every active product as a sparse feature
+vector and stores each product's nearest neighbours in ``Recommendation``.
+The features are:
+
+* its category and, with a lower weight, the categories above it;
+* the orders it was bought in, so products bought together are close.
+
+Each block is L2-normalized per product and scaled by the square root of its
+weight, so the dot product of two rows is the weighted sum of the per-block
+cosine similarities and lies in [0, 1]. Similarities are sparse matrix
+products over batches of rows. A batch holds one score per pair of products
+sharing a feature, so its size is the batch size times the products a row
+can reach: its category, the ancestors that are kept and its co-purchases.
+An ancestor shared by more than ``MAX_ANCESTOR_PRODUCTS`` products (a root
+category, typically) would make every batch as wide as the catalogue while
+ranking all of them alike, so such ancestors are left out of the features.
+
+Requests never compute anything. ``get_product_recommendations`` returns the
+neighbour list the job left in the cache and only reads the stored rows if
+that entry was evicted.
+
+Personalized recommendations score every candidate by the sum of its
+``Recommendation`` scores to the products a user bought, weighted by how
+often they were bought. The best ``USER_RECOMMENDATIONS_SIZE`` candidates
+are kept in a Redis hash as compact arrays (16-byte product ids and float32
+scores) next to the ids already purchased and the ids of the orders they
+were built from. A paid order folds the neighbours of its products into the
+stored arrays (``add_order_to_user_recommendations``) instead of recomputing
+the whole history; an order already folded in is skipped.
+"""
+import logging
+import uuid
+
+import numpy as np
+from scipy import sparse
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django_redis import get_redis_connection
+from redis import WatchError
+
+from .models import Category, OrderItem, Product, Recommendation
+
+logger = logging.getLogger(__name__)
+
+FEATURE_WEIGHTS = {'category': 0.6, 'co_purchase': 0.4}
+ANCESTOR_CATEGORY_WEIGHT = 0.5
+# Ancestor categories above this many products are not used as features.
+MAX_ANCESTOR_PRODUCTS = getattr(settings, 'RECOMMENDATIONS_MAX_ANCESTOR_PRODUCTS', 5000)
+RECOMMENDATIONS_PER_PRODUCT = getattr(settings, 'RECOMMENDATIONS_PER_PRODUCT', 10)
+SIMILARITY_BATCH_SIZE = 1000
+# Longer than the interval between two builds, so the cache stays warm.
+RECOMMENDATIONS_TIMEOUT = 60 * 60 * 48
+USER_RECOMMENDATIONS_SIZE = 100
+# Scores go stale when the nightly build changes the neighbours.
+USER_RECOMMENDATIONS_TTL = 60 * 60 * 24
+
+
+def _product_key(product_id):
+    return f'recommendations:product:{product_id}'
+
+
+def _normalize(matrix, weight):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(np.sqrt(weight) / norms) @ matrix
+
+
+def _category_features(products, index):
+    """
+    One column per category; a product has its own category and its ancestors,
+    except ancestors above ``MAX_ANCESTOR_PRODUCTS`` products.
+    """
+    paths = dict(Category.objects.values_list('pk', 'path'))
+    entries = []
+    sizes = {}
+    for product_id, category_id in products:
+        segments = [segment for segment in paths.get(category_id, '').rstrip('/').split('/') if segment]
+        for depth, segment in enumerate(segments):
+            entries.append((index[product_id], segment, depth == len(segments) - 1))
+            sizes[segment] = sizes.get(segment, 0) + 1
+
+    columns = {}
+    rows, cols, values = [], [], []
+    for row, segment, own in entries:
+        if not own and sizes[segment] > MAX_ANCESTOR_PRODUCTS:
+            continue
+        rows.append(row)
+        cols.append(columns.setdefault(segment, len(columns)))
+        values.append(1.0 if own else ANCESTOR_CATEGORY_WEIGHT)
+    return sparse.csr_matrix((values, (rows, cols)), shape=(len(index), max(len(columns), 1)))
+
+
+def _co_purchase_features(index):
+    """
+    One column per order that contained at least one of the products.
+    """
+    columns = {}
+    rows, cols = [], []
+    pairs = (
+        OrderItem.objects.exclude(order__status='cancelled')
+        .values_list('product_id', 'order_id').distinct()
+        .iterator(chunk_size=10000)
+    )
+    for product_id, order_id in pairs:
+        if product_id in index:
+            rows.append(index[product_id])
+            cols.append(columns.setdefault(order_id, len(columns)))
+    values = np.ones(len(rows), dtype=np.float64)
+    return sparse.csr_matrix((values, (rows, cols)), shape=(len(index), max(len(columns), 1)))
+
+
+def build_feature_matrix(products):
+    """
+    Return the weighted, normalized product x feature matrix for ``[(product_id, category_id)]``.
+    """
+    index = {product_id: i for i, (product_id, _) in enumerate(products)}
+    return sparse.hstack([
+        _normalize(_category_features(products, index), FEATURE_WEIGHTS['category']),
+        _normalize(_co_purchase_features(index), FEATURE_WEIGHTS['co_purchase']),
+    ]).tocsr()
+
+
+def top_neighbours(features, k=RECOMMENDATIONS_PER_PRODUCT, batch_size=SIMILARITY_BATCH_SIZE):
+    """
+    Yield ``(row, neighbour_rows, scores)`` per row, best first, excluding the row itself.
+
+    Scores are computed ``batch_size`` rows at a time; a batch holds a score
+    for every product its rows share a feature with.
+    """
+    transposed = features.T.tocsr()
+    for offset in range(0, features.shape[0], batch_size):
+        similarities = (features[offset:offset + batch_size] @ transposed).tocsr()
+        for i in range(similarities.shape[0]):
+            start, end = similarities.indptr[i], similarities.indptr[i + 1]
+            columns = similarities.indices[start:end]
+            scores = similarities.data[start:end]
+            keep = (columns != offset + i) & (scores > 0)
+            columns, scores = columns[keep], scores[keep]
+            if len(scores) > k:
+                best = np.argpartition(-scores, k)[:k]
+                columns, scores = columns[best], scores[best]
+            ranking = np.argsort(-scores, kind='stable')
+            yield offset + i, columns[ranking], scores[ranking]
+
+
+def build_recommendations(k=RECOMMENDATIONS_PER_PRODUCT, batch_size=SIMILARITY_BATCH_SIZE):
+    """
+    Recompute and store the top ``k`` recommendations of every active product.
+
+    Rows are replaced one batch of products at a time and the cache entries of
+    each batch are overwritten once it is committed. Returns the number of
+    products processed.
+    """
+    products = list(Product.objects.filter(is_active=True).order_by('pk').values_list('pk', 'category_id'))
+    product_ids = [product_id for product_id, _ in products]
+    Recommendation.objects.filter(product__is_active=False).delete()
+    if not products:
+        return 0
+
+    features = build_feature_matrix(products)
+    neighbours = {}
+    for row, columns, scores in top_neighbours(features, k=k, batch_size=batch_size):
+        neighbours[product_ids[row]] = tuple(
+            (product_ids[column], round(float(score), 6)) for column, score in zip(columns, scores)
         )
+        if len(neighbours) == batch_size:
+            _store(neighbours)
+            neighbours = {}
+    if neighbours:
+        _store(neighbours)
+    return len(products)
+
+
+def _store(neighbours):
+    with transaction.atomic():
+        Recommendation.objects.filter(product_id__in=list(neighbours)).delete()
+        Recommendation.objects.bulk_create([
+            Recommendation(product_id=product_id, recommended_product_id=recommended_id, score=score)
+            for product_id, ranked in neighbours.items()
+            for recommended_id, score in ranked
+        ], batch_size=5000)
+    cache.set_many({_product_key(product_id): ranked for product_id, ranked in neighbours.items()}, RECOMMENDATIONS_TIMEOUT)
+
+
+def get_product_recommendations(product_id, limit=RECOMMENDATIONS_PER_PRODUCT):
+    """
+    Return ``((recommended_product_id, score), ...)`` for a product, best first.
+    """
+    key = _product_key(product_id)
+    ranked = cache.get(key)
+    if ranked is None:
+        ranked = tuple(
+            Recommendation.objects.filter(product_id=product_id)
+            .order_by('-score')
+            .values_list('recommended_product_id', 'score')[:RECOMMENDATIONS_PER_PRODUCT]
+        )
+        cache.set(key, ranked, RECOMMENDATIONS_TIMEOUT)
+    return ranked[:limit]
+
+
+def _user_key(user_id):
+    return f'recommendations:user:{user_id}'
+
+
+def _pack_ids(ids):
+    return b''.join(uuid.UUID(str(pk)).bytes for pk in ids)
+
+
+def _unpack_ids(packed):
+    return [uuid.UUID(bytes=packed[i:i + 16]) for i in range(0, len(packed or b''), 16)]
+
+
+def _rank(candidates, purchased, size=USER_RECOMMENDATIONS_SIZE):
+    """
+    Return the best ``size`` ``(ids, scores)`` of ``{product_id: score}``, skipping purchased products.
+    """
+    ids = [pk for pk in candidates if pk not in purchased]
+    scores = np.fromiter((candidates[pk] for pk in ids), dtype=np.float32, count=len(ids))
+    if len(ids) > size:
+        best = np.argpartition(-scores, size)[:size]
+    else:
+        best = np.arange(len(ids))
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return [ids[i] for i in best], scores[best]
+
+
+def _accumulate(candidates, weights):
+    """
+    Add the stored neighbours of each product in ``{product_id: weight}`` to ``candidates``.
+    """
+    for product_id, recommended_id, score in Recommendation.objects.filter(
+        product_id__in=list(weights)
+    ).values_list('product_id', 'recommended_product_id', 'score'):
+        candidates[recommended_id] = candidates.get(recommended_id, 0.0) + weights[product_id] * score
+    return candidates
+
+
+def _store_user(connection, user_id, ids, scores, purchased, orders):
+    key = _user_key(user_id)
+    pipe = connection.pipeline()
+    pipe.delete(key)
+    pipe.hset(key, mapping={
+        'ids': _pack_ids(ids),
+        'scores': np.asarray(scores, dtype=np.float32).tobytes(),
+        'purchased': _pack_ids(purchased),
+        'orders': _pack_ids(orders),
+    })
+    pipe.expire(key, USER_RECOMMENDATIONS_TTL)
+    pipe.execute()
+
+
+def _purchase_weights(user_id):
+    """
+    Return ``({product_id: times bought}, order ids)`` of the user's history.
+    """
+    weights = {}
+    orders = set()
+    for order_id, product_id in OrderItem.objects.filter(order__user_id=user_id).exclude(
+        order__status='cancelled'
+    ).exclude(product_id=None).values_list('order_id', 'product_id'):
+        weights[product_id] = weights.get(product_id, 0) + 1
+        orders.add(order_id)
+    return weights, orders
+
+
+def build_user_recommendations(user_id):
+    """
+    Score candidates from the user's full purchase history. Returns ``(ids, scores, purchased, orders)``.
+    """
+    weights, orders = _purchase_weights(user_id)
+    ids, scores = _rank(_accumulate({}, weights), set(weights))
+    return ids, scores, list(weights), list(orders)
+
+
+def get_user_recommendations(user_id, limit=10):
+    """
+    Return the ids of the products to recommend to a user, best first.
+
+    Read from the user's Redis arrays; built from the purchase history and
+    stored when missing.
+    """
+    try:
+        connection = get_redis_connection('default')
+        packed = connection.hget(_user_key(user_id), 'ids')
+        if packed is not None:
+            return _unpack_ids(packed)[:limit]
+    except Exception as e:
+        logger.warning(f"Cached user recommendations unavailable: {str(e)}")
+        connection = None
+
+    ids, scores, purchased, orders = build_user_recommendations(user_id)
+    if connection is not None:
+        try:
+            _store_user(connection, user_id, ids, scores, purchased, orders)
+        except Exception as e:
+            logger.warning(f"Could not cache user recommendations: {str(e)}")
+    return ids[:limit]
+
+
+def add_order_to_user_recommendations(order_id):
+    """
+    Fold the products of a paid order into its user's cached recommendations.
+
+    Users without cached arrays are skipped: their next read builds them
+    from the full history, which already includes this order. Gateways
+    redeliver payment events, so an order already folded into the arrays is
+    skipped. The update is a WATCH/MULTI transaction, so concurrent orders of
+    one user are retried instead of overwriting each other.
+    """
+    items = list(OrderItem.objects.filter(order_id=order_id).exclude(product_id=None).values_list(
+        'order__user_id', 'product_id'
+    ))
+    if not items:
+        return False
+    user_id = items[0][0]
+    weights = {}
+    for _, product_id in items:
+        weights[product_id] = weights.get(product_id, 0) + 1
+    neighbours = _accumulate({}, weights)
+
+    connection = get_redis_connection('default')
+    key = _user_key(user_id)
+    while True:
+        with connection.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                cached = pipe.hgetall(key)
+                if not cached:
+                    return False
+                cached = {k.decode() if isinstance(k, bytes) else k: v for k, v in cached.items()}
+                orders = _unpack_ids(cached.get('orders'))
+                if uuid.UUID(str(order_id)) in orders:
+                    return False
+                candidates = dict(zip(
+                    _unpack_ids(cached.get('ids')),
+                    np.frombuffer(cached.get('scores') or b'', dtype=np.float32).tolist(),
+                ))
+                for product_id, score in neighbours.items():
+                    candidates[product_id] = candidates.get(product_id, 0.0) + score
+                purchased = set(_unpack_ids(cached.get('purchased'))) | set(weights)
+                ids, scores = _rank(candidates, purchased)
 
-def calculate_similarity_score(product1, product2):
-    # Implement your similarity calculation logic here
-    # This is a simple example based on shared categories and tags
-    score = 0
-    if product1.category == product2.category:
-        score += 0.5
-    
-    shared_tags = set(product1.tags.all()) & set(product2.tags.all())
-    score += len(shared_tags) * 0.1
-
-    return min(score, 1.0)  # Normalize score to a maximum of 1.0
\ No newline at end of file
+                pipe.multi()
+                pipe.hset(key, mapping={
+                    'ids': _pack_ids(ids),
+                    'scores': scores.tobytes(),
+                    'purchased': _pack_ids(purchased),
+                    'orders': _pack_ids([*orders, uuid.UUID(str(order_id))]),
+                })
+                pipe.expire(key, USER_RECOMMENDATIONS_TTL)
+                pipe.execute()
+                return True
+            except WatchError:
+                continue
@@ -1,7 +1,26 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Prefetch
 from .models import Category, Product, Store, ProductVariant, Cart, CartItem, Order, Review, Wishlist, UserProfile, StoreProduct
 
+class EagerLoadingMixin:
+    """
+    Declares the relations a serializer walks so views can load them up front.
+
+    ``select_related_fields`` and ``prefetch_related_fields`` must cover every
+    nested serializer, otherwise each row costs extra queries.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
@@ -21,21 +40,26 @@ class UserSerializer(serializers.ModelSerializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
-        fields = ['bio', 'avatar', 'birth_date']
+        fields = ['bio', 'avatar', 'birth_date', 'loyalty_points']
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('user',)
+
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = Review
         fields = ['id', 'user', 'rating', 'comment', 'created_at', 'updated_at']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('category',)
+    prefetch_related_fields = ('reviews__user',)
+
     category = CategorySerializer(read_only=True)
     image = serializers.ImageField(required=False)
     average_rating = serializers.FloatField(read_only=True)
@@ -45,6 +69,28 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = ['id', 'name', 'description', 'price', 'is_featured', 'slug', 'image', 'category', 'stock', 'average_rating', 'reviews', 'created_at', 'updated_at']
 
+class CategorySummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'slug']
+
+class ProductListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    """
+    Card representation of a product for list endpoints.
+
+    Reviews are not embedded; the rating figures come from the denormalized
+    columns on ``Product``.
+    """
+    select_related_fields = ('category',)
+
+    category = CategorySummarySerializer(read_only=True)
+    average_rating = serializers.FloatField(read_only=True)
+    review_count = serializers.IntegerField(source='rating_count', read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'slug', 'price', 'is_featured', 'image', 'category', 'stock', 'average_rating', 'review_count']
+
 class StoreSerializer(serializers.ModelSerializer):
     owner = UserSerializer(read_only=True)
 
@@ -59,7 +105,10 @@ class ProductVariantSerializer(serializers.ModelSerializer):
         model = ProductVariant
         fields = ['id', 'product', 'name', 'sku', 'price', 'created_at', 'updated_at']
 
-class StoreProductSerializer(serializers.ModelSerializer):
+class StoreProductSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('product__category', 'store__owner')
+    prefetch_related_fields = ('product__reviews__user',)
+
     product = ProductSerializer(read_only=True)
     store = StoreSerializer(read_only=True)
 
@@ -87,23 +136,69 @@ class StoreProductUpdateSerializer(serializers.ModelSerializer):
             'inventory_level': {'error_messages': {'required': 'Inventory level is required.'}},
         }
 
-class CartItemSerializer(serializers.ModelSerializer):
-    store_product = StoreProductSerializer(read_only=True)
-    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+class CartProductVariantSerializer(serializers.ModelSerializer):
+    product = ProductListSerializer(read_only=True)
+
+    class Meta:
+        model = ProductVariant
+        fields = ['id', 'product', 'name', 'sku', 'price']
+
+class CartItemSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    """
+    Cart line priced by ``CartItem.with_totals``; querysets passed in must
+    carry its annotations.
+    """
+    select_related_fields = ('product_variant__product__category',)
+
+    product_variant = CartProductVariantSerializer(read_only=True)
+    product_variant_id = serializers.PrimaryKeyRelatedField(
+        source='product_variant', queryset=ProductVariant.objects.all(), write_only=True
+    )
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_price = serializers.DecimalField(source='line_total', max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = CartItem
-        fields = ['id', 'cart', 'store_product', 'quantity', 'total_price', 'created_at', 'updated_at']
+        fields = ['id', 'cart', 'product_variant', 'product_variant_id', 'quantity', 'unit_price', 'total_price', 'created_at', 'updated_at']
+
+class CartSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('user',)
+    prefetch_related_fields = (
+        Prefetch('items', queryset=CartItemSerializer.setup_eager_loading(CartItem.with_totals())),
+    )
 
-class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     user = UserSerializer(read_only=True)
-    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = Cart
         fields = ['id', 'user', 'items', 'total_price', 'created_at', 'updated_at']
 
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return Cart.with_totals(super().setup_eager_loading(queryset))
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    product_variant_id = serializers.UUIDField()
+    quantity = serializers.IntegerField(min_value=0, default=1)
+
+class CartBulkSerializer(serializers.Serializer):
+    MAX_OPERATIONS = 200
+
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=MAX_OPERATIONS)
+
+    def validate_operations(self, operations):
+        variant_ids = {operation['product_variant_id'] for operation in operations}
+        found = set(ProductVariant.objects.filter(pk__in=variant_ids).values_list('pk', flat=True))
+        missing = variant_ids - found
+        if missing:
+            raise serializers.ValidationError(
+                f"Unknown product variants: {', '.join(sorted(str(pk) for pk in missing))}"
+            )
+        return operations
+
 class OrderSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     items = CartItemSerializer(many=True, read_only=True)
@@ -113,7 +208,10 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'user', 'items', 'total_amount', 'status', 'payment_status', 'payment_method', 'stripe_payment_intent_id', 'paypal_payment_id', 'tracking_number', 'created_at', 'updated_at']
 
-class WishlistSerializer(serializers.ModelSerializer):
+class WishlistSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('user',)
+    prefetch_related_fields = ('products__category', 'products__reviews__user')
+
     user = UserSerializer(read_only=True)
     products = ProductSerializer(many=True, read_only=True)
 
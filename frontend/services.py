@@ -1,5 +1,17 @@
-from django.db.models import Prefetch, Count, Q
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from django.conf import settings
+from django.db import transaction
+from decimal import Decimal
+from django.db.models import Prefetch, Count, Q, F, Sum, OuterRef, Subquery, DecimalField, Value, Case, When, Exists, FloatField
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from .coupons import redeem_coupon, CouponError
+from .inventory import reserve_stock, InsufficientStock
+from .models import Product, ProductVariant, Review, Order, OrderItem, Cart, CartItem
+
+# Minimum trigram similarity for the typo-tolerant fallback search.
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+
+class CheckoutError(Exception):
+    pass
 
 class ProductService:
     @staticmethod
@@ -25,17 +37,80 @@ class ProductService:
         return queryset
 
     @staticmethod
-    def search_products(query):
-        search_vector = SearchVector('name', weight='A') + \
-                       SearchVector('description', weight='B')
-        search_query = SearchQuery(query)
-        
-        return Product.objects.annotate(
-            search=search_vector,
-            rank=SearchRank(search_vector, search_query)
+    def search_products(query, queryset=None):
+        """
+        Full-text search over the stored ``Product.search_vector``.
+
+        Matches are ranked with ``SearchRank`` (name weighted above
+        description). When nothing matches, for instance because of a typo,
+        products whose name is trigram-similar to the query are returned
+        instead, most similar first.
+
+        Both cases are one queryset: whether anything matches is an
+        uncorrelated ``EXISTS`` that PostgreSQL evaluates once per statement,
+        so a page costs no extra round trip.
+        """
+        if queryset is None:
+            queryset = Product.objects.filter(is_active=True)
+
+        config = getattr(settings, 'PRODUCT_SEARCH_CONFIG', 'english')
+        search_query = SearchQuery(query, search_type='websearch', config=config)
+        matches = Q(search_vector=search_query)
+        similar = Q(name__trigram_similar=query, similarity__gte=TRIGRAM_SIMILARITY_THRESHOLD)
+        return queryset.annotate(
+            similarity=TrigramSimilarity('name', query)
         ).filter(
-            search=search_query
-        ).order_by('-rank')
+            matches | (similar & ~Exists(queryset.filter(matches)))
+        ).annotate(
+            rank=Case(
+                When(matches, then=SearchRank(F('search_vector'), search_query)),
+                default=Value(0.0), output_field=FloatField(),
+            )
+        ).order_by('-rank', '-similarity', 'pk')
+
+class CartService:
+    @staticmethod
+    @transaction.atomic
+    def apply_operations(user, operations):
+        """
+        Apply a batch of cart operations in one transaction.
+
+        Each operation is a dict with ``op`` (``add``, ``set`` or ``remove``),
+        ``product_variant_id`` and ``quantity``. Operations are folded in
+        order into final quantities, then written with one DELETE for lines
+        that dropped to zero and one ``INSERT ... ON CONFLICT (cart,
+        product_variant) DO UPDATE`` for the rest. The cart row is locked for
+        the duration so concurrent batches apply one after the other.
+        """
+        cart = Cart.get_locked_for_user(user)
+        variant_ids = {operation['product_variant_id'] for operation in operations}
+        quantities = dict(
+            CartItem.objects.filter(cart=cart, product_variant_id__in=variant_ids)
+            .values_list('product_variant_id', 'quantity')
+        )
+
+        for operation in operations:
+            variant_id = operation['product_variant_id']
+            if operation['op'] == 'add':
+                quantities[variant_id] = quantities.get(variant_id, 0) + operation['quantity']
+            elif operation['op'] == 'set':
+                quantities[variant_id] = operation['quantity']
+            else:
+                quantities[variant_id] = 0
+
+        removed = [variant_id for variant_id, quantity in quantities.items() if quantity <= 0]
+        if removed:
+            CartItem.objects.filter(cart=cart, product_variant_id__in=removed).delete()
+        CartItem.objects.bulk_create(
+            [
+                CartItem(cart=cart, product_variant_id=variant_id, quantity=quantity)
+                for variant_id, quantity in quantities.items() if quantity > 0
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product_variant'],
+            update_fields=['quantity', 'updated_at'],
+        )
+        return cart
 
 class OrderService:
     @staticmethod
@@ -51,4 +126,66 @@ class OrderService:
             'payments'
         ).filter(
             user_id=user_id
-        ).order_by('-created_at') 
\ No newline at end of file
+        ).order_by('-created_at') 
+
+    @staticmethod
+    @transaction.atomic
+    def checkout(user):
+        """
+        Turn the user's cart into an order with a fixed number of queries.
+
+        The cart lines are locked with SELECT ... FOR UPDATE, stock is
+        reserved for the order with one conditional UPDATE (see
+        ``frontend.inventory.reserve_stock``), prices are copied into
+        ``OrderItem`` rows with one ``bulk_create``, ``Order.total`` is set
+        from an aggregate and the cart is emptied with a single DELETE. A
+        coupon applied to the cart is redeemed for the order (see
+        ``frontend.coupons.redeem_coupon``) and discounts the total.
+        Raises ``CheckoutError`` if the cart is empty, the coupon cannot be
+        redeemed or a variant does not have enough stock.
+        """
+        cart_items = list(
+            CartItem.objects.select_for_update(of=('self',))
+            .filter(cart__user=user)
+            .select_related('product_variant', 'cart')
+        )
+        if not cart_items:
+            raise CheckoutError("Your cart is empty")
+        coupon_code = cart_items[0].cart.coupon_code
+
+        requested = {}
+        for item in cart_items:
+            requested[item.product_variant_id] = requested.get(item.product_variant_id, 0) + item.quantity
+
+        order = Order.objects.create(user=user)
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=item.product_variant.product_id,
+                product_variant=item.product_variant,
+                quantity=item.quantity,
+                price=item.product_variant.price,
+            )
+            for item in cart_items
+        ])
+        line_total = F('quantity') * F('price')
+        if coupon_code:
+            # Redeemed late: the counter UPDATE locks the coupon row until commit.
+            try:
+                coupon = redeem_coupon(coupon_code, user, order=order)
+            except CouponError as e:
+                raise CheckoutError(str(e))
+            line_total = line_total * Value(Decimal(100 - coupon.discount_percent) / Decimal(100))
+            Cart.objects.filter(pk=cart_items[0].cart_id).update(coupon_code='')
+        order_total = OrderItem.objects.filter(order=OuterRef('pk')).values('order').annotate(
+            total=Sum(line_total, output_field=DecimalField(max_digits=10, decimal_places=2))
+        ).values('total')
+        Order.objects.filter(pk=order.pk).update(total=Subquery(order_total))
+        CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+        try:
+            reserve_stock(requested, order=order)
+        except InsufficientStock as e:
+            raise CheckoutError(str(e))
+
+        order.refresh_from_db(fields=['total'])
+        return order
@@ -0,0 +1,114 @@
+import logging
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import (
+    bump_namespace_version, invalidate_product_list,
+    CATEGORY_NAMESPACE, FEATURED_PRODUCTS_NAMESPACE,
+)
+from .cart import Cart as SessionCart, CART_SESSION_KEY
+from .coupons import COUPON_NAMESPACE
+from .models import Category, Coupon, Inventory, Product, Review, StoreProduct
+from . import stock
+from .suggest import publish_change, CATEGORY_SCORE
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_search_vector(sender, instance, **kwargs):
+    Product.refresh_search_vector(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Review)
+def apply_review_rating(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_rating', None)
+    if created:
+        Product.apply_rating_delta(instance.product_id, instance.rating, 1)
+    elif loaded is None:
+        # Saved without having been loaded, so the previous rating is unknown.
+        Product.rebuild_rating_stats(Product.objects.filter(pk=instance.product_id))
+    elif loaded[0] != instance.product_id:
+        Product.apply_rating_delta(loaded[0], -loaded[1], -1)
+        Product.apply_rating_delta(instance.product_id, instance.rating, 1)
+    elif loaded[1] != instance.rating:
+        Product.apply_rating_delta(instance.product_id, instance.rating - loaded[1], 0)
+    instance._loaded_rating = (instance.product_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def revert_review_rating(sender, instance, **kwargs):
+    product_id, rating = getattr(instance, '_loaded_rating', (instance.product_id, instance.rating))
+    Product.apply_rating_delta(product_id, -rating, -1)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_list_cache(sender, **kwargs):
+    invalidate_product_list()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, **kwargs):
+    bump_namespace_version(CATEGORY_NAMESPACE)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_featured_products_cache(sender, **kwargs):
+    bump_namespace_version(FEATURED_PRODUCTS_NAMESPACE)
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def invalidate_coupon_cache(sender, **kwargs):
+    # Also forgets cached misses, in case a probed code was just created.
+    bump_namespace_version(COUPON_NAMESPACE)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def update_suggestion_index(sender, instance, **kwargs):
+    kind = 'product' if sender is Product else 'category'
+    if instance.is_active:
+        score = instance.rating_count if sender is Product else CATEGORY_SCORE
+        change = dict(name=instance.name, slug=instance.slug, score=score)
+    else:
+        change = {}
+    transaction.on_commit(lambda: publish_change(kind, instance.pk, **change))
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def remove_from_suggestion_index(sender, instance, **kwargs):
+    kind = 'product' if sender is Product else 'category'
+    transaction.on_commit(lambda: publish_change(kind, instance.pk))
+
+
+@receiver(user_logged_in)
+def merge_session_cart(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session') and CART_SESSION_KEY in request.session:
+        # A failed merge must not fail the login. merge_into puts the items
+        # back in the session cart, which is merged again on the next login.
+        try:
+            SessionCart(request).merge_into(user)
+        except Exception:
+            logger.exception(f"Could not merge the session cart of user {user.pk}")
+
+
+@receiver(post_save, sender=Inventory)
+@receiver(post_save, sender=StoreProduct)
+def reseed_stock_level(sender, instance, **kwargs):
+    # Edited outside the stock cache: reseed the counter from the row.
+    kind = 'inventory' if sender is Inventory else 'store_product'
+    transaction.on_commit(lambda: stock.forget(kind, instance.pk))
@@ -0,0 +1,490 @@
+"""
+Redis stock counters with write-behind to PostgreSQL.
+
+Stock levels of ``Inventory.quantity`` and ``StoreProduct.inventory_level``
+rows are cached as Redis counters, seeded from the row on first read.
+Writes to the rows of hot variants go to Redis only: ``take`` and
+``give_back`` change the counter and a pending delta in one Lua call, and
+``flush_deltas`` (Celery beat, every few seconds) applies the accumulated
+deltas to the rows with one UPDATE per model. A counter is therefore always
+``row value + pending delta``; ``reconcile`` checks exactly that and
+corrects counters that drifted.
+
+Units taken for a database transaction are recorded in a hold (``open_hold``)
+that the transaction settles on commit; holds left behind by rolled back
+transactions are given back by ``return_stale_holds``.
+
+Rows that are not hot are still written in PostgreSQL, and ``adjust`` keeps
+their cached counter in step.
+
+Orders take stock from ``Inventory`` rows only (see ``frontend.inventory``);
+``StoreProduct`` levels are edited by store owners and only read through
+their counters here, though ``take`` and the flush handle both kinds.
+"""
+import logging
+import time
+import uuid
+
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django_redis import get_redis_connection
+
+from .models import Inventory, StockReservation, StoreProduct
+
+logger = logging.getLogger(__name__)
+
+# kind -> (model, stock field)
+TRACKED_MODELS = {
+    'inventory': (Inventory, 'quantity'),
+    'store_product': (StoreProduct, 'inventory_level'),
+}
+
+HOT_SKU_SET_KEY = 'stock:hot'
+DIRTY_SET_KEY = 'stock:dirty'
+TRACKED_SET_KEY = 'stock:tracked'
+FLUSH_LOCK_KEY = 'stock:flush-lock'
+FLUSH_LOCK_TIMEOUT = 60
+HOLDS_SET_KEY = 'stock:holds'
+# Seconds after which a hold whose transaction never committed is given back.
+HOLD_TIMEOUT = 5 * 60
+HOLD_RESERVATIONS_FIELD = 'reservations'
+# Seconds a mismatch must persist before reconcile treats it as drift.
+RECONCILE_RECHECK_DELAY = 1
+
+# Returns -1 if the counter is not seeded, 0 if there is not enough stock and
+# 1 once ARGV[1] units have been taken.
+TAKE_SCRIPT = """
+local available = redis.call('GET', KEYS[1])
+if not available then
+    return -1
+end
+if tonumber(available) < tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('DECRBY', KEYS[1], ARGV[1])
+redis.call('DECRBY', KEYS[2], ARGV[1])
+redis.call('SADD', KEYS[3], ARGV[2])
+if KEYS[4] then
+    redis.call('HINCRBY', KEYS[4], ARGV[2], ARGV[1])
+end
+return 1
+"""
+
+# Pending deltas are kept even while the counter is missing; seeding adds
+# them to the row value.
+GIVE_BACK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+redis.call('INCRBY', KEYS[2], ARGV[1])
+redis.call('SADD', KEYS[3], ARGV[2])
+"""
+
+SEED_SCRIPT = """
+local pending = tonumber(redis.call('GET', KEYS[2]) or '0')
+redis.call('SET', KEYS[1], tonumber(ARGV[1]) + pending, 'NX')
+redis.call('SADD', KEYS[3], ARGV[2])
+return redis.call('GET', KEYS[1])
+"""
+
+RESTORE_DELTA_SCRIPT = """
+redis.call('INCRBY', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[2], ARGV[2])
+"""
+
+ADJUST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+"""
+
+# Counter and pending delta in one read; nil if the counter is not seeded.
+READ_LEVEL_SCRIPT = """
+local counter = redis.call('GET', KEYS[1])
+if not counter then
+    return false
+end
+return {tonumber(counter), tonumber(redis.call('GET', KEYS[2]) or '0')}
+"""
+
+# Moves the counter by ARGV[2] only if ``counter - delta`` is still ARGV[1],
+# i.e. only takes and give-backs (which move both) ran since it was read.
+FIX_LEVEL_SCRIPT = """
+local counter = redis.call('GET', KEYS[1])
+if not counter then
+    return 0
+end
+if tonumber(counter) - tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('INCRBY', KEYS[1], ARGV[2])
+return 1
+"""
+
+# Gives back every unit recorded in the hold KEYS[1] and deletes it; a hold
+# is returned at most once. ARGV[1] is the reservations field, ARGV[2] the
+# hold token.
+RETURN_HOLD_SCRIPT = """
+local held = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[2])
+for i = 1, #held, 2 do
+    local member = held[i]
+    if member ~= ARGV[1] then
+        local counter = 'stock:level:' .. member
+        if redis.call('EXISTS', counter) == 1 then
+            redis.call('INCRBY', counter, held[i + 1])
+        end
+        redis.call('INCRBY', 'stock:delta:' .. member, held[i + 1])
+        redis.call('SADD', KEYS[3], member)
+    end
+end
+"""
+
+POP_DELTA_SCRIPT = """
+local delta = redis.call('GET', KEYS[1])
+redis.call('DEL', KEYS[1])
+redis.call('SREM', KEYS[2], ARGV[1])
+return delta
+"""
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def _member(kind, pk):
+    return f'{kind}:{pk}'
+
+
+def _counter_key(kind, pk):
+    return f'stock:level:{kind}:{pk}'
+
+
+def _delta_key(kind, pk):
+    return f'stock:delta:{kind}:{pk}'
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def mark_hot_skus(variant_ids, hot=True):
+    """
+    Route stock writes for the inventory rows of these variants through Redis.
+    """
+    key_ids = [str(pk) for pk in variant_ids]
+    if not key_ids:
+        return
+    if hot:
+        _redis().sadd(HOT_SKU_SET_KEY, *key_ids)
+    else:
+        _redis().srem(HOT_SKU_SET_KEY, *key_ids)
+        # Anything still pending for these rows is written back now.
+        flush_deltas()
+
+
+def hot_variants(variant_ids):
+    variant_ids = list(variant_ids)
+    if not variant_ids:
+        return set()
+    flags = _redis().smismember(HOT_SKU_SET_KEY, [str(pk) for pk in variant_ids])
+    return {pk for pk, flag in zip(variant_ids, flags) if flag}
+
+
+def get_levels(kind, pks):
+    """
+    Return ``{pk: stock level}``, seeding missing counters from the database.
+    """
+    pks = list(pks)
+    if not pks:
+        return {}
+    connection = _redis()
+    cached = connection.mget([_counter_key(kind, pk) for pk in pks])
+    levels = {pk: int(value) for pk, value in zip(pks, cached) if value is not None}
+
+    missing = {str(pk): pk for pk in pks if pk not in levels}
+    if missing:
+        model, field = TRACKED_MODELS[kind]
+        seed = connection.register_script(SEED_SCRIPT)
+        for row_pk, value in model.objects.filter(pk__in=list(missing)).values_list('pk', field):
+            pk = missing[str(row_pk)]
+            levels[pk] = int(seed(
+                keys=[_counter_key(kind, pk), _delta_key(kind, pk), TRACKED_SET_KEY],
+                args=[value, _member(kind, pk)],
+            ))
+    return levels
+
+
+def _hold_key(token):
+    return f'stock:hold:{token}'
+
+
+def take(kind, pk, quantity, hold=None):
+    """
+    Atomically take ``quantity`` units from a cached row. Returns False if short.
+
+    With ``hold``, the units are also recorded in that hold.
+    """
+    connection = _redis()
+    script = connection.register_script(TAKE_SCRIPT)
+    keys = [_counter_key(kind, pk), _delta_key(kind, pk), DIRTY_SET_KEY]
+    if hold is not None:
+        keys.append(_hold_key(hold))
+    result = script(keys=keys, args=[quantity, _member(kind, pk)])
+    if result == -1:
+        get_levels(kind, [pk])
+        result = script(keys=keys, args=[quantity, _member(kind, pk)])
+    return result == 1
+
+
+def give_back(kind, pk, quantity):
+    script = _redis().register_script(GIVE_BACK_SCRIPT)
+    script(
+        keys=[_counter_key(kind, pk), _delta_key(kind, pk), DIRTY_SET_KEY],
+        args=[quantity, _member(kind, pk)],
+    )
+
+
+def open_hold(reservation_ids):
+    """
+    Start a hold for units taken on behalf of the ``StockReservation`` rows
+    ``reservation_ids``, which are about to be inserted. Returns its token.
+    """
+    token = uuid.uuid4().hex
+    connection = _redis()
+    pipe = connection.pipeline()
+    pipe.hset(_hold_key(token), HOLD_RESERVATIONS_FIELD, ','.join(str(pk) for pk in reservation_ids))
+    pipe.zadd(HOLDS_SET_KEY, {token: time.time()})
+    pipe.execute()
+    return token
+
+
+def settle_hold(token):
+    """
+    Keep the units of a hold whose reservations were committed.
+    """
+    try:
+        connection = _redis()
+        connection.delete(_hold_key(token))
+        connection.zrem(HOLDS_SET_KEY, token)
+    except Exception as e:
+        logger.warning(f"Could not settle stock hold {token}, the sweep will: {str(e)}")
+
+
+def return_hold(token):
+    """
+    Give back every unit taken under ``token``.
+    """
+    script = _redis().register_script(RETURN_HOLD_SCRIPT)
+    script(keys=[_hold_key(token), HOLDS_SET_KEY, DIRTY_SET_KEY], args=[HOLD_RESERVATIONS_FIELD, token])
+
+
+def return_stale_holds(timeout=HOLD_TIMEOUT):
+    """
+    Resolve holds older than ``timeout`` seconds that were never settled.
+
+    A hold whose reservations exist was committed and only missed its
+    settle callback; any other hold belongs to a rolled back transaction
+    and its units are given back. Returns the number of holds given back.
+    """
+    connection = _redis()
+    returned = 0
+    for token in connection.zrangebyscore(HOLDS_SET_KEY, '-inf', time.time() - timeout):
+        token = _decode(token)
+        reservation_ids = _decode(connection.hget(_hold_key(token), HOLD_RESERVATIONS_FIELD) or '')
+        reservation_ids = [pk for pk in reservation_ids.split(',') if pk]
+        if reservation_ids and StockReservation.objects.filter(pk__in=reservation_ids).exists():
+            settle_hold(token)
+        else:
+            return_hold(token)
+            returned += 1
+    if returned:
+        logger.warning(f"Gave back {returned} stock holds of rolled back transactions")
+    return returned
+
+
+def adjust(kind, changes):
+    """
+    Apply ``{pk: change}`` to cached counters of rows already updated in the database.
+    """
+    if not changes:
+        return
+    try:
+        connection = _redis()
+        script = connection.register_script(ADJUST_SCRIPT)
+        pipe = connection.pipeline()
+        for pk, change in changes.items():
+            script(keys=[_counter_key(kind, pk)], args=[change], client=pipe)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not adjust cached stock levels: {str(e)}")
+
+
+def forget(kind, pk):
+    """
+    Drop a cached counter so the next read reseeds it from the row.
+    """
+    try:
+        _redis().delete(_counter_key(kind, pk))
+    except Exception as e:
+        logger.warning(f"Could not drop cached stock level: {str(e)}")
+
+
+def _parse_member(member):
+    kind, pk = _decode(member).split(':', 1)
+    return kind, pk
+
+
+def _apply_deltas(kind, deltas):
+    model, field = TRACKED_MODELS[kind]
+    model.objects.filter(pk__in=list(deltas)).update(**{
+        field: Greatest(
+            F(field) + Case(*[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()], default=Value(0)),
+            Value(0),
+        )
+    })
+
+
+def flush_deltas():
+    """
+    Write pending deltas back to PostgreSQL, one UPDATE per model.
+
+    Deltas are popped atomically before the write and put back if it fails.
+    Returns the number of rows written.
+    """
+    connection = _redis()
+    with connection.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT):
+        pop = connection.register_script(POP_DELTA_SCRIPT)
+        pending = {}
+        for member in connection.smembers(DIRTY_SET_KEY):
+            kind, pk = _parse_member(member)
+            delta = pop(keys=[_delta_key(kind, pk), DIRTY_SET_KEY], args=[_member(kind, pk)])
+            if delta is not None and int(delta):
+                pending.setdefault(kind, {})[pk] = int(delta)
+
+        written = 0
+        for kind, deltas in pending.items():
+            try:
+                _apply_deltas(kind, deltas)
+                written += len(deltas)
+            except Exception:
+                restore = connection.register_script(RESTORE_DELTA_SCRIPT)
+                for pk, delta in deltas.items():
+                    restore(keys=[_delta_key(kind, pk), DIRTY_SET_KEY], args=[delta, _member(kind, pk)])
+                logger.exception(f"Could not flush {len(deltas)} {kind} stock deltas")
+        return written
+
+
+def _read_levels(connection, kind, pks):
+    """
+    Return ``{pk: (counter, delta)}`` for the seeded counters among ``pks``.
+    """
+    read = connection.register_script(READ_LEVEL_SCRIPT)
+    pipe = connection.pipeline()
+    for pk in pks:
+        read(keys=[_counter_key(kind, pk), _delta_key(kind, pk)], client=pipe)
+    return {pk: tuple(level) for pk, level in zip(pks, pipe.execute()) if level is not None}
+
+
+def _mismatches(connection, kind, pks):
+    """
+    Return ``{pk: (row value, counter, delta)}`` for counters that disagree with their row.
+
+    Forgets counters of deleted rows and untracks rows whose counter expired.
+    """
+    model, field = TRACKED_MODELS[kind]
+    rows = {str(pk): value for pk, value in model.objects.filter(pk__in=pks).values_list('pk', field)}
+    levels = _read_levels(connection, kind, pks)
+    mismatches = {}
+    for pk in pks:
+        if pk not in rows:
+            connection.delete(_counter_key(kind, pk), _delta_key(kind, pk))
+            connection.srem(TRACKED_SET_KEY, _member(kind, pk))
+        elif pk not in levels:
+            connection.srem(TRACKED_SET_KEY, _member(kind, pk))
+        elif levels[pk][0] - levels[pk][1] != rows[pk]:
+            mismatches[pk] = (rows[pk], *levels[pk])
+    return mismatches
+
+
+def reconcile(fix=True, recheck_delay=RECONCILE_RECHECK_DELAY):
+    """
+    Compare every cached counter with ``row value + pending delta``.
+
+    Runs under the flush lock, so no delta is being written back, and reads
+    each counter together with its delta, so concurrent takes (which move
+    both) cancel out. Rows that are not hot reach their counter only after
+    the writing transaction commits, so a mismatch counts as drift only if
+    the row and ``counter - delta`` are both unchanged ``recheck_delay``
+    seconds later. With ``fix`` the counter is then moved by the difference,
+    unless an adjustment landed in the meantime.
+
+    Returns a list of ``(kind, pk, cached, expected)`` for counters that drifted.
+    """
+    connection = _redis()
+    drifted = []
+    with connection.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT):
+        tracked = {}
+        for member in connection.smembers(TRACKED_SET_KEY):
+            kind, pk = _parse_member(member)
+            tracked.setdefault(kind, []).append(pk)
+
+        suspects = {kind: _mismatches(connection, kind, pks) for kind, pks in tracked.items()}
+        if any(suspects.values()):
+            time.sleep(recheck_delay)
+        fix_level = connection.register_script(FIX_LEVEL_SCRIPT)
+        for kind, first in suspects.items():
+            if not first:
+                continue
+            second = _mismatches(connection, kind, list(first))
+            for pk, (row, counter, delta) in second.items():
+                before_row, before_counter, before_delta = first[pk]
+                if (row, counter - delta) != (before_row, before_counter - before_delta):
+                    continue
+                drifted.append((kind, pk, counter, row + delta))
+                if fix:
+                    fix_level(
+                        keys=[_counter_key(kind, pk), _delta_key(kind, pk)],
+                        args=[counter - delta, row - (counter - delta)],
+                    )
+
+    for kind, pk, cached, expected in drifted:
+        logger.warning(f"Stock drift on {kind} {pk}: cached {cached}, expected {expected}")
+    return drifted
+
+
+def product_stock(products):
+    """
+    Return ``{product_pk: units in stock}`` from the cached inventory levels.
+
+    Products without inventory rows, or all of them when Redis is
+    unavailable, report their ``Product.stock`` column.
+    """
+    totals = {product.pk: product.stock for product in products}
+    rows = list(Inventory.objects.filter(product_variant__product_id__in=list(totals)).values_list(
+        'pk', 'product_variant__product_id', 'quantity'
+    ))
+    if not rows:
+        return totals
+    try:
+        levels = get_levels('inventory', [pk for pk, _, _ in rows])
+    except Exception as e:
+        logger.warning(f"Cached stock levels unavailable, reading the rows: {str(e)}")
+        levels = {}
+    for product_id in {product_id for _, product_id, _ in rows}:
+        totals[product_id] = 0
+    for pk, product_id, quantity in rows:
+        totals[product_id] += max(levels.get(pk, quantity), 0)
+    return totals
+
+
+def store_product_levels(store_products):
+    """
+    Return ``{store_product_pk: inventory level}``, falling back to the rows.
+    """
+    try:
+        return get_levels('store_product', [store_product.pk for store_product in store_products])
+    except Exception as e:
+        logger.warning(f"Cached stock levels unavailable, reading the rows: {str(e)}")
+        return {store_product.pk: store_product.inventory_level for store_product in store_products}
@@ -0,0 +1,238 @@
+"""
+In-memory prefix index backing the search-as-you-type endpoint.
+
+Each worker process holds its own ``PrefixIndex`` built from active product
+and category names. Changes made in this process are applied directly from
+the model signals and broadcast on a Redis pub/sub channel so the other
+workers can apply them too. If the channel is unavailable the index is
+rebuilt from the database once it is older than ``SUGGEST_INDEX_MAX_AGE``.
+"""
+import bisect
+import heapq
+import json
+import logging
+import threading
+import time
+import unicodedata
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_CHANNEL = 'suggest:updates'
+SUGGEST_INDEX_MAX_AGE = getattr(settings, 'SUGGEST_INDEX_MAX_AGE', 300)
+# Prefixes up to this many characters match the most keys, so their best
+# matches are kept ranked instead of being scanned on every lookup.
+TOP_PREFIX_LENGTH = 3
+# Matches kept per short prefix; the suggest endpoint returns at most 20.
+TOP_K = 20
+# Categories rank above products so broad completions come first.
+CATEGORY_SCORE = 1_000_000
+
+# Identifies this process so it can skip its own broadcasts.
+_ORIGIN = uuid.uuid4().hex
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def _keys_for(name):
+    """Every word-boundary suffix of the name, so "run sho" and "sho" both match "Running Shoes"."""
+    words = normalize(name).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+def _short_prefixes(key):
+    return {key[:length] for length in range(1, min(len(key), TOP_PREFIX_LENGTH) + 1)}
+
+
+def _rank(kind, pk, record):
+    """Sort key of an entry: highest score, then shortest name, then name."""
+    name, _, score = record
+    return (-score, len(name), name, kind, pk)
+
+
+class PrefixIndex:
+    """
+    Sorted array of ``(key, kind, id)`` tuples searched with ``bisect``.
+
+    Every prefix of up to ``TOP_PREFIX_LENGTH`` characters also keeps its
+    ``TOP_K`` best entries in rank order, so the short prefixes that match
+    most of the catalogue are answered without a scan. Longer prefixes scan
+    all of their matches, which are few.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = []
+        self._entries = {}
+        self._top = {}
+        self.built_at = 0.0
+
+    def build(self, entries):
+        """Replace the contents with ``(kind, id, name, slug, score)`` tuples."""
+        keys = []
+        records = {}
+        ranks = {}
+        for kind, pk, name, slug, score in entries:
+            records[(kind, pk)] = (name, slug, score)
+            ranks[(kind, pk)] = _rank(kind, pk, records[(kind, pk)])
+            keys.extend((key, kind, pk) for key in _keys_for(name))
+        keys.sort()
+        top = {}
+        for key, kind, pk in keys:
+            for prefix in _short_prefixes(key):
+                top.setdefault(prefix, set()).add(ranks[(kind, pk)])
+        top = {prefix: heapq.nsmallest(TOP_K, matches) for prefix, matches in top.items()}
+        with self._lock:
+            self._keys = keys
+            self._entries = records
+            self._top = top
+            self.built_at = time.monotonic()
+
+    def upsert(self, kind, pk, name, slug, score=0):
+        with self._lock:
+            self._remove_keys(kind, pk)
+            self._entries[(kind, pk)] = (name, slug, score)
+            rank = _rank(kind, pk, self._entries[(kind, pk)])
+            for key in _keys_for(name):
+                bisect.insort(self._keys, (key, kind, pk))
+                for prefix in _short_prefixes(key):
+                    self._offer(prefix, rank)
+
+    def remove(self, kind, pk):
+        with self._lock:
+            self._remove_keys(kind, pk)
+            self._entries.pop((kind, pk), None)
+
+    def _remove_keys(self, kind, pk):
+        record = self._entries.get((kind, pk))
+        if record is None:
+            return
+        prefixes = set()
+        for key in _keys_for(record[0]):
+            position = bisect.bisect_left(self._keys, (key, kind, pk))
+            if position < len(self._keys) and self._keys[position] == (key, kind, pk):
+                del self._keys[position]
+            prefixes |= _short_prefixes(key)
+        rank = _rank(kind, pk, record)
+        for prefix in prefixes:
+            if rank in self._top.get(prefix, ()):
+                # Refill from the keys, the next best entry may not be kept.
+                self._top[prefix] = self._scan(prefix, TOP_K)
+                if not self._top[prefix]:
+                    del self._top[prefix]
+
+    def _offer(self, prefix, rank):
+        ranked = self._top.setdefault(prefix, [])
+        position = bisect.bisect_left(ranked, rank)
+        if position < TOP_K and (position == len(ranked) or ranked[position] != rank):
+            ranked.insert(position, rank)
+            del ranked[TOP_K:]
+
+    def _scan(self, prefix, limit):
+        """The best ``limit`` entries with a key starting with ``prefix``, in rank order."""
+        matches = set()
+        position = bisect.bisect_left(self._keys, (prefix,))
+        while position < len(self._keys) and self._keys[position][0].startswith(prefix):
+            matches.add(self._keys[position][1:])
+            position += 1
+        return heapq.nsmallest(limit, (_rank(kind, pk, self._entries[(kind, pk)]) for kind, pk in matches))
+
+    def search(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        with self._lock:
+            if len(prefix) <= TOP_PREFIX_LENGTH and limit <= TOP_K:
+                ranked = self._top.get(prefix, [])[:limit]
+            else:
+                ranked = self._scan(prefix, limit)
+            return [
+                {'type': kind, 'id': pk, 'name': name, 'slug': self._entries[(kind, pk)][1]}
+                for _, _, name, kind, pk in ranked
+            ]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_index = PrefixIndex()
+_index_lock = threading.Lock()
+_subscriber = None
+
+
+def _load_entries():
+    from .models import Category, Product
+
+    for pk, name, slug in Category.objects.filter(is_active=True).values_list('id', 'name', 'slug'):
+        yield ('category', str(pk), name, slug, CATEGORY_SCORE)
+    for pk, name, slug, score in Product.objects.filter(is_active=True).values_list('id', 'name', 'slug', 'rating_count'):
+        yield ('product', str(pk), name, slug, score)
+
+
+def _apply_event(event):
+    if event.get('name') is None:
+        _index.remove(event['kind'], event['id'])
+    else:
+        _index.upsert(event['kind'], event['id'], event['name'], event['slug'], event.get('score', 0))
+
+
+def _redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def _subscribe():
+    def listen():
+        try:
+            pubsub = _redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(SUGGEST_CHANNEL)
+            for message in pubsub.listen():
+                event = json.loads(message['data'])
+                if event.get('origin') != _ORIGIN:
+                    _apply_event(event)
+        except Exception as e:
+            logger.warning(f"Suggestion index subscriber stopped: {str(e)}")
+
+    thread = threading.Thread(target=listen, name='suggest-subscriber', daemon=True)
+    thread.start()
+    return thread
+
+
+def get_suggestion_index():
+    """
+    Return this worker's index, building it on first use.
+
+    The index is rebuilt when it is older than ``SUGGEST_INDEX_MAX_AGE`` and
+    the pub/sub subscriber is not running to keep it current.
+    """
+    global _subscriber
+    with _index_lock:
+        subscribed = _subscriber is not None and _subscriber.is_alive()
+        stale = time.monotonic() - _index.built_at > SUGGEST_INDEX_MAX_AGE
+        if not _index.built_at or (stale and not subscribed):
+            if not subscribed:
+                _subscriber = _subscribe()
+            _index.build(_load_entries())
+    return _index
+
+
+def publish_change(kind, pk, name=None, slug=None, score=0):
+    """
+    Apply a change locally and broadcast it to the other workers.
+
+    ``name=None`` removes the entry.
+    """
+    event = {'kind': kind, 'id': str(pk), 'name': name, 'slug': slug, 'score': score, 'origin': _ORIGIN}
+    if _index.built_at:
+        _apply_event(event)
+    try:
+        _redis().publish(SUGGEST_CHANNEL, json.dumps(event))
+    except Exception as e:
+        logger.warning(f"Could not publish suggestion index update: {str(e)}")
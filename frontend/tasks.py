@@ -0,0 +1,53 @@
+from celery import shared_task
+from django.db import transaction
+from . import stock
+from .inventory import commit_reservations, release_expired_reservations
+from .loyalty import apply_all_pending_accruals, queue_order_points
+from .models import Order
+from .recommendations import add_order_to_user_recommendations, build_recommendations
+
+@shared_task
+def release_expired_stock_reservations():
+    return release_expired_reservations()
+
+@shared_task
+def flush_stock_deltas():
+    return stock.flush_deltas()
+
+@shared_task
+def return_stale_stock_holds():
+    return stock.return_stale_holds()
+
+@shared_task
+def reconcile_stock_levels():
+    return len(stock.reconcile())
+
+@shared_task
+def apply_loyalty_accruals():
+    return apply_all_pending_accruals()
+
+@shared_task
+def rebuild_recommendations():
+    return build_recommendations()
+
+@shared_task
+def process_paid_order(order_id):
+    """
+    Side effects of an order being paid: keep its stock, queue its loyalty
+    points and add it to the buyer's recommendations. Each step is safe to
+    repeat, so the task can run again for the same order.
+    """
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        return False
+    commit_reservations(order)
+    queue_order_points(order)
+    add_order_to_user_recommendations(order_id)
+    return True
+
+def order_paid(order_ids):
+    """
+    Queue ``process_paid_order`` for each order once the current transaction commits.
+    """
+    order_ids = [str(order_id) for order_id in order_ids]
+    transaction.on_commit(lambda: [process_paid_order.delay(order_id) for order_id in order_ids])
@@ -0,0 +1,62 @@
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from ..cart import Cart as SessionCart
+from ..models import Cart, CartItem, Category, Product, ProductVariant
+from ..services import CartService
+
+User = get_user_model()
+
+class CartBulkTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        self.variants = []
+        for i in range(3):
+            product = Product.objects.create(name=f'Product {i}', description='', price=10, category=category)
+            self.variants.append(ProductVariant.objects.create(product=product, name='Default', sku=f'SKU-{i}', price=10))
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product_variant=self.variants[0], quantity=1)
+        CartItem.objects.create(cart=cart, product_variant=self.variants[2], quantity=4)
+
+    def test_operations_are_applied_in_order(self):
+        first, second, third = (str(variant.id) for variant in self.variants)
+        response = self.client.post(reverse('frontend:cart-bulk'), {'operations': [
+            {'op': 'add', 'product_variant_id': first, 'quantity': 2},
+            {'op': 'add', 'product_variant_id': second, 'quantity': 1},
+            {'op': 'set', 'product_variant_id': second, 'quantity': 5},
+            {'op': 'remove', 'product_variant_id': third},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        quantities = dict(CartItem.objects.values_list('product_variant_id', 'quantity'))
+        self.assertEqual(quantities, {self.variants[0].id: 3, self.variants[1].id: 5})
+        self.assertEqual(Decimal(str(response.data['total'])), Decimal('80.00'))
+        self.assertEqual(len(response.data['cart_items']), 2)
+
+    def test_unknown_variant_rejects_the_whole_batch(self):
+        response = self.client.post(reverse('frontend:cart-bulk'), {'operations': [
+            {'op': 'add', 'product_variant_id': str(self.variants[0].id), 'quantity': 2},
+            {'op': 'add', 'product_variant_id': str(uuid.uuid4()), 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CartItem.objects.get(product_variant=self.variants[0]).quantity, 1)
+
+    def test_failed_session_cart_merge_keeps_the_items_and_the_login(self):
+        request = RequestFactory().post('/login/')
+        SessionMiddleware(lambda request: None).process_request(request)
+        session_cart = SessionCart(request)
+        session_cart.clear()
+        session_cart.add(self.variants[1], 2)
+        with patch.object(CartService, 'apply_operations', side_effect=RuntimeError('database unavailable')):
+            user_logged_in.send(sender=User, request=request, user=self.user)
+        self.assertEqual(session_cart.redis.hget(session_cart.key, str(self.variants[1].id)), b'2')
+        user_logged_in.send(sender=User, request=request, user=self.user)
+        self.assertEqual(CartItem.objects.get(cart__user=self.user, product_variant=self.variants[1]).quantity, 2)
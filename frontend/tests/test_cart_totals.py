@@ -0,0 +1,40 @@
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from ..models import Cart, CartItem, Category, Product, ProductVariant
+
+User = get_user_model()
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cart = Cart.objects.create(user=self.user)
+        for i, (price, quantity) in enumerate([('19.90', 2), ('5.00', 3)]):
+            product = Product.objects.create(name=f'Product {i}', description='', price=price, category=category)
+            variant = ProductVariant.objects.create(product=product, name='Default', sku=f'SKU-{i}', price=price)
+            CartItem.objects.create(cart=cart, product_variant=variant, quantity=quantity)
+
+    def test_lines_and_total_come_from_one_query(self):
+        with self.assertNumQueries(1):
+            lines, total = CartItem.lines_and_total(CartItem.objects.filter(cart__user=self.user))
+        self.assertEqual(total, Decimal('54.80'))
+        self.assertEqual(sorted(line.line_total for line in lines), [Decimal('15.00'), Decimal('39.80')])
+
+    def test_checkout_view_reports_line_and_grand_totals(self):
+        response = self.client.get(reverse('frontend:checkout-view'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(response.data['total'])), Decimal('54.80'))
+        self.assertEqual(
+            sorted(item['total_price'] for item in response.data['cart_items']),
+            ['15.00', '39.80'],
+        )
+
+    def test_cart_annotation_matches_line_totals(self):
+        cart = Cart.with_totals().get(user=self.user)
+        self.assertEqual(cart.item_count, 2)
+        self.assertEqual(cart.total_price, Decimal('54.80'))
@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from ..category_tree import get_category_tree
+from ..models import Category, Product
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clothing = Category.objects.create(name='Clothing', slug='clothing')
+        self.shoes = Category.objects.create(name='Shoes', slug='shoes', parent=self.clothing)
+        self.running = Category.objects.create(name='Running', slug='running', parent=self.shoes)
+        self.books = Category.objects.create(name='Books', slug='books')
+
+    def test_paths_follow_the_parent_chain(self):
+        self.assertEqual(self.running.path, f'{self.clothing.id.hex}/{self.shoes.id.hex}/{self.running.id.hex}/')
+        self.assertEqual(self.running.depth, 2)
+        self.assertEqual(self.running.get_ancestors(), [self.clothing, self.shoes])
+        self.assertEqual(set(self.clothing.get_descendants()), {self.shoes, self.running})
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.shoes.parent = self.books
+        self.shoes.save()
+        self.running.refresh_from_db()
+        self.assertTrue(self.running.path.startswith(self.books.path))
+        self.assertEqual(self.running.depth, 2)
+
+    def test_paths_stay_within_their_column(self):
+        leaf = self.running
+        for depth in range(3, Category.MAX_DEPTH + 1):
+            leaf = Category.objects.create(name=f'Level {depth}', slug=f'level-{depth}', parent=leaf)
+        self.assertLessEqual(len(leaf.path), Category._meta.get_field('path').max_length)
+        with self.assertRaises(ValueError):
+            Category.objects.create(name='Too deep', slug='too-deep', parent=leaf)
+        self.clothing.parent = self.books
+        with self.assertRaises(ValueError):
+            self.clothing.save()
+
+    def test_cannot_move_under_own_descendant(self):
+        self.clothing.parent = self.running
+        with self.assertRaises(ValueError):
+            self.clothing.save()
+
+    def test_snapshot_is_rebuilt_after_changes(self):
+        self.assertEqual(get_category_tree().ancestors(self.running), [self.clothing, self.shoes])
+        Category.objects.create(name='Trail', slug='trail', parent=self.running)
+        trail = get_category_tree().get_by_slug('trail')
+        self.assertEqual(get_category_tree().ancestors(trail), [self.clothing, self.shoes, self.running])
+
+    def test_products_filter_includes_subcategories(self):
+        Product.objects.create(name='Racer', description='', price=10, category=self.running)
+        Product.objects.create(name='Novel', description='', price=10, category=self.books)
+        response = APIClient().get(reverse('frontend:product-list'), {'category_tree': 'clothing'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['name'] for p in response.data['results']], ['Racer'])
@@ -0,0 +1,50 @@
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from ..models import Cart, CartItem, Category, Inventory, Order, Product, ProductVariant, Store
+from ..services import CheckoutError, OrderService
+
+User = get_user_model()
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Shoes', slug='shoes')
+        owner = User.objects.create_user(email='owner@example.com', username='owner', password='secret')
+        self.store = Store.objects.create(name='Main', description='', owner=owner)
+        self.sequence = 0
+
+    def fill_cart(self, user, lines, stock=10):
+        cart = Cart.objects.create(user=user)
+        for _ in range(lines):
+            self.sequence += 1
+            product = Product.objects.create(name=f'Product {self.sequence}', description='', price=5, category=self.category)
+            variant = ProductVariant.objects.create(product=product, name='Default', sku=f'SKU-{self.sequence}', price='12.50')
+            Inventory.objects.create(store=self.store, product_variant=variant, quantity=stock)
+            CartItem.objects.create(cart=cart, product_variant=variant, quantity=2)
+
+    def checkout_queries(self, lines):
+        user = User.objects.create_user(email=f'buyer{lines}@example.com', username=f'buyer{lines}', password='secret')
+        self.fill_cart(user, lines)
+        with CaptureQueriesContext(connection) as queries:
+            order = OrderService.checkout(user)
+        return order, len(queries)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        small_order, small = self.checkout_queries(2)
+        large_order, large = self.checkout_queries(12)
+        self.assertEqual(small, large)
+        self.assertEqual(large_order.total, Decimal('300.00'))
+        self.assertEqual(large_order.order_items.count(), 12)
+        self.assertFalse(CartItem.objects.filter(cart__user=large_order.user).exists())
+        self.assertEqual(set(Inventory.objects.filter(product_variant__order_items__order=large_order).values_list('quantity', flat=True)), {8})
+
+    def test_insufficient_stock_leaves_cart_and_inventory_untouched(self):
+        user = User.objects.create_user(email='buyer@example.com', username='buyer', password='secret')
+        self.fill_cart(user, 3, stock=1)
+        with self.assertRaises(CheckoutError):
+            OrderService.checkout(user)
+        self.assertEqual(CartItem.objects.filter(cart__user=user).count(), 3)
+        self.assertFalse(Order.objects.filter(user=user).exists())
+        self.assertEqual(set(Inventory.objects.values_list('quantity', flat=True)), {1})
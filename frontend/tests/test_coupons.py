@@ -0,0 +1,63 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from ..coupons import CouponError, get_coupon, redeem_coupon
+from ..models import Cart, CartItem, Category, Coupon, CouponRedemption, Product, ProductVariant
+from ..services import OrderService
+
+User = get_user_model()
+
+class CouponTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        self.coupon = Coupon.objects.create(
+            code='SAVE10', discount_percent=10, max_uses=2,
+            valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+        )
+        self.users = [
+            User.objects.create_user(email=f'user{i}@example.com', username=f'user{i}', password='secret')
+            for i in range(3)
+        ]
+
+    def test_redemptions_stop_at_max_uses(self):
+        redeem_coupon('SAVE10', self.users[0])
+        redeem_coupon('SAVE10', self.users[1])
+        with self.assertRaises(CouponError):
+            redeem_coupon('SAVE10', self.users[2])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_used, 2)
+        self.assertEqual(CouponRedemption.objects.filter(coupon=self.coupon).count(), 2)
+
+    def test_user_cannot_redeem_twice(self):
+        redeem_coupon('SAVE10', self.users[0])
+        with self.assertRaises(CouponError):
+            redeem_coupon('SAVE10', self.users[0])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_used, 1)
+
+    def test_lookups_are_cached_including_misses(self):
+        self.assertIsNone(get_coupon('GUESS'))
+        self.assertEqual(get_coupon('SAVE10'), self.coupon)
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_coupon('GUESS'))
+            self.assertEqual(get_coupon(' SAVE10 ').discount_percent, 10)
+        Coupon.objects.create(code='GUESS', discount_percent=5, valid_from=timezone.now(), valid_to=timezone.now())
+        self.assertIsNotNone(get_coupon('GUESS'))
+
+    def test_checkout_redeems_the_cart_coupon(self):
+        user = self.users[0]
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        product = Product.objects.create(name='Racer', description='', price=5, category=category)
+        variant = ProductVariant.objects.create(product=product, name='Default', sku='SKU-1', price='12.50')
+        cart = Cart.objects.create(user=user, coupon_code='SAVE10')
+        CartItem.objects.create(cart=cart, product_variant=variant, quantity=2)
+
+        order = OrderService.checkout(user)
+        self.assertEqual(order.total, Decimal('22.50'))
+        self.assertTrue(CouponRedemption.objects.filter(coupon=self.coupon, user=user, order=order).exists())
+        cart.refresh_from_db()
+        self.assertEqual(cart.coupon_code, '')
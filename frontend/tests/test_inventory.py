@@ -0,0 +1,60 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from ..inventory import InsufficientStock, commit_reservations, release_expired_reservations, reserve_stock
+from ..models import Category, Inventory, Order, Product, ProductVariant, StockReservation, Store
+
+User = get_user_model()
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.owner = owner = User.objects.create_user(email='owner@example.com', username='owner', password='secret')
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        product = Product.objects.create(name='Racer', description='', price=10, category=category)
+        self.variant = ProductVariant.objects.create(product=product, name='42', sku='RACER-42', price=10)
+        self.stores = [
+            Store.objects.create(name=f'Store {i}', description='', owner=owner) for i in range(2)
+        ]
+        Inventory.objects.create(store=self.stores[0], product_variant=self.variant, quantity=3)
+        Inventory.objects.create(store=self.stores[1], product_variant=self.variant, quantity=2)
+
+    def stock(self):
+        return sorted(Inventory.objects.values_list('quantity', flat=True))
+
+    def test_reservation_spans_stores_and_never_goes_negative(self):
+        reservations = reserve_stock({self.variant.id: 4})
+        self.assertEqual(sum(r.quantity for r in reservations), 4)
+        self.assertEqual(self.stock(), [0, 1])
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_stock({self.variant.id: 2})
+        self.assertEqual(raised.exception.variant_id, self.variant.id)
+        self.assertEqual(self.stock(), [0, 1])
+
+    def test_expired_reservations_are_released(self):
+        reserve_stock({self.variant.id: 5}, ttl=60)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_reservations(), 2)
+        self.assertEqual(self.stock(), [2, 3])
+        self.assertFalse(StockReservation.objects.filter(status=StockReservation.STATUS_HELD).exists())
+
+    def test_commit_takes_released_stock_again(self):
+        order = Order.objects.create(user=self.owner, total=40)
+        reserve_stock({self.variant.id: 4}, order=order, ttl=60)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        release_expired_reservations()
+        self.assertEqual(commit_reservations(order), 2)
+        self.assertEqual(self.stock(), [0, 1])
+        self.assertEqual(sum(order.stock_reservations.filter(status=StockReservation.STATUS_COMMITTED).values_list('quantity', flat=True)), 4)
+        self.assertFalse(order.stock_reservations.filter(status=StockReservation.STATUS_RELEASED).exists())
+
+    def test_commit_flags_order_when_released_stock_is_gone(self):
+        order = Order.objects.create(user=self.owner, total=40)
+        reserve_stock({self.variant.id: 4}, order=order, ttl=60)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        release_expired_reservations()
+        reserve_stock({self.variant.id: 3})
+        self.assertEqual(commit_reservations(order), 0)
+        order.refresh_from_db()
+        self.assertTrue(order.needs_review)
+        self.assertEqual(self.stock(), [0, 2])
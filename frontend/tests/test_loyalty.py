@@ -0,0 +1,44 @@
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from ..loyalty import apply_all_pending_accruals, queue_order_points, rebuild_balances, redeem_points
+from ..models import LoyaltyPointsEntry, Order, UserProfile
+
+User = get_user_model()
+
+class LoyaltyLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='secret')
+
+    def balance(self):
+        return UserProfile.objects.get(user=self.user).loyalty_points
+
+    def test_paid_orders_accrue_once_in_batches(self):
+        order = Order.objects.create(user=self.user, total=Decimal('42.90'))
+        with self.assertNumQueries(1):
+            queue_order_points(order)
+        queue_order_points(order)
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
+
+        self.assertEqual(apply_all_pending_accruals(), 1)
+        self.assertEqual(self.balance(), 42)
+        self.assertEqual(apply_all_pending_accruals(), 0)
+
+    def test_redemptions_cannot_overdraw(self):
+        queue_order_points(Order.objects.create(user=self.user, total=Decimal('10')))
+        apply_all_pending_accruals()
+        self.assertTrue(redeem_points(self.user, 6))
+        self.assertFalse(redeem_points(self.user, 6))
+        self.assertEqual(self.balance(), 4)
+        self.assertEqual(LoyaltyPointsEntry.objects.filter(user=self.user).count(), 2)
+
+    def test_profile_save_keeps_balance_and_ledger_rebuilds_it(self):
+        queue_order_points(Order.objects.create(user=self.user, total=Decimal('10')))
+        profile = UserProfile.objects.create(user=self.user)
+        apply_all_pending_accruals()
+        profile.bio = 'Hello'
+        profile.save()
+        self.assertEqual(self.balance(), 10)
+        UserProfile.objects.filter(user=self.user).update(loyalty_points=0)
+        rebuild_balances([self.user.pk])
+        self.assertEqual(self.balance(), 10)
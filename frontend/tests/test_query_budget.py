@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from ..models import Category, Product, Review
+from ..views import CategoryViewSet, ProductViewSet
+
+User = get_user_model()
+
+class QueryBudgetMixin:
+    """
+    Check views against the ``query_budgets`` declared on their viewset.
+    """
+    def assertWithinQueryBudget(self, viewset, action, url):
+        budget = viewset.query_budgets[action]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries), budget,
+            f"{viewset.__name__}.{action} ran {len(queries)} queries, budget is {budget}:\n"
+            + "\n".join(q['sql'] for q in queries.captured_queries),
+        )
+        return response
+
+class ProductQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Shoes', slug='shoes')
+        users = [
+            User.objects.create_user(email=f'user{i}@example.com', username=f'user{i}', password='secret')
+            for i in range(3)
+        ]
+        for i in range(20):
+            product = Product.objects.create(
+                name=f'Product {i}', description='', price=10, category=self.category
+            )
+            for user in users:
+                Review.objects.create(user=user, product=product, rating=5, comment='ok')
+
+    def test_product_list_stays_within_budget(self):
+        self.assertWithinQueryBudget(ProductViewSet, 'list', reverse('frontend:product-list'))
+
+    def test_featured_products_stay_within_budget(self):
+        self.assertWithinQueryBudget(ProductViewSet, 'featured', reverse('frontend:featured-products'))
+
+    def test_category_products_stay_within_budget(self):
+        self.assertWithinQueryBudget(
+            CategoryViewSet, 'products', reverse('frontend:category-products', args=[self.category.pk])
+        )
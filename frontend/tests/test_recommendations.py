@@ -0,0 +1,76 @@
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from ..models import Category, Order, OrderItem, Product, Recommendation
+from ..recommendations import (
+    add_order_to_user_recommendations, build_feature_matrix, build_recommendations, get_user_recommendations,
+)
+
+User = get_user_model()
+
+class RecommendationBuildTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        shoes = Category.objects.create(name='Shoes', slug='shoes')
+        books = Category.objects.create(name='Books', slug='books')
+        self.racer = Product.objects.create(name='Racer', description='', price=10, category=shoes)
+        self.trail = Product.objects.create(name='Trail', description='', price=10, category=shoes)
+        self.novel = Product.objects.create(name='Novel', description='', price=10, category=books)
+        self.atlas = Product.objects.create(name='Atlas', description='', price=10, category=books)
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='secret')
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, product=self.racer, price=10)
+        OrderItem.objects.create(order=order, product=self.novel, price=10)
+
+    def test_neighbours_are_ranked_by_category_then_co_purchase(self):
+        self.assertEqual(build_recommendations(k=2), 4)
+        ranked = list(Recommendation.objects.filter(product=self.racer).order_by('-score'))
+        self.assertEqual([r.recommended_product for r in ranked], [self.trail, self.novel])
+        self.assertFalse(Recommendation.objects.filter(product=self.racer, recommended_product=self.racer).exists())
+        self.assertFalse(Recommendation.objects.filter(product=self.racer, recommended_product=self.atlas).exists())
+
+    def test_crowded_ancestor_categories_are_not_features(self):
+        apparel = Category.objects.create(name='Apparel', slug='apparel')
+        hats = Category.objects.create(name='Hats', slug='hats', parent=apparel)
+        caps = Category.objects.create(name='Caps', slug='caps', parent=apparel)
+        products = [
+            (Product.objects.create(name=f'Hat {i}', description='', price=10, category=category).pk, category.pk)
+            for i, category in enumerate([hats, hats, caps])
+        ]
+        # No order contains these products, so every feature is a category.
+        with patch('frontend.recommendations.MAX_ANCESTOR_PRODUCTS', 2):
+            self.assertEqual(build_feature_matrix(products).getnnz(axis=1).tolist(), [1, 1, 1])
+        with patch('frontend.recommendations.MAX_ANCESTOR_PRODUCTS', 3):
+            self.assertEqual(build_feature_matrix(products).getnnz(axis=1).tolist(), [2, 2, 2])
+
+    def test_endpoint_serves_the_warm_cache(self):
+        build_recommendations(k=2)
+        url = reverse('frontend:product-recommendations', args=[self.racer.pk])
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertNumQueries(2):
+            response = client.get(url)
+        self.assertEqual([p['name'] for p in response.data], ['Trail', 'Novel'])
+
+    def test_user_recommendations_are_cached_and_updated_per_order(self):
+        build_recommendations(k=3)
+        shopper = User.objects.create_user(email='shopper@example.com', username='shopper', password='secret')
+        first = Order.objects.create(user=shopper)
+        OrderItem.objects.create(order=first, product=self.racer, price=10)
+        self.assertEqual(get_user_recommendations(shopper.pk)[0], self.trail.pk)
+
+        client = APIClient()
+        client.force_authenticate(shopper)
+        with self.assertNumQueries(1):
+            response = client.get(reverse('frontend:recommendations-for-user'))
+        self.assertEqual(response.data[0]['name'], 'Trail')
+
+        second = Order.objects.create(user=shopper)
+        OrderItem.objects.create(order=second, product=self.trail, price=10)
+        self.assertTrue(add_order_to_user_recommendations(second.pk))
+        self.assertNotIn(self.trail.pk, get_user_recommendations(shopper.pk))
+        # Redelivered payment events fold the same order in only once.
+        self.assertFalse(add_order_to_user_recommendations(second.pk))
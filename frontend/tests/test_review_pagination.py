@@ -0,0 +1,60 @@
+import base64
+import json
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from ..models import Category, Product, Review
+
+User = get_user_model()
+
+def encode(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+class ReviewCursorTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        self.product = Product.objects.create(name='Racer', description='', price=10, category=category)
+        now = timezone.now()
+        for i in range(25):
+            user = User.objects.create_user(email=f'user{i}@example.com', username=f'user{i}')
+            review = Review.objects.create(user=user, product=self.product, rating=5, comment='ok')
+            # Pairs of reviews share a timestamp, so pages must split ties by id.
+            Review.objects.filter(pk=review.pk).update(created_at=now - timedelta(minutes=i // 2))
+        self.url = reverse('frontend:reviews-by-product')
+
+    def get(self, **params):
+        return self.client.get(self.url, {'product_id': str(self.product.pk), **params})
+
+    def test_cursors_walk_every_review_once_and_back(self):
+        expected = [str(pk) for pk in Review.objects.order_by('-created_at', '-id').values_list('pk', flat=True)]
+        pages = []
+        response = self.get(page_size=10)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([review['id'] for review in response.data['results']])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+        second = self.client.get(self.get(page_size=10).data['next'])
+        previous = self.client.get(second.data['previous'])
+        self.assertEqual([review['id'] for review in previous.data['results']], pages[0])
+
+    def test_bad_cursors_are_not_found(self):
+        review = Review.objects.first()
+        cursors = [
+            'not-base64!',
+            encode(['v', 'id']),
+            encode({'v': review.created_at.isoformat()}),
+            encode({'v': 'yesterday', 'id': str(review.pk)}),
+            encode({'v': review.created_at.isoformat(), 'id': 'not-a-uuid'}),
+            encode({'v': None, 'id': str(review.pk)}),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get(cursor=cursor).status_code, 404)
@@ -0,0 +1,19 @@
+from django.test import TestCase
+from ..models import Category, Product
+from ..services import ProductService
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        for name in ('Running Shoes', 'Shoes', 'Boots'):
+            Product.objects.create(name=name, description='', price=10, category=category)
+
+    def names(self, query):
+        return [product.name for product in ProductService.search_products(query)]
+
+    def test_full_text_matches_are_ranked(self):
+        self.assertEqual(self.names('shoes'), ['Shoes', 'Running Shoes'])
+
+    def test_typos_fall_back_to_similar_names_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names('bots'), ['Boots'])
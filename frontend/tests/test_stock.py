@@ -0,0 +1,78 @@
+import threading
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase
+from .. import stock
+from ..inventory import reserve_stock
+from ..models import Category, Inventory, Product, ProductVariant, Store, StoreProduct
+
+User = get_user_model()
+
+class StockCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        owner = User.objects.create_user(email='owner@example.com', username='owner', password='secret')
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        self.product = Product.objects.create(name='Racer', description='', price=10, category=category)
+        self.variant = ProductVariant.objects.create(product=self.product, name='42', sku='RACER-42', price=10)
+        self.store = Store.objects.create(name='Main', description='', owner=owner)
+        self.row = Inventory.objects.create(store=self.store, product_variant=self.variant, quantity=5)
+        stock.mark_hot_skus([self.variant.id])
+
+    def level(self):
+        return stock.get_levels('inventory', [self.row.pk])[self.row.pk]
+
+    def test_concurrent_takes_never_go_below_zero(self):
+        results = []
+        barrier = threading.Barrier(20)
+
+        def take():
+            barrier.wait()
+            results.append(stock.take('inventory', self.row.pk, 1))
+
+        self.level()
+        threads = [threading.Thread(target=take) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(self.level(), 0)
+
+    def test_flush_applies_and_clears_deltas(self):
+        self.assertTrue(stock.take('inventory', self.row.pk, 2))
+        self.assertEqual(stock.flush_deltas(), 1)
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.quantity, 3)
+        self.assertEqual(self.level(), 3)
+        self.assertEqual(stock.flush_deltas(), 0)
+
+    def test_rolled_back_reservations_give_their_holds_back(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                reserve_stock({self.variant.id: 4})
+                self.assertEqual(self.level(), 1)
+                raise RuntimeError()
+        self.assertEqual(stock.return_stale_holds(timeout=0), 1)
+        self.assertEqual(self.level(), 5)
+        stock.flush_deltas()
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.quantity, 5)
+
+    def test_reconcile_fixes_drift(self):
+        self.level()
+        stock._redis().set(stock._counter_key('inventory', self.row.pk), 42)
+        drifted = stock.reconcile(recheck_delay=0)
+        self.assertEqual(drifted, [('inventory', str(self.row.pk), 42, 5)])
+        self.assertEqual(self.level(), 5)
+        self.assertEqual(stock.reconcile(recheck_delay=0), [])
+
+    def test_store_product_takes_are_written_back(self):
+        store_product = StoreProduct.objects.create(store=self.store, product=self.product, price=10, inventory_level=2)
+        self.assertTrue(stock.take('store_product', store_product.pk, 2))
+        self.assertFalse(stock.take('store_product', store_product.pk, 1))
+        stock.flush_deltas()
+        store_product.refresh_from_db()
+        self.assertEqual(store_product.inventory_level, 0)
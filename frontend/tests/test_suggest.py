@@ -0,0 +1,21 @@
+from django.test import SimpleTestCase
+from ..suggest import PrefixIndex
+
+class PrefixIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = PrefixIndex()
+        # Alphabetically first, lowest scored: a bounded scan would only see these.
+        entries = [('product', f'a{i}', f'Shoe Aa {i:03}', f'a-{i}', 0) for i in range(500)]
+        entries.append(('product', 'top', 'Shoe Zz', 'top', 50))
+        self.index.build(entries)
+
+    def test_best_match_wins_for_short_and_long_prefixes(self):
+        for prefix in ('s', 'sho', 'shoe', 'shoe z'):
+            self.assertEqual(self.index.search(prefix, 1)[0]['id'], 'top')
+
+    def test_updates_and_removals_keep_short_prefixes_ranked(self):
+        self.index.upsert('category', 'boots', 'Shoes', 'shoes', 100)
+        self.assertEqual([match['id'] for match in self.index.search('sh', 2)], ['boots', 'top'])
+        self.index.remove('category', 'boots')
+        self.index.remove('product', 'top')
+        self.assertEqual([match['id'] for match in self.index.search('sh', 2)], ['a0', 'a1'])
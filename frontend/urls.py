@@ -26,8 +26,11 @@ urlpatterns = [
     path('stores/<uuid:pk>/update-product/<uuid:product_pk>/', StoreViewSet.as_view({'put': 'update_product', 'patch': 'update_product'}), name='store-update-product'),
     path('stores/<uuid:pk>/remove-product/<uuid:product_pk>/', StoreViewSet.as_view({'delete': 'remove_product'}), name='store-remove-product'),
     path('featured-products/', ProductViewSet.as_view({'get': 'featured'}), name='featured-products'),
+    path('carts/', CartViewSet.as_view({'get': 'list'}), name='cart-list'),
     path('carts/add/', CartViewSet.as_view({'post': 'add'}), name='cart-add'),
     path('carts/remove/', CartViewSet.as_view({'post': 'remove'}), name='cart-remove'),
+    path('carts/bulk/', CartViewSet.as_view({'post': 'bulk'}), name='cart-bulk'),
+    path('carts/coupon/', CartViewSet.as_view({'post': 'coupon', 'delete': 'coupon'}), name='cart-coupon'),
     path('carts/clear/', CartViewSet.as_view({'post': 'clear'}), name='cart-clear'),
     path('orders/checkout/', OrderViewSet.as_view({'post': 'checkout'}), name='order-checkout'),
     path('orders/history/', OrderViewSet.as_view({'get': 'history'}), name='order-history'),
@@ -35,6 +38,7 @@ urlpatterns = [
     path('cart-items/<uuid:pk>/update-quantity/', CartItemViewSet.as_view({'put': 'update_quantity'}), name='update-cart-item-quantity'),
     path('cart-items/<uuid:pk>/remove-item/', CartItemViewSet.as_view({'delete': 'remove_item'}), name='remove-cart-item'),
     path('search/products/', SearchViewSet.as_view({'get': 'products'}), name='search-products'),
+    path('search/suggest/', SearchViewSet.as_view({'get': 'suggest'}), name='search-suggest'),
     path('contact/submit/', ContactViewSet.as_view({'post': 'submit'}), name='contact-submit'),
     path('checkout/view/', CheckoutViewSet.as_view({'get': 'view'}), name='checkout-view'),
     path('checkout/process/', CheckoutViewSet.as_view({'post': 'process'}), name='checkout-process'),
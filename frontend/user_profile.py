@@ -4,11 +4,23 @@ from django.utils.translation import gettext_lazy as _
 
 class UserProfile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    loyalty_points = models.PositiveIntegerField(default=0, verbose_name=_("Loyalty Points"))
+    loyalty_points = models.PositiveIntegerField(default=0, editable=False, verbose_name=_("Loyalty Points"))
     stripe_customer_id = models.CharField(max_length=255, blank=True, null=True, verbose_name=_("Stripe Customer ID"))
     bio = models.TextField(blank=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True)
     birth_date = models.DateField(null=True, blank=True)
-    
+
+    # Balance of the applied loyalty ledger entries, maintained with targeted
+    # UPDATEs by frontend.loyalty; a regular save must not write it back.
+    DERIVED_FIELDS = ('loyalty_points',)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return self.user.username
\ No newline at end of file
+        return self.user.username
@@ -1,6 +1,6 @@
 from django.contrib.auth import authenticate
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Avg, Q
+from django.db.models import F
 from django.db import transaction
 from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -13,7 +13,6 @@ from rest_framework.views import APIView
 from rest_framework import generics, viewsets, permissions, status, filters
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
@@ -25,39 +24,52 @@ from django_filters.rest_framework import DjangoFilterBackend
 
 from .models import (
     Category, Product, Store, StoreProduct, Cart, CartItem, Order, Review, 
-    Wishlist, Recommendation, UserProfile, PaymentStatus
+    Wishlist, Recommendation, UserProfile, PaymentStatus, CouponRedemption
 )
 from .serializers import (
-    CategorySerializer, ProductSerializer, StoreSerializer, StoreProductSerializer,
-    CartSerializer, CartItemSerializer, OrderSerializer, ReviewSerializer, 
+    CategorySerializer, ProductSerializer, ProductListSerializer, StoreSerializer, StoreProductSerializer,
+    CartSerializer, CartItemSerializer, CartBulkSerializer, OrderSerializer, ReviewSerializer, 
     WishlistSerializer, UserSerializer, UserProfileSerializer, StoreProductCreateSerializer, StoreProductUpdateSerializer
 )
-from .recommendations import generate_recommendations
+from .recommendations import get_product_recommendations, get_user_recommendations
+from .services import ProductService, CartService, OrderService, CheckoutError
+from .coupons import get_discount, get_valid_coupon, normalize_code
+from .tasks import order_paid
+from .suggest import get_suggestion_index
+from .category_tree import get_category_tree
+from . import stock
+from .cache import product_list_cache_key, PRODUCT_LIST_TIMEOUT
 from .filters import ProductFilter
+from .pagination import (
+    StandardResultsSetPagination, EstimatedCountPagination, KeysetPagination, ProductKeysetPagination
+)
 from .permissions import IsOwnerOrReadOnly
+from payments.gateways import GatewayUnavailable, call_gateway, call_paypal, paypal_api, stripe_client
 
 import stripe
 import json
 import paypalrestsdk
 import logging
+from decimal import Decimal
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
 
-# Configuração do PayPal
-# paypalrestsdk.configure({
-#     "mode": settings.PAYPAL_MODE,
-#     "client_id": settings.PAYPAL_CLIENT_ID,
-#     "client_secret": settings.PAYPAL_CLIENT_SECRET
-# })
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
 class BaseViewSet(viewsets.ModelViewSet):
     pagination_class = StandardResultsSetPagination
     throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    # Maximum number of SQL queries per action, e.g. {'list': 4}. Checked by
+    # the test suite (frontend/tests/test_query_budget.py), never at runtime.
+    query_budgets = {}
+
+    def get_queryset(self):
+        return self.setup_eager_loading(super().get_queryset())
+
+    def setup_eager_loading(self, queryset, serializer_class=None):
+        serializer_class = serializer_class or self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
 
     @swagger_auto_schema(
         operation_description="Retrieve a list of objects.",
@@ -98,25 +110,35 @@ class CategoryViewSet(BaseViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    query_budgets = {'products': 4, 'tree': 1}
 
     @swagger_auto_schema(
         operation_description="Get products for a specific category.",
-        responses={200: ProductSerializer(many=True)}
+        responses={200: ProductListSerializer(many=True)}
     )
     @action(detail=True, methods=['get'])
     def products(self, request, pk=None):
         category = self.get_object()
-        products = category.product_set.all()
+        products = self.setup_eager_loading(category.product_set.all(), ProductListSerializer)
         page = self.paginate_queryset(products)
         if page is not None:
-            serializer = ProductSerializer(page, many=True)
+            serializer = ProductListSerializer(page, many=True, context=self.get_serializer_context())
             return self.get_paginated_response(serializer.data)
-        serializer = ProductSerializer(products, many=True)
+        serializer = ProductListSerializer(products, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
 
+    @swagger_auto_schema(
+        operation_description="Get the nested tree of active categories for navigation menus.",
+        responses={200: "Nested categories"}
+    )
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        return Response(get_category_tree().as_nested())
+
 class StoreProductViewSet(BaseViewSet):
     queryset = StoreProduct.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    query_budgets = {'list': 5, 'by_store': 4}
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -125,6 +147,16 @@ class StoreProductViewSet(BaseViewSet):
             return StoreProductUpdateSerializer
         return StoreProductSerializer
 
+    @swagger_auto_schema(
+        operation_description="Retrieve a store product with its current inventory level.",
+        responses={200: StoreProductSerializer, 404: "Not Found"}
+    )
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        data = self.get_serializer(instance).data
+        data['inventory_level'] = stock.store_product_levels([instance])[instance.pk]
+        return Response(data)
+
     @swagger_auto_schema(
         operation_description="Get products for a specific store.",
         manual_parameters=[
@@ -136,7 +168,7 @@ class StoreProductViewSet(BaseViewSet):
     def by_store(self, request):
         store_id = request.query_params.get('store_id')
         if store_id:
-            queryset = self.queryset.filter(store_id=store_id)
+            queryset = self.get_queryset().filter(store_id=store_id)
             serializer = self.get_serializer(queryset, many=True)
             return Response(serializer.data)
         return Response({"error": "store_id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
@@ -160,9 +192,11 @@ class ProductDetailView(APIView):
         
         product_serializer = ProductSerializer(product)
         related_serializer = ProductSerializer(related_products, many=True)
-        
+
+        product_data = product_serializer.data
+        product_data['stock'] = stock.product_stock([product])[product.pk]
         data = {
-            'product': product_serializer.data,
+            'product': product_data,
             'related_products': related_serializer.data
         }
         return Response(data)
@@ -170,36 +204,56 @@ class ProductDetailView(APIView):
 class ProductViewSet(BaseViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = EstimatedCountPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_class = ProductFilter
-    search_fields = ['name', 'description']
-    ordering_fields = ['price', 'created_at']
+    ordering_fields = ['price', 'created_at', 'average_rating']
+    query_budgets = {'list': 4, 'featured': 4, 'retrieve': 6}
 
     def get_queryset(self):
-        queryset = cache.get('product_queryset')
-        if queryset is None:
-            queryset = self.queryset.select_related('category').prefetch_related('reviews')
-            category_id = self.request.query_params.get('category')
-            search_query = self.request.query_params.get('search')
-            
-            if category_id:
-                queryset = queryset.filter(category_id=category_id)
-            
-            if search_query:
-                queryset = queryset.filter(
-                    Q(name__icontains=search_query) | 
-                    Q(description__icontains=search_query)
-                )
-            
-            queryset = queryset.annotate(average_rating=Avg('reviews__rating'))
-            cache.set('product_queryset', queryset, 300)  # Cache for 5 minutes
-        
+        queryset = super().get_queryset()
+        category_id = self.request.query_params.get('category')
+        search_query = self.request.query_params.get('search')
+
+        if category_id:
+            queryset = queryset.filter(category_id=category_id)
+
+        if search_query:
+            queryset = ProductService.search_products(search_query, queryset)
+
         return queryset
 
+    @property
+    def paginator(self):
+        # Passing ?cursor (empty for the first page) switches to keyset pagination.
+        if 'cursor' in self.request.query_params:
+            self.pagination_class = ProductKeysetPagination
+        return super().paginator
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'featured'):
+            return ProductListSerializer
+        return ProductSerializer
+
+    @swagger_auto_schema(
+        operation_description="Retrieve a list of products.",
+        responses={200: ProductListSerializer(many=True)}
+    )
+    def list(self, request, *args, **kwargs):
+        cache_key = product_list_cache_key(request)
+        data = cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(cache_key, response.data, PRODUCT_LIST_TIMEOUT)
+        return response
+
     @swagger_auto_schema(
         operation_description="Get featured products.",
-        responses={200: ProductSerializer(many=True)}
+        responses={200: ProductListSerializer(many=True)}
     )
     @action(detail=False, methods=['get'])
     def featured(self, request):
@@ -221,11 +275,8 @@ class ProductViewSet(BaseViewSet):
     )
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        reviews = Review.objects.filter(product=instance)
-        review_serializer = ReviewSerializer(reviews, many=True)
-        data = serializer.data
-        data['reviews'] = review_serializer.data
+        data = self.get_serializer(instance).data
+        data['stock'] = stock.product_stock([instance])[instance.pk]
         return Response(data)
 
     @swagger_auto_schema(
@@ -317,9 +368,52 @@ class CartViewSet(viewsets.ViewSet):
         responses={200: CartItemSerializer(many=True)}
     )
     def list(self, request):
-        cart_items = CartItem.objects.filter(cart=request.user.cart)
-        total = sum(item.quantity * item.store_product.product.price for item in cart_items)
-        return Response({'cart_items': CartItemSerializer(cart_items, many=True).data, 'total': total})
+        return Response(self.get_cart_data(request.user))
+
+    def get_cart_data(self, user):
+        # The coupon code rides along on the lines: the cart table is already joined.
+        cart_items = CartItemSerializer.setup_eager_loading(
+            CartItem.objects.filter(cart__user=user).annotate(coupon_code=F('cart__coupon_code'))
+        )
+        cart_items, total = CartItem.lines_and_total(cart_items)
+        data = {'cart_items': CartItemSerializer(cart_items, many=True).data, 'total': total}
+        coupon_code = cart_items[0].coupon_code if cart_items else ''
+        if coupon_code:
+            coupon = get_valid_coupon(coupon_code)
+            discount = get_discount(coupon, total) if coupon else Decimal('0')
+            data.update(coupon={'code': coupon_code, 'valid': coupon is not None}, discount=discount, total=total - discount)
+        return data
+
+    @swagger_auto_schema(
+        method='post',
+        operation_description="Apply a coupon code to the cart. The coupon is redeemed at checkout.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'code': openapi.Schema(type=openapi.TYPE_STRING),
+            },
+        ),
+        responses={200: "Updated cart", 400: "Bad Request"}
+    )
+    @swagger_auto_schema(
+        method='delete',
+        operation_description="Remove the coupon code from the cart.",
+        responses={200: "Updated cart"}
+    )
+    @action(detail=False, methods=['post', 'delete'])
+    def coupon(self, request):
+        code = ''
+        if request.method == 'POST':
+            code = normalize_code(request.data.get('code'))
+            if get_valid_coupon(code) is None:
+                return Response({'error': 'Invalid or expired coupon code'}, status=status.HTTP_400_BAD_REQUEST)
+            if CouponRedemption.objects.filter(coupon__code=code, user=request.user).exists():
+                return Response({'error': 'You have already used this coupon'}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            cart = Cart.get_locked_for_user(request.user)
+            cart.coupon_code = code
+            cart.save(update_fields=['coupon_code', 'updated_at'])
+        return Response(self.get_cart_data(request.user))
 
     @swagger_auto_schema(
         operation_description="Add a product to the cart.",
@@ -379,6 +473,19 @@ class CartViewSet(viewsets.ViewSet):
             logger.error(f"Error removing product from cart: {str(e)}")
             return Response({'error': 'An unexpected error occurred'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @swagger_auto_schema(
+        operation_description="Apply a batch of add/set/remove operations to the cart in one transaction "
+                              "and return the recomputed cart.",
+        request_body=CartBulkSerializer,
+        responses={200: "Updated cart", 400: "Bad Request"}
+    )
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = CartBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        CartService.apply_operations(request.user, serializer.validated_data['operations'])
+        return Response(self.get_cart_data(request.user))
+
     @swagger_auto_schema(
         operation_description="Clear the cart.",
         responses={200: "Success", 404: "Not Found"}
@@ -401,44 +508,44 @@ class OrderViewSet(BaseViewSet):
         return self.queryset.filter(user=self.request.user)
 
     @swagger_auto_schema(
-        operation_description="Checkout the cart.",
+        operation_description="Checkout the cart: lock stock, copy prices into the order and empty the cart.",
         responses={200: "Success", 400: "Bad Request", 500: "Internal Server Error"}
     )
     @action(detail=False, methods=['post'])
     def checkout(self, request):
         try:
-            cart_items = CartItem.objects.filter(cart=request.user.cart)
-            if not cart_items.exists():
-                return Response({'error': 'Your cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-
-            order = Order.objects.create(user=request.user)
-            for item in cart_items:
-                order.items.add(item)
-                item.delete()
-
-            return Response({'success': True, 'order_id': order.id})
+            order = OrderService.checkout(request.user)
+            return Response({'success': True, 'order_id': order.id, 'total': order.total})
+        except CheckoutError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Error during checkout: {str(e)}")
             return Response({'error': 'An unexpected error occurred'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @swagger_auto_schema(
-        operation_description="Get order history.",
+        operation_description="Get order history, newest first, paginated by cursor.",
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Cursor from a previous page", type=openapi.TYPE_STRING),
+            openapi.Parameter('count', openapi.IN_QUERY, description="Include the total count", type=openapi.TYPE_BOOLEAN),
+        ],
         responses={200: OrderSerializer(many=True)}
     )
     @action(detail=False, methods=['get'])
     def history(self, request):
-        orders = self.get_queryset().order_by('-created_at')
+        paginator = KeysetPagination()
+        orders = paginator.paginate_queryset(self.get_queryset(), request, view=self)
         serializer = self.get_serializer(orders, many=True)
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
 class CartItemViewSet(BaseViewSet):
     queryset = CartItem.objects.all()
     serializer_class = CartItemSerializer
     permission_classes = [permissions.IsAuthenticated]
+    query_budgets = {'list': 2, 'my_cart_items': 1}
 
     def get_queryset(self):
         user = self.request.user
-        return CartItem.objects.filter(cart__user=user)
+        return CartItem.with_totals(super().get_queryset().filter(cart__user=user))
 
     @swagger_auto_schema(
         operation_description="Create a new cart item.",
@@ -450,8 +557,9 @@ class CartItemViewSet(BaseViewSet):
         serializer.is_valid(raise_exception=True)
         try:
             self.perform_create(serializer)
-            headers = self.get_success_headers(serializer.data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+            data = self.get_serializer(self.get_queryset().get(pk=serializer.instance.pk)).data
+            headers = self.get_success_headers(data)
+            return Response(data, status=status.HTTP_201_CREATED, headers=headers)
         except Exception as e:
             logger.error(f"Error creating cart item: {str(e)}")
             return Response({'error': 'An unexpected error occurred'}, status=status.HTTP_400_BAD_REQUEST)
@@ -477,7 +585,8 @@ class CartItemViewSet(BaseViewSet):
         serializer = self.get_serializer(cart_item, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        return Response(serializer.data)
+        # Re-read so the line and cart totals reflect the new quantity.
+        return Response(self.get_serializer(self.get_object()).data)
 
     @swagger_auto_schema(
         operation_description="Remove a cart item.",
@@ -490,23 +599,52 @@ class CartItemViewSet(BaseViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 class SearchViewSet(viewsets.ViewSet):
+    pagination_class = StandardResultsSetPagination
+
     @swagger_auto_schema(
         operation_description="Search for products.",
         manual_parameters=[
             openapi.Parameter('q', openapi.IN_QUERY, description="Search query", type=openapi.TYPE_STRING),
+            openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
         ],
-        responses={200: "Success"}
+        responses={200: ProductListSerializer(many=True)}
     )
     @action(detail=False, methods=['get'])
     def products(self, request):
-        query = request.GET.get('q')
-        if query:
-            products = Product.objects.filter(name__icontains=query)
-        else:
-            products = []
+        query = (request.GET.get('q') or '').strip()
+        if not query:
+            return Response({'query': query, 'count': 0, 'next': None, 'previous': None, 'products': []})
+
+        products = ProductListSerializer.setup_eager_loading(ProductService.search_products(query))
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = ProductListSerializer(page, many=True, context={'request': request})
         return Response({
             'query': query,
-            'products': [product.to_dict() for product in products]
+            'count': paginator.page.paginator.count,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'products': serializer.data,
+        })
+
+    @swagger_auto_schema(
+        operation_description="Autocomplete product and category names.",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, description="Prefix typed so far", type=openapi.TYPE_STRING),
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Maximum number of suggestions", type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: "Success"}
+    )
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        query = request.GET.get('q', '')
+        try:
+            limit = min(max(int(request.GET.get('limit', 10)), 1), 20)
+        except ValueError:
+            limit = 10
+        return Response({
+            'query': query,
+            'suggestions': get_suggestion_index().search(query, limit),
         })
     
 class ContactViewSet(viewsets.ViewSet):
@@ -552,10 +690,10 @@ class CheckoutViewSet(viewsets.ViewSet):
     )
     @action(detail=False, methods=['get'])
     def view(self, request):
-        cart_items = CartItem.objects.filter(cart=request.user.cart)
-        total = sum(item.quantity * item.product.price for item in cart_items)
+        cart_items = CartItemSerializer.setup_eager_loading(CartItem.objects.filter(cart__user=request.user))
+        cart_items, total = CartItem.lines_and_total(cart_items)
         return Response({
-            'cart_items': [item.to_dict() for item in cart_items],
+            'cart_items': CartItemSerializer(cart_items, many=True).data,
             'total': total
         })
 
@@ -581,7 +719,6 @@ class AboutViewSet(viewsets.ViewSet):
 def checkout(request):
     if request.method == "POST":
         try:
-            stripe.api_key = settings.STRIPE_SECRET_KEY
             data = json.loads(request.body)
             shipping_address = data.get("shippingAddress")
             payment_method = data.get("paymentMethod")
@@ -591,17 +728,20 @@ def checkout(request):
             # ...
 
             # Create a payment intent with Stripe
-            intent = stripe.PaymentIntent.create(
-                amount=1000,  # Amount in cents
-                currency="usd",
-                payment_method_types=["card"],
-                metadata={"shipping_address": shipping_address}
-            )
+            intent = call_gateway('stripe', stripe_client().payment_intents.create, params={
+                "amount": 1000,  # Amount in cents
+                "currency": "usd",
+                "payment_method_types": ["card"],
+                "metadata": {"shipping_address": shipping_address}
+            })
             
             return JsonResponse({"clientSecret": intent.client_secret})
         except stripe.error.CardError as e:
             logger.error(f"Stripe card error: {str(e)}")
             return JsonResponse({"error": str(e)}, status=400)
+        except GatewayUnavailable as e:
+            logger.warning(f"Checkout while Stripe is unavailable: {str(e)}")
+            return JsonResponse({"error": str(e)}, status=503)
         except Exception as e:
             logger.error(f"Unexpected error during checkout: {str(e)}")
             return JsonResponse({"error": "An unexpected error occurred"}, status=500)
@@ -629,7 +769,6 @@ def create_payment_intent(request):
 def stripe_webhook(request):
     payload = request.body
     sig_header = request.META['HTTP_STRIPE_SIGNATURE']
-    stripe.api_key = settings.STRIPE_SECRET_KEY
 
     try:
         event = stripe.Webhook.construct_event(
@@ -637,9 +776,10 @@ def stripe_webhook(request):
         )
         if event['type'] == 'payment_intent.succeeded':
             payment_intent = event['data']['object']
-            order = get_object_or_404(Order, stripe_payment_intent=payment_intent.id)
+            order = get_object_or_404(Order, stripe_payment_intent_id=payment_intent.id)
             order.payment_status = PaymentStatus.PAID.value
             order.save()
+            order_paid([order.pk])
         return HttpResponse(status=200)
     except ValueError as e:
         logger.error(f"Invalid payload: {str(e)}")
@@ -669,9 +809,9 @@ def paypal_create_payment(request):
                     },
                     "description": "This is the payment transaction description."
                 }]
-            })
+            }, api=paypal_api())
 
-            if payment.create():
+            if call_paypal(payment.create):
                 return JsonResponse({"paymentID": payment.id})
             else:
                 logger.error(f"Error creating PayPal payment: {payment.error}")
@@ -690,9 +830,9 @@ def paypal_execute_payment(request):
             payment_id = data.get('paymentID')
             payer_id = data.get('payerID')
 
-            payment = paypalrestsdk.Payment.find(payment_id)
+            payment = call_paypal(paypalrestsdk.Payment.find, payment_id, paypal_api())
             
-            if payment.execute({"payer_id": payer_id}):
+            if call_paypal(payment.execute, {"payer_id": payer_id}):
                 return JsonResponse({"success": True})
             else:
                 logger.error(f"Error executing PayPal payment: {payment.error}")
@@ -724,6 +864,8 @@ class ReviewViewSet(BaseViewSet):
         operation_description="Get reviews for a specific product.",
         manual_parameters=[
             openapi.Parameter('product_id', openapi.IN_QUERY, description="ID of the product", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Cursor from a previous page", type=openapi.TYPE_STRING),
+            openapi.Parameter('count', openapi.IN_QUERY, description="Include the total count", type=openapi.TYPE_BOOLEAN),
         ],
         responses={200: ReviewSerializer(many=True), 400: "Bad Request"}
     )
@@ -731,26 +873,22 @@ class ReviewViewSet(BaseViewSet):
     def by_product(self, request):
         product_id = request.query_params.get('product_id')
         if product_id:
-            reviews = self.queryset.filter(product_id=product_id)
+            paginator = KeysetPagination()
+            reviews = paginator.paginate_queryset(
+                self.get_queryset().filter(product_id=product_id), request, view=self
+            )
             serializer = self.get_serializer(reviews, many=True)
-            return Response(serializer.data)
+            return paginator.get_paginated_response(serializer.data)
         return Response({"error": "product_id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.update_product_average()
-
-    def update_product_average(self):
-        average = self.product.reviews.aggregate(Avg('rating'))['rating__avg']
-        self.product.average_rating = round(average, 2) if average else 0
-        self.product.save()
 
 class WishlistViewSet(BaseViewSet):
     queryset = Wishlist.objects.all()
     serializer_class = WishlistSerializer
     permission_classes = [permissions.IsAuthenticated]
+    query_budgets = {'list': 6, 'retrieve': 6}
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
 
     @swagger_auto_schema(
         operation_description="Add a product to the wishlist.",
@@ -785,51 +923,38 @@ class WishlistViewSet(BaseViewSet):
         wishlist_item.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-def get_recommendations(user):
-    # Simple recommendation system based on user's purchase history
-    user_orders = Order.objects.filter(user=user)
-    purchased_products = Product.objects.filter(orderitem__order__in=user_orders).distinct()
-    
-    # Get categories of purchased products
-    categories = Category.objects.filter(product__in=purchased_products).distinct()
-    
-    # Recommend products from the same categories that the user hasn't purchased yet
-    recommendations = Product.objects.filter(category__in=categories).exclude(id__in=purchased_products)
-    
-    return recommendations[:5]  # Return top 5 recommendations
-
 class RecommendationViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     @swagger_auto_schema(
-        operation_description="Get product recommendations for the user.",
-        responses={200: ProductSerializer(many=True)}
+        operation_description="Get product recommendations for the user, best first.",
+        responses={200: ProductListSerializer(many=True)}
     )
     @action(detail=False, methods=['get'])
     def for_user(self, request):
-        recommendations = get_recommendations(request.user)
-        serializer = ProductSerializer(recommendations, many=True)
+        ranked_ids = get_user_recommendations(request.user.pk, limit=5)
+        products = ProductListSerializer.setup_eager_loading(Product.objects.filter(is_active=True)).in_bulk(ranked_ids)
+        recommendations = [products[pk] for pk in ranked_ids if pk in products]
+        serializer = ProductListSerializer(recommendations, many=True, context={'request': request})
         return Response(serializer.data)
 
 @api_view(['GET'])
 def get_recommendations(request, product_id):
-    product = get_object_or_404(Product, pk=product_id)
-    
-    # Generate recommendations if they don't exist
-    if not product.recommendations.exists():
-        generate_recommendations(product)
-    
-    recommendations = product.recommendations.order_by('-score')[:5]  # Top 5 recommendations
-    recommended_products = [r.recommended_product for r in recommendations]
-    
+    # Precomputed by frontend.recommendations.build_recommendations; never generated here.
+    ranked = get_product_recommendations(product_id, limit=5)  # Top 5 recommendations
+    products = ProductSerializer.setup_eager_loading(Product.objects.filter(is_active=True)).in_bulk(
+        [recommended_id for recommended_id, _ in ranked]
+    )
+    recommended_products = [products[pk] for pk, _ in ranked if pk in products]
+
     serializer = ProductSerializer(recommended_products, many=True)
     return Response(serializer.data)
 
 @api_view(['GET'])
 def recommended_products(request):
     # This is a simple recommendation logic. You might want to implement a more sophisticated algorithm.
-    recommended = Product.objects.order_by('-average_rating')[:8]
-    serializer = ProductSerializer(recommended, many=True)
+    recommended = ProductListSerializer.setup_eager_loading(Product.objects.all()).order_by('-average_rating')[:8]
+    serializer = ProductListSerializer(recommended, many=True, context={'request': request})
     return Response(serializer.data)
 
 
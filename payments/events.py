@@ -0,0 +1,233 @@
+"""
+Two-stage webhook handling.
+
+The webhook views only verify the delivery and ``record_event`` it: one
+``INSERT ... ON CONFLICT DO NOTHING`` into ``WebhookEvent``, keyed by the
+gateway's event id, so retried deliveries cost a single cheap statement and
+the gateway gets its 200 right away, whatever state the rest of the database
+is in.
+
+``drain_events`` (Celery beat) applies the stored events in batches. Events
+are claimed with ``SKIP LOCKED`` so several workers can drain in parallel,
+grouped by ``transaction_id`` and folded in the order the gateway created
+them, then written with one ``bulk_update`` for the payments, one UPDATE per
+resulting order status and one ``bulk_update`` marking the events processed.
+Events whose payment does not exist yet (the webhook can beat the request
+that stores the transaction id) are retried on every drain until they are
+``PAYMENT_WEBHOOK_RETRY_WINDOW`` seconds old.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from frontend.models import Order
+from frontend.tasks import order_paid
+from .models import Payment, WebhookEvent
+from .transitions import apply_transitions
+
+logger = logging.getLogger(__name__)
+
+EVENT_BATCH_SIZE = 500
+# Drains run every few seconds, so give up by age rather than attempt count.
+EVENT_RETRY_WINDOW = datetime.timedelta(seconds=getattr(settings, 'PAYMENT_WEBHOOK_RETRY_WINDOW', 30 * 60))
+
+STRIPE_EVENT_STATUS = {
+    'payment_intent.succeeded': 'completed',
+    'payment_intent.payment_failed': 'failed',
+    'charge.refunded': 'refunded',
+}
+PAYPAL_EVENT_STATUS = {
+    'PAYMENT.CAPTURE.COMPLETED': 'completed',
+    'PAYMENT.CAPTURE.DENIED': 'failed',
+    'PAYMENT.CAPTURE.REFUNDED': 'refunded',
+}
+ORDER_STATUS_FOR_PAYMENT = {
+    'completed': 'processing',
+    'refunded': 'refunded',
+}
+
+
+def stripe_event_fields(payload):
+    """
+    Return ``(event_id, event_type, transaction_id, created_at)`` of a Stripe event.
+    """
+    obj = payload.get('data', {}).get('object', {})
+    if payload.get('type', '').startswith('charge.'):
+        transaction_id = obj.get('payment_intent') or ''
+    else:
+        transaction_id = obj.get('id') or ''
+    created = payload.get('created')
+    created_at = datetime.datetime.fromtimestamp(created, tz=datetime.timezone.utc) if created else None
+    return payload.get('id'), payload.get('type'), transaction_id, created_at
+
+
+def paypal_event_fields(payload):
+    """
+    Return ``(event_id, event_type, transaction_id, created_at)`` of a PayPal event.
+    """
+    resource = payload.get('resource', {})
+    transaction_id = resource.get('supplementary_data', {}).get('related_ids', {}).get('order_id') or ''
+    created_at = parse_datetime(payload['create_time']) if payload.get('create_time') else None
+    return payload.get('id'), payload.get('event_type'), transaction_id, created_at
+
+
+def record_event(gateway, payload):
+    """
+    Store a verified webhook delivery once. Returns False if it is not an event we act on.
+    """
+    handled = STRIPE_EVENT_STATUS if gateway == 'stripe' else PAYPAL_EVENT_STATUS
+    fields = stripe_event_fields if gateway == 'stripe' else paypal_event_fields
+    event_id, event_type, transaction_id, created_at = fields(payload)
+    if not event_id:
+        raise ValueError("Webhook event without an id")
+    if event_type not in handled:
+        return False
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(
+            gateway=gateway, event_id=event_id, event_type=event_type,
+            transaction_id=transaction_id, payload=payload, gateway_created_at=created_at,
+        )
+    ], ignore_conflicts=True)
+    return True
+
+
+def event_update(event):
+    """
+    Return ``(payment status, payment_data changes)`` for a stored event.
+    """
+    payload = event.payload
+    if event.gateway == 'stripe':
+        obj = payload['data']['object']
+        data = {'stripe_status': obj.get('status'), 'last_updated': obj.get('created')}
+        if event.event_type == 'payment_intent.payment_failed':
+            data['error'] = obj.get('last_payment_error')
+        elif event.event_type == 'charge.refunded':
+            refund = (obj.get('refunds', {}).get('data') or [{}])[0]
+            data = {
+                'refund_id': refund.get('id'),
+                'refund_amount': refund.get('amount'),
+                'refund_status': refund.get('status'),
+                'last_updated': obj.get('created'),
+            }
+        return STRIPE_EVENT_STATUS[event.event_type], data
+
+    resource = payload.get('resource', {})
+    status = PAYPAL_EVENT_STATUS[event.event_type]
+    data = {'paypal_status': status, 'last_updated': payload.get('create_time')}
+    if status == 'completed':
+        data['capture_id'] = resource.get('id')
+    return status, data
+
+
+def _notify(notifications):
+    from emails.tasks import send_payment_confirmation, send_payment_failed, send_refund_confirmation
+    tasks = {
+        'completed': send_payment_confirmation,
+        'failed': send_payment_failed,
+        'refunded': send_refund_confirmation,
+    }
+    for status, payment_id in notifications:
+        tasks[status].delay(payment_id)
+
+
+def settle(moved):
+    """
+    Follow up on applied transitions, given as ``(status, payment_id, order_id)`` in the order applied.
+
+    Orders move to the status of their payment's last transition with one
+    UPDATE per order status. Once the surrounding transaction commits, the
+    customer is notified of each transition and every order whose payment
+    completed gets its paid-order processing (``frontend.tasks.order_paid``).
+    """
+    orders = {}
+    paid = []
+    for status, _, order_id in moved:
+        if status in ORDER_STATUS_FOR_PAYMENT:
+            orders[order_id] = ORDER_STATUS_FOR_PAYMENT[status]
+        if status == 'completed':
+            paid.append(order_id)
+    by_status = {}
+    for order_id, order_status in orders.items():
+        by_status.setdefault(order_status, []).append(order_id)
+    now = timezone.now()
+    for order_status, order_ids in by_status.items():
+        Order.objects.filter(pk__in=order_ids).update(status=order_status, updated_at=now)
+    notifications = [(status, payment_id) for status, payment_id, _ in moved]
+    if notifications:
+        transaction.on_commit(lambda: _notify(notifications))
+    if paid:
+        order_paid(paid)
+
+
+@transaction.atomic
+def process_event_batch(batch_size=EVENT_BATCH_SIZE):
+    """
+    Apply one batch of pending events. Returns the number of events marked processed.
+
+    Events that were retried least come first, so events still waiting for
+    their payment do not hold up newer ones.
+    """
+    events = list(
+        WebhookEvent.objects.filter(processed_at__isnull=True)
+        .select_for_update(skip_locked=True)
+        .order_by('attempts', 'received_at')[:batch_size]
+    )
+    if not events:
+        return 0
+
+    by_transaction = {}
+    for event in events:
+        by_transaction.setdefault(event.transaction_id, []).append(event)
+    known = set(
+        Payment.objects.filter(transaction_id__in=[transaction_id for transaction_id in by_transaction if transaction_id])
+        .values_list('transaction_id', flat=True)
+    )
+
+    now = timezone.now()
+    steps = []
+    for transaction_id, group in by_transaction.items():
+        if transaction_id not in known:
+            for event in group:
+                event.attempts += 1
+                if now - event.received_at >= EVENT_RETRY_WINDOW:
+                    event.processed_at = now
+                    event.error = 'No payment for this transaction'
+                    logger.warning(f"Dropping {event.gateway} event {event.event_id}: no payment for {transaction_id!r}")
+            continue
+
+        group.sort(key=lambda event: (event.gateway_created_at or event.received_at, event.received_at))
+        for position, event in enumerate(group):
+            if position == len(steps):
+                steps.append({})
+            status, data = event_update(event)
+            steps[position].setdefault(status, []).append((transaction_id, data, event.event_id))
+            event.processed_at = now
+
+    # The n-th event of every payment is applied before any (n+1)-th one;
+    # events the state machine rejects (duplicates, late arrivals) are no-ops.
+    moved = []
+    for step in steps:
+        for status, changes in step.items():
+            moved.extend(
+                (status, payment_id, order_id)
+                for payment_id, order_id, _ in apply_transitions(status, changes, source='webhook')
+            )
+    settle(moved)
+    WebhookEvent.objects.bulk_update(events, ['processed_at', 'attempts', 'error'])
+    return sum(1 for event in events if event.processed_at)
+
+
+def drain_events(batch_size=EVENT_BATCH_SIZE):
+    """
+    Apply pending events until a batch is not fully processed. Returns the number processed.
+    """
+    handled = 0
+    while True:
+        batch = process_event_batch(batch_size)
+        handled += batch
+        if batch < batch_size:
+            return handled
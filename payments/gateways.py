@@ -0,0 +1,229 @@
+"""
+Process-wide payment gateway clients.
+
+The SDKs used to be reconfigured on every ``StripeService()`` /
+``PayPalService()`` and every PayPal payment, with no HTTP timeout, so each
+call paid for a new connection (and, for PayPal, a new OAuth token) and a
+slow gateway could hold a worker for as long as it liked. Instead there is
+one client per gateway per process:
+
+* ``stripe_client()``: a ``stripe.StripeClient`` whose ``RequestsClient``
+  keeps one keep-alive session per thread, with ``PAYMENT_GATEWAY_TIMEOUT``
+  on every request and the SDK's own jittered retries on network errors
+  (requests carry idempotency keys, so retried POSTs are safe).
+* ``paypal_api()``: a ``paypalrestsdk.Api`` that sends its requests through
+  per-thread pooled ``requests`` sessions with the same timeout and keeps
+  its OAuth token between calls. ``with_retries`` retries calls with full
+  jitter; PayPal resources reuse their ``PayPal-Request-Id`` on a retry.
+
+``STRIPE_API_BASE`` and ``PAYPAL_API_BASE`` point the clients somewhere
+else, such as ``payments.simulator``; call ``cache_clear()`` on the client
+functions after changing them.
+
+Every gateway call goes through the gateway's ``CircuitBreaker``. After
+``PAYMENT_GATEWAY_BREAKER_THRESHOLD`` consecutive failures (network errors
+and 5xx, not declined payments) it opens and calls fail at once with
+``GatewayUnavailable`` for ``PAYMENT_GATEWAY_BREAKER_RESET`` seconds, then a
+single trial call decides whether it closes again. ``gateway_metrics``
+exports the breakers' state and counters.
+"""
+import functools
+import logging
+import random
+import threading
+import time
+
+import paypalrestsdk
+import requests
+import stripe
+from django.conf import settings
+from paypalrestsdk.exceptions import ServerError as PayPalServerError
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+GATEWAY_TIMEOUT = getattr(settings, 'PAYMENT_GATEWAY_TIMEOUT', 10)
+GATEWAY_RETRIES = getattr(settings, 'PAYMENT_GATEWAY_RETRIES', 2)
+GATEWAY_POOL_SIZE = getattr(settings, 'PAYMENT_GATEWAY_POOL_SIZE', 10)
+BREAKER_THRESHOLD = getattr(settings, 'PAYMENT_GATEWAY_BREAKER_THRESHOLD', 5)
+BREAKER_RESET = getattr(settings, 'PAYMENT_GATEWAY_BREAKER_RESET', 30)
+RETRY_BASE_DELAY = 0.2
+
+STRIPE_FAILURES = (stripe.error.APIConnectionError, stripe.error.APIError, stripe.error.RateLimitError)
+PAYPAL_FAILURES = (PayPalServerError, requests.RequestException)
+
+
+class GatewayUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a gateway keeps failing.
+
+    ``failures`` are the exceptions that count against the gateway; any
+    other exception (a declined card, a missing resource) is the caller's
+    problem and counts as a healthy response.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failures, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.name = name
+        self.failures = failures
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.counters = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._trial_running):
+                self.counters['rejected'] += 1
+                return False
+            if self.state == self.HALF_OPEN:
+                self._trial_running = True
+            self.counters['calls'] += 1
+            return True
+
+    def _record(self, failed):
+        with self._lock:
+            self._trial_running = False
+            if not failed:
+                if self.state != self.CLOSED:
+                    logger.info(f"{self.name} circuit closed")
+                self.state = self.CLOSED
+                self.consecutive_failures = 0
+                return
+            self.counters['failures'] += 1
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.threshold:
+                if self.state != self.OPEN:
+                    self.counters['opened'] += 1
+                    logger.warning(f"{self.name} circuit opened after {self.consecutive_failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        if not self._admit():
+            raise GatewayUnavailable(f"{self.name} is unavailable, try again later")
+        try:
+            result = func(*args, **kwargs)
+        except self.failures:
+            self._record(failed=True)
+            raise
+        except Exception:
+            self._record(failed=False)
+            raise
+        self._record(failed=False)
+        return result
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'open_for': time.monotonic() - self.opened_at if self.state != self.CLOSED else 0.0,
+                **self.counters,
+            }
+
+
+BREAKERS = {
+    'stripe': CircuitBreaker('stripe', STRIPE_FAILURES),
+    'paypal': CircuitBreaker('paypal', PAYPAL_FAILURES),
+}
+
+
+def call_gateway(gateway, func, *args, **kwargs):
+    """
+    Call ``func`` through the gateway's circuit breaker.
+    """
+    return BREAKERS[gateway].call(func, *args, **kwargs)
+
+
+def with_retries(func, retryable, retries=GATEWAY_RETRIES, base_delay=RETRY_BASE_DELAY):
+    """
+    Return ``func`` retried on ``retryable`` exceptions, sleeping a random
+    time up to ``base_delay * 2 ** attempt`` in between.
+    """
+    @functools.wraps(func)
+    def retried(*args, **kwargs):
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except retryable:
+                if attempt == retries:
+                    raise
+                time.sleep(random.uniform(0, base_delay * 2 ** attempt))
+    return retried
+
+
+def call_paypal(func, *args, **kwargs):
+    """
+    Call a PayPal SDK function with retries, through the PayPal circuit breaker.
+    """
+    return call_gateway('paypal', with_retries(func, PAYPAL_FAILURES), *args, **kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def stripe_client():
+    api_base = getattr(settings, 'STRIPE_API_BASE', None)
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY,
+        http_client=stripe.RequestsClient(timeout=GATEWAY_TIMEOUT),
+        max_network_retries=GATEWAY_RETRIES,
+        base_addresses={'api': api_base} if api_base else {},
+    )
+
+
+class PooledPayPalApi(paypalrestsdk.Api):
+    """
+    ``paypalrestsdk.Api`` over per-thread keep-alive sessions, with a timeout on every request.
+    """
+    def __init__(self, options, timeout=GATEWAY_TIMEOUT, pool_size=GATEWAY_POOL_SIZE):
+        super().__init__(options)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._local.session = session
+        return session
+
+    def http_call(self, url, method, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        response = self.session.request(method, url, proxies=self.proxies, **kwargs)
+        return self.handle_response(response, response.content.decode('utf-8'))
+
+
+@functools.lru_cache(maxsize=None)
+def paypal_api():
+    options = {
+        'mode': settings.PAYPAL_MODE,
+        'client_id': settings.PAYPAL_CLIENT_ID,
+        'client_secret': settings.PAYPAL_CLIENT_SECRET,
+    }
+    if getattr(settings, 'PAYPAL_API_BASE', None):
+        options['endpoint'] = settings.PAYPAL_API_BASE
+    return PooledPayPalApi(options)
+
+
+def gateway_metrics():
+    """
+    Return ``{gateway: breaker metrics}``.
+    """
+    return {name: breaker.metrics() for name, breaker in BREAKERS.items()}
@@ -0,0 +1,197 @@
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from itertools import cycle
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count, Max
+from django.test import RequestFactory, override_settings
+
+from frontend.models import Order
+from payments.events import drain_events
+from payments.gateways import gateway_metrics, paypal_api, stripe_client
+from payments.models import Payment, PaymentTransition, WebhookEvent
+from payments.reconciliation import reconcile_payments
+from payments.simulator import GatewaySimulator
+from payments.tasks import process_payment
+from payments.transitions import inconsistent_payments
+from payments.webhooks import PayPalWebhookView, StripeWebhookView
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0.0
+
+
+def latency_line(name, latencies, elapsed):
+    if not latencies:
+        return f"{name}: none"
+    return (
+        f"{name}: {len(latencies)} in {elapsed:.2f}s ({len(latencies) / elapsed:.0f}/s), "
+        f"p50 {statistics.median(latencies) * 1000:.1f}ms, p99 {percentile(latencies, 0.99) * 1000:.1f}ms"
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Run throwaway payments end to end against the local gateway simulator: process_payment from '
+        'many threads, signed webhooks into the webhook views while the queue is drained as beat would, '
+        'then reconciliation for the payments whose webhooks were lost. Reports p50/p99 latencies and '
+        'payments per second. PayPal deliveries skip the signature check, which the simulator cannot satisfy. '
+        'Writes to the configured database; everything it creates is deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=1000, help='Payments to process.')
+        parser.add_argument('--threads', type=int, default=16, help='Threads calling process_payment.')
+        parser.add_argument('--methods', default='credit_card,paypal', help='Payment methods, used in turn.')
+        parser.add_argument('--latency-ms', type=float, default=50, help='Mean latency of each gateway call.')
+        parser.add_argument('--jitter-ms', type=float, default=20, help='Gateway latency varies by up to this much.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of gateway calls answered with a 500.')
+        parser.add_argument('--failure-rate', type=float, default=0.05, help='Share of payments that fail.')
+        parser.add_argument('--settle-ms', type=float, default=200, help='Time until a payment settles.')
+        parser.add_argument('--webhook-loss-rate', type=float, default=0.05, help='Share of webhooks never sent.')
+        parser.add_argument('--duplicate-rate', type=float, default=0.1, help='Share of webhooks sent twice.')
+        parser.add_argument('--drain-interval', type=float, default=0.5, help='Seconds between webhook queue drains.')
+
+    def handle(self, *args, **options):
+        methods = options['methods'].split(',')
+        factory = RequestFactory()
+        webhook_views = {'stripe': StripeWebhookView.as_view(), 'paypal': PayPalWebhookView.as_view()}
+        webhook_latencies = []
+
+        def deliver(gateway, body, headers):
+            meta = {
+                f"HTTP_{key.upper().replace('-', '_')}": value
+                for key, value in headers.items() if key != 'Content-Type'
+            }
+            request = factory.post(
+                f'/api/payments/webhooks/{gateway}/', data=body, content_type='application/json', **meta
+            )
+            started = time.perf_counter()
+            response = webhook_views[gateway](request)
+            webhook_latencies.append(time.perf_counter() - started)
+            return response.status_code
+
+        simulator = GatewaySimulator(
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+            failure_rate=options['failure_rate'],
+            settle_delay=options['settle_ms'] / 1000,
+            webhook=deliver,
+            webhook_loss_rate=options['webhook_loss_rate'],
+            duplicate_rate=options['duplicate_rate'],
+        )
+        url = simulator.start()
+        run = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create(
+            username=f'bench-{run}', email=f'bench-{run}@example.com', password=make_password(None)
+        )
+        try:
+            with override_settings(STRIPE_API_BASE=url, PAYPAL_API_BASE=url), \
+                    patch('payments.webhooks.verify_paypal_webhook', return_value=True):
+                stripe_client.cache_clear()
+                paypal_api.cache_clear()
+                self.benchmark(options, methods, user, simulator, webhook_latencies)
+        finally:
+            simulator.stop()
+            stripe_client.cache_clear()
+            paypal_api.cache_clear()
+            transaction_ids = Payment.objects.filter(order__user=user).exclude(transaction_id='').values_list(
+                'transaction_id', flat=True
+            )
+            WebhookEvent.objects.filter(transaction_id__in=list(transaction_ids)).delete()
+            user.delete()
+
+    def benchmark(self, options, methods, user, simulator, webhook_latencies):
+        count, threads = options['payments'], options['threads']
+        orders = Order.objects.bulk_create([Order(user=user, total=Decimal('10.00')) for _ in range(count)])
+        payments = Payment.objects.bulk_create([
+            Payment(order=order, amount=order.total, payment_method=method, status='pending')
+            for order, method in zip(orders, cycle(methods))
+        ])
+        payment_ids = [payment.pk for payment in payments]
+
+        stop_draining = threading.Event()
+
+        def drain_like_beat():
+            try:
+                while not stop_draining.wait(options['drain_interval']):
+                    drain_events()
+            finally:
+                connections.close_all()
+
+        process_latencies = []
+        started_at = {}
+
+        def process(batch):
+            try:
+                for payment_id in batch:
+                    started_at[payment_id] = time.time()
+                    started = time.perf_counter()
+                    process_payment(payment_id)
+                    process_latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        drainer = threading.Thread(target=drain_like_beat, daemon=True)
+        drainer.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(process, [payment_ids[i::threads] for i in range(threads)]))
+        processed = time.perf_counter()
+        if not simulator.wait_for_webhooks(timeout=max(60, count / 10)):
+            self.stderr.write('Timed out waiting for the simulator to send its webhooks.')
+        stop_draining.set()
+        drainer.join()
+        drain_events()
+        webhooks_done = time.perf_counter()
+
+        # Whatever the webhooks left processing has settled at the gateway by now.
+        time.sleep(options['settle_ms'] / 1000)
+        report = reconcile_payments(sorted(set(methods)), min_age=timedelta(0))
+        finished = time.perf_counter()
+
+        settled_at = dict(
+            PaymentTransition.objects.filter(payment_id__in=payment_ids, to_status__in=['completed', 'failed'])
+            .values_list('payment_id').annotate(last=Max('created_at'))
+        )
+        settle_latencies = [
+            max(0.0, settled.timestamp() - started_at[payment_id]) for payment_id, settled in settled_at.items()
+        ]
+        statuses = dict(
+            Payment.objects.filter(pk__in=payment_ids).values_list('status').annotate(n=Count('pk'))
+        )
+        inconsistent = inconsistent_payments(payment_ids)
+        elapsed = finished - started
+
+        self.stdout.write('\n'.join([
+            latency_line('process_payment', process_latencies, processed - started),
+            latency_line('webhook view', webhook_latencies, webhooks_done - started),
+            f"reconciliation: {finished - webhooks_done - options['settle_ms'] / 1000:.2f}s, "
+            + ', '.join(f"{method} checked {m['checked']} moved {m['moved']} errors {m['errors']}" for method, m in report.items()),
+            f"end to end: {len(settled_at)} of {count} payments settled in {elapsed:.2f}s "
+            f"({len(settled_at) / elapsed:.1f} payments/s), settle latency p50 "
+            f"{statistics.median(settle_latencies) if settle_latencies else 0.0:.2f}s, "
+            f"p99 {percentile(settle_latencies, 0.99):.2f}s",
+            'statuses: ' + ', '.join(f'{status} {n}' for status, n in sorted(statuses.items())),
+            'simulator: ' + ', '.join(f'{key} {value}' for key, value in simulator.stats.items()),
+            'circuit breakers: ' + ', '.join(
+                f"{name} {m['state']} (failures {m['failures']}, rejected {m['rejected']})"
+                for name, m in gateway_metrics().items()
+            ),
+        ]))
+        if inconsistent:
+            raise CommandError(f'{len(inconsistent)} payments have an inconsistent transition history.')
+        if not options['error_rate'] and statuses.keys() - {'completed', 'failed'}:
+            raise CommandError('Payments were left unsettled without any gateway errors.')
+        self.stdout.write(self.style.SUCCESS('All payments settled consistently.'))
@@ -0,0 +1,137 @@
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+
+from frontend.models import Order
+from payments.events import drain_events, event_update, record_event
+from payments.models import Payment, PaymentTransition, WebhookEvent
+from payments.transitions import apply_transitions, inconsistent_payments
+
+
+def stripe_payload(event_id, event_type, intent_id, created):
+    if event_type == 'charge.refunded':
+        obj = {
+            'id': f'ch_{intent_id}', 'payment_intent': intent_id, 'created': created,
+            'refunds': {'data': [{'id': f're_{intent_id}', 'amount': 100, 'status': 'succeeded'}]},
+        }
+    else:
+        obj = {'id': intent_id, 'status': 'succeeded', 'created': created}
+    return {'id': event_id, 'type': event_type, 'created': created, 'data': {'object': obj}}
+
+
+def event_stream(intent_id, rng, duplicates):
+    """
+    The events the gateway could send for one payment, each delivered 1 to ``duplicates`` times.
+
+    A payment may fail once before it succeeds and may be refunded after.
+    """
+    types = ['payment_intent.succeeded']
+    if rng.random() < 0.3:
+        types.insert(0, 'payment_intent.payment_failed')
+    if rng.random() < 0.3:
+        types.append('charge.refunded')
+    created = int(time.time())
+    return [
+        stripe_payload(f'evt_{intent_id}_{position}', event_type, intent_id, created + position)
+        for position, event_type in enumerate(types)
+        for _ in range(rng.randint(1, duplicates))
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay shuffled, duplicated Stripe event streams for throwaway payments from many threads '
+        'and check the payment state machine kept every history consistent. Writes to the configured '
+        'database; everything it creates is deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent threads.')
+        parser.add_argument('--payments', type=int, default=500, help='Payments to replay events for.')
+        parser.add_argument('--duplicates', type=int, default=3, help='Maximum deliveries of each event.')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for the shuffles.')
+        parser.add_argument(
+            '--via-queue', action='store_true',
+            help='Record the events and drain them from every thread instead of applying them directly.',
+        )
+
+    def handle(self, *args, **options):
+        threads, count = options['threads'], options['payments']
+        rng = random.Random(options['seed'])
+        run = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create(
+            username=f'replay-{run}', email=f'replay-{run}@example.com', password=make_password(None)
+        )
+        orders = Order.objects.bulk_create([Order(user=user, total=Decimal('10.00')) for _ in range(count)])
+        payments = Payment.objects.bulk_create([
+            Payment(
+                order=order, amount=order.total, payment_method='credit_card',
+                status='processing', transaction_id=f'pi_{run}_{i}',
+            )
+            for i, order in enumerate(orders)
+        ])
+        streams = {payment.transaction_id: event_stream(payment.transaction_id, rng, options['duplicates']) for payment in payments}
+        deliveries = [payload for stream in streams.values() for payload in stream]
+        rng.shuffle(deliveries)
+
+        def apply(batch):
+            try:
+                for payload in batch:
+                    event = WebhookEvent(gateway='stripe', event_id=payload['id'], event_type=payload['type'], payload=payload)
+                    obj = payload['data']['object']
+                    status, data = event_update(event)
+                    apply_transitions(status, [(obj.get('payment_intent') or obj['id'], data, event.event_id)], source='replay')
+            finally:
+                connections.close_all()
+
+        def record_and_drain(batch):
+            try:
+                for payload in batch:
+                    record_event('stripe', payload)
+                drain_events(batch_size=50)
+            finally:
+                connections.close_all()
+
+        payment_ids = [payment.pk for payment in payments]
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                worker = record_and_drain if options['via_queue'] else apply
+                list(executor.map(worker, [deliveries[i::threads] for i in range(threads)]))
+            if options['via_queue']:
+                drain_events()
+            elapsed = time.perf_counter() - started
+
+            statuses = dict(Payment.objects.filter(pk__in=payment_ids).values_list('transaction_id', 'status'))
+            transitions = PaymentTransition.objects.filter(payment_id__in=payment_ids)
+            repeated = transitions.values('payment_id', 'event_id').annotate(n=Count('pk')).filter(n__gt=1).count()
+            wrong = []
+            for transaction_id, stream in streams.items():
+                # A refund that is applied before the payment succeeded is
+                # rejected, so refunded streams may end in either status.
+                refunded = any(payload['type'] == 'charge.refunded' for payload in stream)
+                expected = ('completed', 'refunded') if refunded else ('completed',)
+                if statuses[transaction_id] not in expected:
+                    wrong.append(transaction_id)
+            inconsistent = inconsistent_payments(payment_ids)
+
+            self.stdout.write(
+                f"{len(deliveries)} deliveries for {count} payments from {threads} threads in {elapsed:.2f}s "
+                f"({len(deliveries) / elapsed:.0f} deliveries/s), {transitions.count()} transitions recorded\n"
+                f"wrong final status {len(wrong)}, inconsistent histories {len(inconsistent)}, "
+                f"events applied more than once {repeated}"
+            )
+            if wrong or inconsistent or repeated:
+                raise CommandError('Replayed events left payments in an inconsistent state.')
+        finally:
+            WebhookEvent.objects.filter(transaction_id__in=list(streams)).delete()
+            user.delete()
+        self.stdout.write(self.style.SUCCESS('Payment histories are consistent.'))
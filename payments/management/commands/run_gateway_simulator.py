@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.simulator import GatewaySimulator, http_webhook
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve the fake Stripe/PayPal gateway until interrupted. Point STRIPE_API_BASE and '
+        'PAYPAL_API_BASE of the site under test at the printed URL. PayPal webhooks are unsigned, so the '
+        'site rejects them and reconciliation settles those payments.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=50, help='Mean latency of each API call.')
+        parser.add_argument('--jitter-ms', type=float, default=20, help='Latency varies by up to this much.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of API calls answered with a 500.')
+        parser.add_argument('--failure-rate', type=float, default=0.05, help='Share of payments that fail.')
+        parser.add_argument('--settle-ms', type=float, default=500, help='Time until a payment settles.')
+        parser.add_argument('--site', default='http://127.0.0.1:8000', help='Site that receives the webhooks.')
+        parser.add_argument('--no-webhooks', action='store_true', help='Leave every payment to reconciliation.')
+        parser.add_argument('--webhook-loss-rate', type=float, default=0.0, help='Share of webhooks never sent.')
+        parser.add_argument('--duplicate-rate', type=float, default=0.0, help='Share of webhooks sent twice.')
+
+    def handle(self, *args, **options):
+        site = options['site'].rstrip('/')
+        simulator = GatewaySimulator(
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+            failure_rate=options['failure_rate'],
+            settle_delay=options['settle_ms'] / 1000,
+            webhook=None if options['no_webhooks'] else http_webhook(
+                f'{site}/api/payments/webhooks/stripe/', f'{site}/api/payments/webhooks/paypal/'
+            ),
+            webhook_loss_rate=options['webhook_loss_rate'],
+            duplicate_rate=options['duplicate_rate'],
+        )
+        url = simulator.start(options['host'], options['port'])
+        self.stdout.write(f"Gateway simulator listening on {url}")
+        try:
+            while True:
+                time.sleep(10)
+                self.stdout.write(', '.join(f'{key} {value}' for key, value in simulator.stats.items()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            simulator.stop()
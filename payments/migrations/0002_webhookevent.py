@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['transaction_id'], name='payments_pa_transac_8e9d99_idx'),
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gateway', models.CharField(choices=[('stripe', 'Stripe'), ('paypal', 'PayPal')], max_length=20)),
+                ('event_id', models.CharField(max_length=255)),
+                ('event_type', models.CharField(max_length=100)),
+                ('transaction_id', models.CharField(blank=True, max_length=100)),
+                ('payload', models.JSONField(default=dict)),
+                ('gateway_created_at', models.DateTimeField(blank=True, null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'ordering': ['received_at'],
+                'indexes': [
+                    models.Index(fields=['transaction_id'], name='payments_we_transac_6c54d0_idx'),
+                    models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['attempts', 'received_at'], name='payments_webhook_pending_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('gateway', 'event_id'), name='payments_webhookevent_gateway_event_uniq'),
+                ],
+            },
+        ),
+    ]
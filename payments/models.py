@@ -31,6 +31,66 @@ class Payment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['transaction_id']),
+        ]
+
+class PaymentTransition(models.Model):
+    """
+    One applied change of ``Payment.status``, written by ``payments.transitions``.
+    """
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='transitions')
+    from_status = models.CharField(max_length=20, choices=Payment.PAYMENT_STATUS)
+    to_status = models.CharField(max_length=20, choices=Payment.PAYMENT_STATUS)
+    source = models.CharField(max_length=50, blank=True)
+    event_id = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'pk']
+        indexes = [
+            models.Index(fields=['payment', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.payment_id}: {self.from_status} -> {self.to_status}"
+
+class WebhookEvent(models.Model):
+    """
+    A gateway webhook delivery whose signature was verified, stored as received.
+
+    Rows are only ever inserted by the webhook views (duplicates, keyed by the
+    gateway's event id, are dropped by the unique constraint) and stamped
+    with ``processed_at`` once ``payments.events`` has applied them.
+    """
+    GATEWAYS = [
+        ('stripe', 'Stripe'),
+        ('paypal', 'PayPal'),
+    ]
+
+    gateway = models.CharField(max_length=20, choices=GATEWAYS)
+    event_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=100)
+    transaction_id = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField(default=dict)
+    gateway_created_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        ordering = ['received_at']
+        indexes = [
+            models.Index(fields=['transaction_id']),
+            models.Index(fields=['attempts', 'received_at'], condition=models.Q(processed_at__isnull=True), name='payments_webhook_pending_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['gateway', 'event_id'], name='payments_webhookevent_gateway_event_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.gateway} {self.event_type} {self.event_id}"
 
 class PaymentMethod(models.Model):
     name = models.CharField(max_length=100)
@@ -0,0 +1,152 @@
+"""
+Periodic reconciliation of payments still ``processing``.
+
+Webhooks settle most payments. PIX and bank slip payments, and payments
+whose webhooks were lost, are settled here instead. ``reconcile_payments``
+(Celery beat) pages through the processing payments of each gateway by
+primary key and asks the gateway for each status on a bounded thread pool,
+so the number of requests in flight does not depend on the backlog. Each
+page is applied through ``payments.transitions``: one statement per
+resulting status. A payment that a webhook settled in the meantime is
+simply not moved again.
+
+Each run logs, caches and returns per-gateway lag metrics: how many
+payments were checked, moved and failed to check, the age of the oldest
+payment still processing, and how long the settled ones had waited.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .events import settle
+from .models import Payment
+from .services import BankSlipService, PayPalService, PixService, StripeService
+from .transitions import apply_transitions
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_PAGE_SIZE = 200
+RECONCILE_CONCURRENCY = getattr(settings, 'PAYMENT_RECONCILE_CONCURRENCY', 8)
+# Younger payments are left to their webhooks.
+RECONCILE_MIN_AGE = timedelta(seconds=getattr(settings, 'PAYMENT_RECONCILE_MIN_AGE', 120))
+METRICS_KEY = 'payments:reconciliation:metrics'
+
+GATEWAY_SERVICES = {
+    'credit_card': StripeService,
+    'paypal': PayPalService,
+    'pix': PixService,
+    'bank_slip': BankSlipService,
+}
+# Gateway status -> payment status, per payment method. Other statuses leave the payment processing.
+GATEWAY_STATUS = {
+    'credit_card': {'succeeded': 'completed', 'canceled': 'failed'},
+    'paypal': {'approved': 'completed', 'failed': 'failed', 'canceled': 'failed', 'expired': 'failed'},
+    'pix': {'paid': 'completed', 'expired': 'failed', 'cancelled': 'failed'},
+    'bank_slip': {'paid': 'completed', 'expired': 'failed', 'cancelled': 'failed'},
+}
+
+
+def fetch_statuses(service, payments, executor):
+    """
+    Yield ``(payment, result)`` for each payment; ``result`` is the service's status dict.
+    """
+    def check(payment):
+        try:
+            return payment, service.check_status(payment)
+        except Exception as e:
+            return payment, {'success': False, 'error': str(e)}
+    return executor.map(check, payments)
+
+
+def reconcile_page(payment_method, payments, service, executor, metrics):
+    """
+    Check one page of processing payments and apply the settled ones.
+    """
+    mapping = GATEWAY_STATUS[payment_method]
+    now = timezone.now()
+    changes = {}
+    waited = {}
+    for payment, result in fetch_statuses(service, payments, executor):
+        metrics['checked'] += 1
+        if not result['success']:
+            metrics['errors'] += 1
+            logger.warning(f"Could not check {payment_method} payment {payment.pk}: {result.get('error')}")
+            continue
+        status = mapping.get(result['status'])
+        if status is None:
+            continue
+        changes.setdefault(status, []).append((payment.pk, {'gateway_status': result['status']}, ''))
+        waited[payment.pk] = (now - payment.created_at).total_seconds()
+
+    with transaction.atomic():
+        moved = []
+        for status, rows in changes.items():
+            moved.extend(
+                (status, payment_id, order_id)
+                for payment_id, order_id, _ in apply_transitions(status, rows, source='reconciliation', key='id')
+            )
+        settle(moved)
+    for _, payment_id, _ in moved:
+        metrics['moved'] += 1
+        metrics['max_settle_lag'] = max(metrics['max_settle_lag'], waited[payment_id])
+        metrics['total_settle_lag'] += waited[payment_id]
+
+
+def reconcile_payments(payment_methods=None, page_size=RECONCILE_PAGE_SIZE, concurrency=RECONCILE_CONCURRENCY,
+                       min_age=RECONCILE_MIN_AGE):
+    """
+    Check every processing payment older than ``min_age`` against its gateway.
+
+    Returns ``{payment_method: metrics}``.
+    """
+    started = time.perf_counter()
+    cutoff = timezone.now() - min_age
+    report = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for payment_method in payment_methods or GATEWAY_SERVICES:
+            service = GATEWAY_SERVICES[payment_method]()
+            metrics = {'checked': 0, 'moved': 0, 'errors': 0, 'max_settle_lag': 0.0, 'total_settle_lag': 0.0}
+            pending = Payment.objects.filter(status='processing', payment_method=payment_method, created_at__lte=cutoff)
+            oldest = pending.order_by('created_at').values_list('created_at', flat=True).first()
+            metrics['oldest_processing_age'] = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+
+            last_pk = 0
+            while True:
+                page = list(
+                    pending.filter(pk__gt=last_pk).order_by('pk')
+                    .only('pk', 'transaction_id', 'payment_method', 'amount', 'created_at')[:page_size]
+                )
+                if not page:
+                    break
+                reconcile_page(payment_method, page, service, executor, metrics)
+                last_pk = page[-1].pk
+                if len(page) < page_size:
+                    break
+
+            total_lag = metrics.pop('total_settle_lag')
+            metrics['mean_settle_lag'] = total_lag / metrics['moved'] if metrics['moved'] else 0.0
+            report[payment_method] = metrics
+            logger.info(
+                f"Reconciled {payment_method}: checked {metrics['checked']}, moved {metrics['moved']}, "
+                f"errors {metrics['errors']}, oldest processing {metrics['oldest_processing_age']:.0f}s, "
+                f"settle lag mean {metrics['mean_settle_lag']:.0f}s max {metrics['max_settle_lag']:.0f}s"
+            )
+    cache.set(METRICS_KEY, {
+        'finished_at': timezone.now().isoformat(),
+        'duration': time.perf_counter() - started,
+        'gateways': report,
+    }, None)
+    return report
+
+
+def reconciliation_metrics():
+    """
+    Return the metrics of the last reconciliation run, or None.
+    """
+    return cache.get(METRICS_KEY)
@@ -2,39 +2,25 @@ import stripe
 import paypalrestsdk
 from django.conf import settings
 from typing import Dict, Any
-
-class PaymentGatewayService:
-    @staticmethod
-    def setup_stripe():
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-        return stripe
-
-    @staticmethod
-    def setup_paypal():
-        paypalrestsdk.configure({
-            "mode": settings.PAYPAL_MODE,  # sandbox or live
-            "client_id": settings.PAYPAL_CLIENT_ID,
-            "client_secret": settings.PAYPAL_CLIENT_SECRET
-        })
-        return paypalrestsdk
+from .gateways import GatewayUnavailable, PAYPAL_FAILURES, call_gateway, call_paypal, paypal_api, stripe_client
 
 class StripeService:
     def __init__(self):
-        self.stripe = PaymentGatewayService.setup_stripe()
+        self.client = stripe_client()
 
     def create_payment_intent(self, amount: int, currency: str = 'brl', **kwargs) -> Dict[str, Any]:
         try:
-            intent = stripe.PaymentIntent.create(
-                amount=amount,
-                currency=currency,
+            intent = call_gateway('stripe', self.client.payment_intents.create, params={
+                'amount': amount,
+                'currency': currency,
                 **kwargs
-            )
+            })
             return {
                 'success': True,
                 'intent': intent,
                 'client_secret': intent.client_secret
             }
-        except stripe.error.StripeError as e:
+        except (stripe.error.StripeError, GatewayUnavailable) as e:
             return {
                 'success': False,
                 'error': str(e)
@@ -42,12 +28,26 @@ class StripeService:
 
     def confirm_payment(self, payment_intent_id: str) -> Dict[str, Any]:
         try:
-            intent = stripe.PaymentIntent.confirm(payment_intent_id)
+            intent = call_gateway('stripe', self.client.payment_intents.confirm, payment_intent_id)
             return {
                 'success': True,
                 'status': intent.status
             }
-        except stripe.error.StripeError as e:
+        except (stripe.error.StripeError, GatewayUnavailable) as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    def check_status(self, payment: 'Payment') -> Dict[str, Any]:
+        # Only reads the intent; confirming it again could charge the customer.
+        try:
+            intent = call_gateway('stripe', self.client.payment_intents.retrieve, payment.transaction_id)
+            return {
+                'success': True,
+                'status': intent.status
+            }
+        except (stripe.error.StripeError, GatewayUnavailable) as e:
             return {
                 'success': False,
                 'error': str(e)
@@ -55,15 +55,15 @@ class StripeService:
 
     def refund_payment(self, payment_intent_id: str, amount: int = None) -> Dict[str, Any]:
         try:
-            refund = stripe.Refund.create(
-                payment_intent=payment_intent_id,
-                amount=amount
-            )
+            params = {'payment_intent': payment_intent_id}
+            if amount is not None:
+                params['amount'] = amount
+            refund = call_gateway('stripe', self.client.refunds.create, params=params)
             return {
                 'success': True,
                 'refund': refund
             }
-        except stripe.error.StripeError as e:
+        except (stripe.error.StripeError, GatewayUnavailable) as e:
             return {
                 'success': False,
                 'error': str(e)
@@ -71,10 +71,10 @@ class StripeService:
 
 class PayPalService:
     def __init__(self):
-        self.paypal = PaymentGatewayService.setup_paypal()
+        self.api = paypal_api()
 
     def create_payment(self, amount: float, currency: str = 'BRL', **kwargs) -> Dict[str, Any]:
-        payment = self.paypal.Payment({
+        payment = paypalrestsdk.Payment({
             "intent": "sale",
             "payer": {
                 "payment_method": "paypal"
@@ -90,9 +90,16 @@ class PayPalService:
                 },
                 "description": kwargs.get('description', 'Payment for order')
             }]
-        })
+        }, api=self.api)
 
-        if payment.create():
+        try:
+            created = call_paypal(payment.create)
+        except PAYPAL_FAILURES + (GatewayUnavailable,) as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        if created:
             return {
                 'success': True,
                 'payment': payment,
@@ -105,8 +112,15 @@ class PayPalService:
             }
 
     def execute_payment(self, payment_id: str, payer_id: str) -> Dict[str, Any]:
-        payment = self.paypal.Payment.find(payment_id)
-        if payment.execute({"payer_id": payer_id}):
+        try:
+            payment = call_paypal(paypalrestsdk.Payment.find, payment_id, self.api)
+            executed = call_paypal(payment.execute, {"payer_id": payer_id})
+        except (paypalrestsdk.ResourceNotFound, GatewayUnavailable) + PAYPAL_FAILURES as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        if executed:
             return {
                 'success': True,
                 'payment': payment
@@ -117,6 +131,19 @@ class PayPalService:
                 'error': payment.error
             }
 
+    def check_status(self, payment: 'Payment') -> Dict[str, Any]:
+        try:
+            paypal_payment = call_paypal(paypalrestsdk.Payment.find, payment.transaction_id, self.api)
+            return {
+                'success': True,
+                'status': paypal_payment.state
+            }
+        except (paypalrestsdk.ResourceNotFound, GatewayUnavailable) + PAYPAL_FAILURES as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
 class PixService:
     def generate_qrcode(self, payment: 'Payment') -> Dict[str, Any]:
         # Implementar integração com API do Banco Central ou PSP
@@ -0,0 +1,318 @@
+"""
+A local stand-in for the Stripe and PayPal APIs, for load tests.
+
+``GatewaySimulator`` serves the endpoints ``payments.services`` uses over
+plain HTTP/1.1 with keep-alive, so the pooled clients in
+``payments.gateways`` talk to it exactly as they talk to the real gateways
+once ``STRIPE_API_BASE`` and ``PAYPAL_API_BASE`` point at it:
+
+* Stripe: create, retrieve and confirm payment intents, create refunds.
+* PayPal: OAuth tokens, create, find and execute payments.
+
+Every request waits ``latency`` plus or minus ``jitter`` seconds and fails
+with a 500 at ``error_rate``. A created payment settles ``settle_delay``
+seconds later, as failed at ``failure_rate`` and succeeded otherwise; from
+then on status reads return the outcome and the simulator sends the
+matching webhook (a ``payment_intent.*`` event signed with
+``STRIPE_WEBHOOK_SECRET``, or a ``PAYMENT.CAPTURE.*`` event). PayPal events
+carry no transmission signature, so a site that verifies them rejects them
+and reconciliation settles those payments. Webhooks are dropped at
+``webhook_loss_rate``, which leaves those payments to reconciliation too,
+and sent twice at ``duplicate_rate``.
+
+``webhook`` receives each delivery as ``(gateway, body, headers)``;
+``http_webhook`` posts them to a running site. Run it standalone with the
+``run_gateway_simulator`` management command.
+"""
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def sign_stripe_payload(body, secret, timestamp=None):
+    """
+    Return the ``Stripe-Signature`` header value for ``body``.
+    """
+    timestamp = int(timestamp or time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def http_webhook(stripe_url, paypal_url, timeout=10):
+    """
+    Return a ``webhook`` callable that posts deliveries to the given URLs.
+    """
+    urls = {'stripe': stripe_url, 'paypal': paypal_url}
+
+    def deliver(gateway, body, headers):
+        request = urllib.request.Request(urls[gateway], data=body, headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    return deliver
+
+
+class SimulatedPayment:
+    def __init__(self, gateway, pk, amount, settle_at, succeeds):
+        self.gateway = gateway
+        self.pk = pk
+        self.amount = amount
+        self.created = int(time.time())
+        self.settle_at = settle_at
+        self.succeeds = succeeds
+        self.refunded = False
+
+    @property
+    def settled(self):
+        return time.monotonic() >= self.settle_at
+
+    def stripe_object(self):
+        if not self.settled:
+            status = 'processing'
+        else:
+            status = 'succeeded' if self.succeeds else 'canceled'
+        return {
+            'id': self.pk,
+            'object': 'payment_intent',
+            'amount': self.amount,
+            'currency': 'brl',
+            'status': status,
+            'client_secret': f'{self.pk}_secret',
+            'created': self.created,
+            'metadata': {},
+        }
+
+    def paypal_object(self, base_url):
+        if not self.settled:
+            state = 'created'
+        else:
+            state = 'approved' if self.succeeds else 'failed'
+        return {
+            'id': self.pk,
+            'intent': 'sale',
+            'state': state,
+            'create_time': datetime.fromtimestamp(self.created, tz=dt_timezone.utc).isoformat(),
+            'links': [
+                {'href': f'{base_url}/checkout/{self.pk}', 'rel': 'approval_url', 'method': 'REDIRECT'},
+            ],
+        }
+
+
+class GatewaySimulator:
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, failure_rate=0.05, settle_delay=0.5,
+                 webhook=None, webhook_loss_rate=0.0, duplicate_rate=0.0, webhook_workers=8):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.failure_rate = failure_rate
+        self.settle_delay = settle_delay
+        self.webhook = webhook
+        self.webhook_loss_rate = webhook_loss_rate
+        self.duplicate_rate = duplicate_rate
+        self.payments = {}
+        self.stats = {'requests': 0, 'errors': 0, 'webhooks_sent': 0, 'webhooks_lost': 0, 'webhook_failures': 0}
+        self._lock = threading.Lock()
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._running = False
+        self._server = None
+        self._executor = ThreadPoolExecutor(max_workers=webhook_workers)
+        self.base_url = None
+
+    def start(self, host='127.0.0.1', port=0):
+        """
+        Serve on ``host:port`` (a free port by default) in background threads. Returns the base URL.
+        """
+        handler = type('Handler', (SimulatorHandler,), {'simulator': self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self.base_url = f'http://{host}:{self._server.server_address[1]}'
+        self._running = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._dispatch_webhooks, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._wakeup.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self._executor.shutdown(wait=True)
+
+    def wait_for_webhooks(self, timeout=60):
+        """
+        Block until every scheduled webhook was delivered. Returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._schedule and not self._in_flight:
+                    return True
+            time.sleep(0.05)
+        return False
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def create_payment(self, gateway, prefix, amount):
+        payment = SimulatedPayment(
+            gateway, f'{prefix}{uuid.uuid4().hex[:24]}', amount,
+            time.monotonic() + self.settle_delay, random.random() >= self.failure_rate,
+        )
+        with self._lock:
+            self.payments[payment.pk] = payment
+            if self.webhook is not None:
+                deliveries = 2 if random.random() < self.duplicate_rate else 1
+                if random.random() < self.webhook_loss_rate:
+                    deliveries = 0
+                    self.stats['webhooks_lost'] += 1
+                event_id = f'evt_{uuid.uuid4().hex[:24]}'
+                for _ in range(deliveries):
+                    heapq.heappush(self._schedule, (payment.settle_at, next(self._sequence), payment.pk, event_id))
+                self._wakeup.notify()
+        return payment
+
+    def get_payment(self, pk):
+        with self._lock:
+            return self.payments.get(pk)
+
+    def _dispatch_webhooks(self):
+        while True:
+            with self._lock:
+                while self._running and (not self._schedule or self._schedule[0][0] > time.monotonic()):
+                    timeout = self._schedule[0][0] - time.monotonic() if self._schedule else None
+                    self._wakeup.wait(timeout)
+                if not self._running:
+                    return
+                _, _, pk, event_id = heapq.heappop(self._schedule)
+                payment = self.payments[pk]
+                self._in_flight += 1
+            self._executor.submit(self._deliver, payment, event_id)
+
+    def _deliver(self, payment, event_id):
+        try:
+            if payment.gateway == 'stripe':
+                body = json.dumps({
+                    'id': event_id,
+                    'object': 'event',
+                    'type': 'payment_intent.succeeded' if payment.succeeds else 'payment_intent.payment_failed',
+                    'created': int(time.time()),
+                    'data': {'object': payment.stripe_object()},
+                }).encode()
+                headers = {
+                    'Content-Type': 'application/json',
+                    'Stripe-Signature': sign_stripe_payload(body, settings.STRIPE_WEBHOOK_SECRET),
+                }
+            else:
+                body = json.dumps({
+                    'id': f'WH-{event_id}',
+                    'event_type': 'PAYMENT.CAPTURE.COMPLETED' if payment.succeeds else 'PAYMENT.CAPTURE.DENIED',
+                    'create_time': datetime.now(tz=dt_timezone.utc).isoformat(),
+                    'resource': {
+                        'id': f'CAP-{payment.pk}',
+                        'supplementary_data': {'related_ids': {'order_id': payment.pk}},
+                    },
+                }).encode()
+                headers = {'Content-Type': 'application/json'}
+            status = self.webhook(payment.gateway, body, headers)
+            self.count('webhooks_sent' if 200 <= status < 300 else 'webhook_failures')
+        except Exception as e:
+            logger.warning(f"Simulated webhook for {payment.pk} failed: {str(e)}")
+            self.count('webhook_failures')
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    simulator = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Request-Id', f'req_{uuid.uuid4().hex[:14]}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        simulator = self.simulator
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        simulator.count('requests')
+        time.sleep(max(0.0, random.uniform(simulator.latency - simulator.jitter, simulator.latency + simulator.jitter)))
+        if random.random() < simulator.error_rate:
+            simulator.count('errors')
+            return self._send(500, {'error': {'type': 'api_error', 'message': 'Simulated gateway error'}})
+
+        parts = [part for part in urlsplit(self.path).path.split('/') if part]
+        resource = parts[1] if len(parts) > 1 else ''
+        if resource == 'payment_intents':
+            if method == 'POST' and len(parts) == 2:
+                form = parse_qs(body.decode())
+                payment = simulator.create_payment('stripe', 'pi_', int(form.get('amount', ['0'])[0]))
+                return self._send(200, payment.stripe_object())
+            # Retrieve, or confirm: settlement does not depend on it.
+            payment = simulator.get_payment(parts[2]) if len(parts) > 2 else None
+            if payment is None:
+                return self._send(404, {'error': {'type': 'invalid_request_error', 'message': 'No such payment_intent'}})
+            return self._send(200, payment.stripe_object())
+        if resource == 'refunds' and method == 'POST':
+            form = parse_qs(body.decode())
+            payment = simulator.get_payment(form.get('payment_intent', [''])[0])
+            if payment is None:
+                return self._send(404, {'error': {'type': 'invalid_request_error', 'message': 'No such payment_intent'}})
+            payment.refunded = True
+            return self._send(200, {
+                'id': f're_{uuid.uuid4().hex[:24]}', 'object': 'refund', 'payment_intent': payment.pk,
+                'amount': int(form.get('amount', [payment.amount])[0]), 'status': 'succeeded',
+            })
+        if resource == 'oauth2':
+            return self._send(200, {'access_token': 'simulated-token', 'token_type': 'Bearer', 'expires_in': 32400})
+        if resource == 'payments':
+            if method == 'POST' and len(parts) == 3:
+                data = json.loads(body or b'{}')
+                total = data.get('transactions', [{}])[0].get('amount', {}).get('total', '0')
+                payment = simulator.create_payment('paypal', 'PAY-', total)
+                return self._send(201, payment.paypal_object(simulator.base_url))
+            # Find, or execute: settlement does not depend on it.
+            payment = simulator.get_payment(parts[3]) if len(parts) > 3 else None
+            if payment is None:
+                return self._send(404, {'name': 'INVALID_RESOURCE_ID', 'message': 'Requested resource ID was not found.'})
+            return self._send(200, payment.paypal_object(simulator.base_url))
+        return self._send(404, {'error': {'type': 'invalid_request_error', 'message': f'Unknown route {self.path}'}})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
@@ -1,7 +1,10 @@
 from celery import shared_task
 from django.conf import settings
+from .events import drain_events
 from .models import Payment
+from .reconciliation import reconcile_payments
 from .services import StripeService, PayPalService, PixService, BankSlipService
+from .transitions import transition
 
 @shared_task
 def process_payment(payment_id):
@@ -20,77 +23,55 @@ def process_payment(payment_id):
     except Payment.DoesNotExist:
         return False
     except Exception as e:
-        payment.status = 'failed'
-        payment.payment_data['error'] = str(e)
-        payment.save()
+        transition(payment, 'failed', {'error': str(e)}, source='process_payment')
         return False
         
     return True
 
-@shared_task
-def check_payment_status(payment_id):
-    try:
-        payment = Payment.objects.get(id=payment_id)
-        
-        if payment.status == 'processing':
-            # Verificar status no gateway
-            if payment.payment_method == 'credit_card':
-                check_credit_card_status(payment)
-            elif payment.payment_method == 'paypal':
-                check_paypal_status(payment)
-            elif payment.payment_method == 'pix':
-                check_pix_status(payment)
-            elif payment.payment_method == 'bank_slip':
-                check_bank_slip_status(payment)
-                
-    except Payment.DoesNotExist:
-        return False
-        
-    return True 
+def _start_processing(payment, result, data, transaction_id=''):
+    if not result['success']:
+        raise ValueError(result['error'])
+    payment.transaction_id = transaction_id or payment.transaction_id
+    payment.payment_data.update(data)
+    # Saved before the transition, so a webhook that arrives right after finds the payment.
+    payment.save(update_fields=['transaction_id', 'payment_data', 'updated_at'])
+    transition(payment, 'processing', source='process_payment')
+
+def process_credit_card_payment(payment):
+    result = StripeService().create_payment_intent(
+        amount=int(payment.amount * 100),
+        currency='brl',
+        metadata={'order_id': str(payment.order_id), 'payment_id': str(payment.pk)}
+    )
+    _start_processing(
+        payment, result,
+        {'client_secret': result.get('client_secret')},
+        result['intent'].id if result['success'] else ''
+    )
 
-def check_credit_card_status(payment):
-    stripe_service = StripeService()
-    result = stripe_service.confirm_payment(payment.transaction_id)
-    
-    if result['success']:
-        if result['status'] == 'succeeded':
-            payment.status = 'completed'
-        elif result['status'] == 'failed':
-            payment.status = 'failed'
-        payment.save()
-    return result['success']
+def process_paypal_payment(payment):
+    result = PayPalService().create_payment(
+        amount=float(payment.amount),
+        description=f'Order {payment.order_id}'
+    )
+    _start_processing(
+        payment, result,
+        {'approval_url': result.get('approval_url')},
+        result['payment'].id if result['success'] else ''
+    )
 
-def check_paypal_status(payment):
-    paypal_service = PayPalService()
-    payment_obj = paypal_service.paypal.Payment.find(payment.transaction_id)
-    
-    if payment_obj.state == 'approved':
-        payment.status = 'completed'
-        payment.save()
-        return True
-    elif payment_obj.state in ['failed', 'cancelled']:
-        payment.status = 'failed'
-        payment.save()
-    return False
+def generate_pix_qrcode(payment):
+    result = PixService().generate_qrcode(payment)
+    _start_processing(payment, result, {'qr_code': result.get('qr_code'), 'expiration': result.get('expiration')})
 
-def check_pix_status(payment):
-    pix_service = PixService()
-    result = pix_service.check_status(payment)
-    
-    if result['success']:
-        if result['status'] == 'paid':
-            payment.status = 'completed'
-            payment.save()
-            return True
-    return False
+def generate_bank_slip(payment):
+    result = BankSlipService().generate_slip(payment)
+    _start_processing(payment, result, {'barcode': result.get('barcode'), 'pdf_url': result.get('pdf_url')})
 
-def check_bank_slip_status(payment):
-    bank_slip_service = BankSlipService()
-    result = bank_slip_service.check_status(payment)
-    
-    if result['success']:
-        if result['status'] == 'paid':
-            payment.status = 'completed'
-            payment.save()
-            return True
-    return False 
\ No newline at end of file
+@shared_task
+def drain_webhook_events():
+    return drain_events()
+
+@shared_task
+def reconcile_processing_payments():
+    return reconcile_payments()
@@ -0,0 +1,60 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase, override_settings
+from frontend.models import Order
+from ..events import drain_events
+from ..gateways import paypal_api, stripe_client
+from ..models import Payment
+from ..reconciliation import reconcile_payments
+from ..simulator import GatewaySimulator
+from ..tasks import process_payment
+from ..webhooks import StripeWebhookView
+
+User = get_user_model()
+
+class GatewaySimulatorTests(TestCase):
+    def setUp(self):
+        self.deliveries = []
+        self.simulator = GatewaySimulator(
+            latency=0, jitter=0, failure_rate=0, settle_delay=0,
+            webhook=lambda gateway, body, headers: self.deliveries.append((gateway, body, headers)) or 200,
+        )
+        url = self.simulator.start()
+        self.addCleanup(self.simulator.stop)
+        settings_override = override_settings(STRIPE_API_BASE=url, PAYPAL_API_BASE=url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for client in (stripe_client, paypal_api):
+            client.cache_clear()
+            self.addCleanup(client.cache_clear)
+
+        user = User.objects.create_user(email='buyer@example.com', username='buyer', password='secret')
+        self.order = Order.objects.create(user=user, total=Decimal('10.00'))
+
+    def test_card_payment_settles_through_signed_webhook(self):
+        payment = Payment.objects.create(order=self.order, amount=Decimal('10.00'), payment_method='credit_card')
+        self.assertTrue(process_payment(payment.pk))
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'processing')
+        self.assertTrue(payment.transaction_id.startswith('pi_'))
+
+        self.assertTrue(self.simulator.wait_for_webhooks(timeout=5))
+        gateway, body, headers = self.deliveries[0]
+        request = RequestFactory().post(
+            '/api/payments/webhooks/stripe/', data=body, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=headers['Stripe-Signature'],
+        )
+        self.assertEqual(StripeWebhookView.as_view()(request).status_code, 200)
+        drain_events()
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+
+    def test_paypal_payment_without_webhook_is_reconciled(self):
+        self.simulator.webhook = None
+        payment = Payment.objects.create(order=self.order, amount=Decimal('10.00'), payment_method='paypal')
+        self.assertTrue(process_payment(payment.pk))
+        report = reconcile_payments(['paypal'], min_age=timedelta(0))
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+        self.assertEqual(report['paypal']['moved'], 1)
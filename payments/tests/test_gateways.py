@@ -0,0 +1,52 @@
+from unittest.mock import patch
+from django.test import SimpleTestCase
+from ..gateways import CircuitBreaker, GatewayUnavailable, with_retries
+
+class Flaky:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError('gateway down')
+        return 'ok'
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        breaker = CircuitBreaker('test', (ConnectionError,), threshold=3, reset_timeout=60)
+        func = Flaky(failures=10)
+        for _ in range(3):
+            with self.assertRaises(ConnectionError):
+                breaker.call(func)
+        with self.assertRaises(GatewayUnavailable):
+            breaker.call(func)
+        self.assertEqual(func.calls, 3)
+        metrics = breaker.metrics()
+        self.assertEqual(metrics['state'], 'open')
+        self.assertEqual(metrics['rejected'], 1)
+        self.assertEqual(metrics['opened'], 1)
+
+    def test_trial_call_closes_the_circuit(self):
+        breaker = CircuitBreaker('test', (ConnectionError,), threshold=1, reset_timeout=0)
+        func = Flaky(failures=1)
+        with self.assertRaises(ConnectionError):
+            breaker.call(func)
+        self.assertEqual(breaker.call(func), 'ok')
+        self.assertEqual(breaker.metrics()['state'], 'closed')
+
+    def test_caller_errors_do_not_count_against_the_gateway(self):
+        breaker = CircuitBreaker('test', (ConnectionError,), threshold=1, reset_timeout=60)
+        with self.assertRaises(ValueError):
+            breaker.call(int, 'declined')
+        self.assertEqual(breaker.metrics()['state'], 'closed')
+
+class RetryTests(SimpleTestCase):
+    @patch('payments.gateways.time.sleep')
+    def test_retries_transient_failures_with_jittered_sleeps(self, sleep):
+        func = Flaky(failures=2)
+        self.assertEqual(with_retries(func, ConnectionError, retries=2, base_delay=0.1)(), 'ok')
+        self.assertEqual(func.calls, 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertLessEqual(sleep.call_args_list[1].args[0], 0.2)
@@ -0,0 +1,75 @@
+import random
+import threading
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+from frontend.models import Order
+from ..models import Payment, PaymentTransition
+from ..transitions import apply_transitions, inconsistent_payments, transition
+
+User = get_user_model()
+
+class PaymentFixtureMixin:
+    def setUp(self):
+        user = User.objects.create_user(email='buyer@example.com', username='buyer', password='secret')
+        order = Order.objects.create(user=user, total=Decimal('10.00'))
+        self.payment = Payment.objects.create(
+            order=order, amount=Decimal('10.00'), payment_method='credit_card',
+            status='processing', transaction_id='pi_1',
+        )
+
+class PaymentTransitionTests(PaymentFixtureMixin, TestCase):
+    def test_duplicate_transition_is_a_single_statement_no_op(self):
+        self.assertTrue(transition(self.payment, 'completed', {'stripe_status': 'succeeded'}, event_id='evt_1'))
+        with self.assertNumQueries(1):
+            self.assertEqual(apply_transitions('completed', [('pi_1', {}, 'evt_1')]), [])
+        self.assertEqual(PaymentTransition.objects.count(), 1)
+
+    def test_late_events_do_not_move_a_completed_payment_back(self):
+        transition(self.payment, 'completed')
+        self.assertFalse(transition(self.payment, 'processing'))
+        self.assertFalse(transition(self.payment, 'failed'))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+
+    def test_failed_payments_do_not_go_back_to_processing(self):
+        transition(self.payment, 'failed')
+        self.assertFalse(transition(self.payment, 'processing'))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'failed')
+
+class ConcurrentPaymentTransitionTests(PaymentFixtureMixin, TransactionTestCase):
+    def deliver(self, barrier, errors, status, event_id):
+        try:
+            barrier.wait()
+            apply_transitions(status, [('pi_1', {}, event_id)])
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connections.close_all()
+
+    def test_concurrent_event_streams_keep_history_consistent(self):
+        events = [('failed', 'evt_1'), ('completed', 'evt_2'), ('refunded', 'evt_3')] * 3
+        for seed in range(10):
+            Payment.objects.filter(pk=self.payment.pk).update(status='processing')
+            PaymentTransition.objects.all().delete()
+            random.Random(seed).shuffle(events)
+            # Every delivery runs on its own connection, released at once, so
+            # the writers really race on the payment's row lock.
+            barrier = threading.Barrier(len(events))
+            errors = []
+            threads = [
+                threading.Thread(target=self.deliver, args=(barrier, errors, status, event_id))
+                for status, event_id in events
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.payment.refresh_from_db()
+            self.assertIn(self.payment.status, ('completed', 'refunded'))
+            self.assertEqual(inconsistent_payments([self.payment.pk]), [])
+            event_ids = list(PaymentTransition.objects.values_list('event_id', flat=True))
+            self.assertEqual(len(event_ids), len(set(event_ids)))
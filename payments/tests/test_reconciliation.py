@@ -0,0 +1,48 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from frontend.models import Order
+from ..models import Payment
+from ..reconciliation import reconcile_payments
+
+User = get_user_model()
+
+class FakePixService:
+    statuses = {'pix_paid': 'paid', 'pix_expired': 'expired', 'pix_waiting': 'pending'}
+
+    def check_status(self, payment):
+        if payment.transaction_id == 'pix_broken':
+            raise ConnectionError('gateway down')
+        return {'success': True, 'status': self.statuses[payment.transaction_id]}
+
+@patch.dict('payments.reconciliation.GATEWAY_SERVICES', {'pix': FakePixService})
+class ReconciliationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(email='buyer@example.com', username='buyer', password='secret')
+        self.payments = {}
+        for transaction_id in FakePixService.statuses.keys() | {'pix_broken'}:
+            order = Order.objects.create(user=user, total=Decimal('10.00'))
+            self.payments[transaction_id] = Payment.objects.create(
+                order=order, amount=Decimal('10.00'), payment_method='pix',
+                status='processing', transaction_id=transaction_id,
+            )
+        Payment.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+    def test_settled_payments_move_and_metrics_are_reported(self):
+        report = reconcile_payments(['pix'], page_size=2, concurrency=2)
+        statuses = dict(Payment.objects.values_list('transaction_id', 'status'))
+        self.assertEqual(statuses, {
+            'pix_paid': 'completed', 'pix_expired': 'failed', 'pix_waiting': 'processing', 'pix_broken': 'processing',
+        })
+        self.assertEqual(Order.objects.get(payments__transaction_id='pix_paid').status, 'processing')
+        self.assertEqual(report['pix']['checked'], 4)
+        self.assertEqual(report['pix']['moved'], 2)
+        self.assertEqual(report['pix']['errors'], 1)
+        self.assertGreaterEqual(report['pix']['oldest_processing_age'], 3600)
+
+    def test_recent_payments_are_left_to_webhooks(self):
+        Payment.objects.update(created_at=timezone.now())
+        self.assertEqual(reconcile_payments(['pix'])['pix']['checked'], 0)
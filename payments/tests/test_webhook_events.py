@@ -0,0 +1,71 @@
+from decimal import Decimal
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from frontend.models import Order
+from ..events import EVENT_RETRY_WINDOW, drain_events, record_event
+from ..models import Payment, WebhookEvent
+from ..webhooks import PayPalWebhookView
+
+User = get_user_model()
+
+def stripe_event(event_id, event_type, intent_id, created):
+    obj = {'id': intent_id, 'status': 'succeeded', 'created': created}
+    if event_type == 'charge.refunded':
+        obj = {'id': 'ch_1', 'payment_intent': intent_id, 'created': created, 'refunds': {'data': [{'id': 're_1', 'amount': 100, 'status': 'succeeded'}]}}
+    return {'id': event_id, 'type': event_type, 'created': created, 'data': {'object': obj}}
+
+class WebhookEventQueueTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(email='buyer@example.com', username='buyer', password='secret')
+        self.order = Order.objects.create(user=user, total=Decimal('10.00'))
+        self.payment = Payment.objects.create(
+            order=self.order, amount=Decimal('10.00'), payment_method='credit_card',
+            status='processing', transaction_id='pi_1',
+        )
+
+    def test_duplicate_deliveries_are_stored_once(self):
+        with self.assertNumQueries(1):
+            record_event('stripe', stripe_event('evt_1', 'payment_intent.succeeded', 'pi_1', 100))
+        record_event('stripe', stripe_event('evt_1', 'payment_intent.succeeded', 'pi_1', 100))
+        self.assertFalse(record_event('stripe', stripe_event('evt_2', 'customer.created', 'cus_1', 100)))
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_unsigned_paypal_deliveries_are_rejected(self):
+        body = {'id': 'WH-1', 'event_type': 'PAYMENT.CAPTURE.COMPLETED', 'resource': {}}
+        request = RequestFactory().post(
+            '/api/payments/webhooks/paypal/', data=body, content_type='application/json',
+            HTTP_PAYPAL_CERT_URL='https://attacker.example.com/cert.pem',
+        )
+        self.assertEqual(PayPalWebhookView.as_view()(request).status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_events_are_applied_in_gateway_order(self):
+        record_event('stripe', stripe_event('evt_2', 'charge.refunded', 'pi_1', 200))
+        record_event('stripe', stripe_event('evt_1', 'payment_intent.succeeded', 'pi_1', 100))
+        self.assertEqual(drain_events(), 2)
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.payment.status, 'refunded')
+        self.assertEqual(self.payment.payment_data['refund_id'], 're_1')
+        self.assertEqual(self.order.status, 'refunded')
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_events_for_unknown_payments_are_retried_then_dropped(self):
+        record_event('stripe', stripe_event('evt_1', 'payment_intent.succeeded', 'pi_unknown', 100))
+        drain_events()
+        event = WebhookEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(event.attempts, 1)
+        WebhookEvent.objects.update(received_at=timezone.now() - EVENT_RETRY_WINDOW)
+        drain_events()
+        event.refresh_from_db()
+        self.assertIsNotNone(event.processed_at)
+
+    @patch('frontend.tasks.process_paid_order.delay')
+    def test_completed_payments_run_the_paid_order_hook_on_commit(self, delay):
+        record_event('stripe', stripe_event('evt_1', 'payment_intent.succeeded', 'pi_1', 100))
+        with self.captureOnCommitCallbacks(execute=True):
+            drain_events()
+        delay.assert_called_once_with(str(self.order.pk))
@@ -0,0 +1,130 @@
+"""
+Payment status transitions.
+
+``Payment.status`` only moves along ``ALLOWED_PREVIOUS``: a transition is a
+single statement that locks the payments still in an allowed previous
+status, updates them, merges ``payment_data`` and appends a
+``PaymentTransition`` row per payment that moved. Nothing is read first, so
+a duplicate or late event (``completed`` delivered twice, ``processing``
+arriving after ``completed``) matches no row and costs one no-op statement,
+and two writers racing on one payment are serialized by the row lock with
+the loser re-checking the status it would overwrite.
+"""
+import json
+
+from django.db import connection
+
+from .models import Payment, PaymentTransition
+
+# Target status -> statuses it may be reached from.
+ALLOWED_PREVIOUS = {
+    'processing': ('pending',),
+    'completed': ('pending', 'processing', 'failed'),
+    'failed': ('pending', 'processing'),
+    'refunded': ('completed',),
+}
+
+TRANSITION_SQL = """
+WITH requested AS (
+    SELECT * FROM unnest(%(keys)s::text[], %(data)s::text[], %(event_ids)s::text[]) AS r(key, data, event_id)
+), locked AS (
+    SELECT p.id, p.status, r.data, r.event_id
+    FROM {payment} p JOIN requested r ON p.{key} = r.key{cast}
+    WHERE p.status = ANY(%(allowed)s)
+    ORDER BY p.id
+    FOR UPDATE OF p
+), moved AS (
+    UPDATE {payment} p
+    SET status = %(to_status)s, updated_at = now(), payment_data = p.payment_data || locked.data::jsonb
+    FROM locked
+    WHERE p.id = locked.id
+    RETURNING p.id, p.order_id, locked.status AS from_status, locked.event_id
+), history AS (
+    INSERT INTO {transition} (payment_id, from_status, to_status, source, event_id, created_at)
+    SELECT id, from_status, %(to_status)s, %(source)s, event_id, clock_timestamp() FROM moved
+)
+SELECT id, order_id, from_status FROM moved
+"""
+
+# Lookup column -> cast applied to the requested keys.
+KEY_CASTS = {
+    'id': '::bigint',
+    'transaction_id': '',
+}
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def apply_transitions(to_status, changes, source='', key='transaction_id'):
+    """
+    Move the payments in ``changes`` to ``to_status`` where allowed.
+
+    ``changes`` is a list of ``(key value, payment_data changes, event_id)``
+    with at most one entry per payment. Returns ``(payment_id, order_id,
+    from_status)`` for each payment that moved; the others were already
+    past ``to_status`` or do not exist. It is one statement, so it needs no
+    transaction of its own.
+    """
+    if to_status not in ALLOWED_PREVIOUS:
+        raise InvalidTransition(f"Payments cannot move to {to_status!r}")
+    if key not in KEY_CASTS:
+        raise ValueError(f"Unsupported payment lookup {key!r}")
+    if not changes:
+        return []
+
+    sql = TRANSITION_SQL.format(
+        payment=Payment._meta.db_table,
+        transition=PaymentTransition._meta.db_table,
+        key=key,
+        cast=KEY_CASTS[key],
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'keys': [str(value) for value, _, _ in changes],
+            'data': [json.dumps(data or {}, default=str) for _, data, _ in changes],
+            'event_ids': [event_id or '' for _, _, event_id in changes],
+            'allowed': list(ALLOWED_PREVIOUS[to_status]),
+            'to_status': to_status,
+            'source': source,
+        })
+        return cursor.fetchall()
+
+
+def transition(payment, to_status, data=None, source='', event_id=''):
+    """
+    Move one payment to ``to_status``. Returns False if the transition was not allowed.
+
+    ``payment`` is updated in place when it moved.
+    """
+    moved = apply_transitions(to_status, [(payment.pk, data, event_id)], source=source, key='id')
+    if moved:
+        payment.status = to_status
+        payment.payment_data.update(data or {})
+    return bool(moved)
+
+
+def inconsistent_payments(payment_ids):
+    """
+    Return the ids of payments whose transition history does not chain up to their current status.
+    """
+    history = {}
+    for payment_id, from_status, to_status in PaymentTransition.objects.filter(
+        payment_id__in=payment_ids
+    ).order_by('payment_id', 'created_at', 'pk').values_list('payment_id', 'from_status', 'to_status'):
+        history.setdefault(payment_id, []).append((from_status, to_status))
+
+    inconsistent = []
+    for payment_id, status in Payment.objects.filter(pk__in=payment_ids).values_list('pk', 'status'):
+        steps = history.get(payment_id, [])
+        current = steps[0][0] if steps else status
+        for from_status, to_status in steps:
+            if from_status != current or from_status not in ALLOWED_PREVIOUS[to_status]:
+                inconsistent.append(payment_id)
+                break
+            current = to_status
+        else:
+            if current != status:
+                inconsistent.append(payment_id)
+    return inconsistent
@@ -1,20 +1,18 @@
-import stripe
-from django.conf import settings
 from rest_framework import status, views
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from .serializers import (
     PaymentMethodSerializer,
     PaymentSerializer,
     StripePaymentIntentSerializer,
     PayPalOrderSerializer
 )
+from frontend.models import Order
+from .gateways import gateway_metrics
 from .models import Payment, PaymentMethod
+from .reconciliation import reconciliation_metrics
 from .services import StripeService, PayPalService, PixService, BankSlipService
-from django.views import View
-from django.http import JsonResponse
-
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from .transitions import transition
 
 class CreateStripeIntentView(views.APIView):
     permission_classes = [IsAuthenticated]
@@ -22,23 +20,22 @@ class CreateStripeIntentView(views.APIView):
     def post(self, request):
         serializer = StripePaymentIntentSerializer(data=request.data)
         if serializer.is_valid():
-            try:
-                intent = stripe.PaymentIntent.create(
-                    amount=int(serializer.validated_data['amount'] * 100),
-                    currency=serializer.validated_data['currency'],
-                    payment_method=serializer.validated_data['payment_method_id'],
-                    confirmation_method='manual',
-                    confirm=True,
-                )
+            result = StripeService().create_payment_intent(
+                amount=int(serializer.validated_data['amount'] * 100),
+                currency=serializer.validated_data['currency'],
+                payment_method=serializer.validated_data['payment_method_id'],
+                confirmation_method='manual',
+                confirm=True,
+            )
+            if result['success']:
                 return Response({
-                    'client_secret': intent.client_secret,
-                    'status': intent.status,
+                    'client_secret': result['client_secret'],
+                    'status': result['intent'].status,
                 })
-            except stripe.error.StripeError as e:
-                return Response(
-                    {'error': str(e)},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            return Response(
+                {'error': result['error']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class ConfirmStripePaymentView(views.APIView):
@@ -46,14 +43,13 @@ class ConfirmStripePaymentView(views.APIView):
 
     def post(self, request):
         payment_intent_id = request.data.get('payment_intent_id')
-        try:
-            intent = stripe.PaymentIntent.confirm(payment_intent_id)
-            return Response({'status': intent.status})
-        except stripe.error.StripeError as e:
-            return Response(
-                {'error': str(e)},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        result = StripeService().confirm_payment(payment_intent_id)
+        if result['success']:
+            return Response({'status': result['status']})
+        return Response(
+            {'error': result['error']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
 class PaymentMethodsView(views.APIView):
     permission_classes = [IsAuthenticated]
@@ -63,6 +59,15 @@ class PaymentMethodsView(views.APIView):
         serializer = PaymentMethodSerializer(methods, many=True)
         return Response(serializer.data)
 
+class GatewayMetricsView(views.APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'gateways': gateway_metrics(),
+            'reconciliation': reconciliation_metrics(),
+        })
+
 class ProcessPaymentView(views.APIView):
     permission_classes = [IsAuthenticated]
 
@@ -118,15 +123,14 @@ class ProcessPaymentView(views.APIView):
             payment.payment_data = {
                 'client_secret': result['client_secret']
             }
-            payment.save()
+            # Not status: a webhook may already have moved the payment on.
+            payment.save(update_fields=['transaction_id', 'payment_data', 'updated_at'])
             return {
                 'client_secret': result['client_secret'],
                 'status': 'processing'
             }
         else:
-            payment.status = 'failed'
-            payment.payment_data = {'error': result['error']}
-            payment.save()
+            transition(payment, 'failed', {'error': result['error']}, source='api')
             raise ValueError(result['error'])
 
     def process_paypal(self, data, payment):
@@ -141,15 +145,13 @@ class ProcessPaymentView(views.APIView):
             payment.payment_data = {
                 'approval_url': result['approval_url']
             }
-            payment.save()
+            payment.save(update_fields=['transaction_id', 'payment_data', 'updated_at'])
             return {
                 'approval_url': result['approval_url'],
                 'status': 'processing'
             }
         else:
-            payment.status = 'failed'
-            payment.payment_data = {'error': result['error']}
-            payment.save()
+            transition(payment, 'failed', {'error': result['error']}, source='api')
             raise ValueError(result['error'])
 
     def process_pix(self, payment):
@@ -161,16 +163,14 @@ class ProcessPaymentView(views.APIView):
                 'qr_code': result['qr_code'],
                 'expiration': result['expiration']
             }
-            payment.save()
+            payment.save(update_fields=['payment_data', 'updated_at'])
             return {
                 'qr_code': result['qr_code'],
                 'expiration': result['expiration'],
                 'status': 'processing'
             }
         else:
-            payment.status = 'failed'
-            payment.payment_data = {'error': result['error']}
-            payment.save()
+            transition(payment, 'failed', {'error': result['error']}, source='api')
             raise ValueError(result['error'])
 
     def process_bank_slip(self, payment):
@@ -182,43 +182,16 @@ class ProcessPaymentView(views.APIView):
                 'barcode': result['barcode'],
                 'pdf_url': result['pdf_url']
             }
-            payment.save()
+            payment.save(update_fields=['payment_data', 'updated_at'])
             return {
                 'barcode': result['barcode'],
                 'pdf_url': result['pdf_url'],
                 'status': 'processing'
             }
         else:
-            payment.status = 'failed'
-            payment.payment_data = {'error': result['error']}
-            payment.save()
+            transition(payment, 'failed', {'error': result['error']}, source='api')
             raise ValueError(result['error'])
 
-class StripeWebhookView(View):
-    def post(self, request):
-        payload = request.body
-        sig_header = request.META['HTTP_STRIPE_SIGNATURE']
-        endpoint_secret = settings.STRIPE_ENDPOINT_SECRET
-
-        try:
-            event = stripe.Webhook.construct_event(
-                payload, sig_header, endpoint_secret
-            )
-        except ValueError as e:
-            # Invalid payload
-            return JsonResponse({'error': str(e)}, status=400)
-        except stripe.error.SignatureVerificationError as e:
-            # Invalid signature
-            return JsonResponse({'error': str(e)}, status=400)
-
-        # Handle the event
-        if event['type'] == 'payment_intent.succeeded':
-            payment_intent = event['data']['object']  # contains a stripe.PaymentIntent
-            # Process the payment here
-        # ... handle other event types
-
-        return JsonResponse({'status': 'success'}, status=200) 
-
 class CreatePayPalOrderView(views.APIView):
     permission_classes = [IsAuthenticated]
 
@@ -250,20 +223,3 @@ class CapturePayPalPaymentView(views.APIView):
             return Response({'message': 'Pagamento capturado com sucesso!'}, status=status.HTTP_200_OK)
         else:
             return Response({'error': result['error']}, status=status.HTTP_400_BAD_REQUEST) 
-
-class PayPalWebhookView(views.APIView):
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request):
-        # Aqui você deve processar o payload do webhook do PayPal
-        payload = request.body
-        # Você pode usar o PayPalService para processar o evento
-        paypal_service = PayPalService()
-        
-        # Exemplo de como processar o evento
-        event = paypal_service.process_webhook(payload)
-
-        if event['success']:
-            return Response({'status': 'success'}, status=status.HTTP_200_OK)
-        else:
-            return Response({'error': event['error']}, status=status.HTTP_400_BAD_REQUEST) 
\ No newline at end of file